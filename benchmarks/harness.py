@@ -0,0 +1,103 @@
+"""
+Small benchmark harness.  A case is a function of a size returning the
+operation to time and the number of items one run of it processes.
+Each case runs at each of its sizes; the best and median of the timed
+repetitions give throughput in items per second and a separate traced run
+gives the peak memory allocated.  Results are saved as json and compared
+against a baseline saved the same way.
+"""
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+cases = {}
+
+
+def case(name, sizes):
+    """
+    Registers a case.  The decorated function takes a size and returns
+    (operation, items), operation taking no arguments.
+    """
+    def register(fn):
+        cases[name] = (fn, sizes)
+        return fn
+    return register
+
+
+def measure(operation, items, repeat=5, min_time=0.05):
+    operation()
+    runs = 1
+    started = time.perf_counter()
+    operation()
+    once = time.perf_counter() - started
+    if once < min_time:
+        runs = max(1, int(min_time / max(once, 1e-9)))
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(runs):
+            operation()
+        timings.append((time.perf_counter() - started) / runs)
+    tracemalloc.start()
+    try:
+        operation()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    median = statistics.median(timings)
+    return dict(items=items, best=min(timings), median=median,
+                throughput=items / median if median else None, peak_memory=peak)
+
+
+def run(selected=None, size_factor=1.0, repeat=5, report=print):
+    """
+    :param selected: names of the cases to run, None for all
+    :param size_factor: multiplier of every case size
+    :return: results by case name and size
+    """
+    results = {}
+    for name, (fn, sizes) in cases.items():
+        if selected and name not in selected:
+            continue
+        for size in sizes:
+            size = max(1, int(size * size_factor))
+            operation, items = fn(size)
+            result = measure(operation, items, repeat)
+            results.setdefault(name, {})[str(size)] = result
+            report(f'{name:32} {size:>8} {result["throughput"]:>14,.0f} items/s '
+                   f'{result["median"] * 1000:>10.3f} ms {result["peak_memory"] / 1024:>10.1f} KiB')
+    return results
+
+
+def save(results, path):
+    data = dict(python=platform.python_version(), machine=platform.machine(),
+                timestamp=time.time(), results=results)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    :param threshold: fraction of throughput lost that counts as a regression
+    :return: (name, size, baseline throughput, throughput, change) of each
+    case and size in both, and the regressions among them
+    """
+    rows, regressions = [], []
+    for name, by_size in results.items():
+        for size, result in by_size.items():
+            before = baseline.get(name, {}).get(size)
+            if not before or not before.get('throughput') or not result['throughput']:
+                continue
+            change = result['throughput'] / before['throughput'] - 1
+            row = (name, size, before['throughput'], result['throughput'], change)
+            rows.append(row)
+            if change < -threshold:
+                regressions.append(row)
+    return rows, regressions
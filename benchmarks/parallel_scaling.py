@@ -0,0 +1,95 @@
+"""
+Speedup of ParallelEvaluator over serial evaluation by number of workers.
+
+    python benchmarks/parallel_scaling.py [--objects 400000] [--workers 1 2 4 8]
+
+Times an or of like and comparison filters, and an and whose filter
+runs over the result of its sources, serially and with an evaluator of
+each number of workers, and prints the speedup of each.  The evaluators
+are made, and their workers started, before timing.  After --writes
+objects are rewritten the next evaluation, which ships those writes to
+the live workers, is timed as well.  Speedup is bounded
+by the cpus available; with a single cpu expect the overhead of
+returning results instead.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import measure
+from uopmeta.memory_dbi import MemoryDBI
+from uopmeta.parallel import ParallelEvaluator
+from uopmeta.schemas import meta
+
+words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'theta', 'kappa']
+
+
+def make_dbi(num_objects, seed=0):
+    rng = random.Random(seed)
+    dbi = MemoryDBI()
+    for n in range(num_objects):
+        dbi.add_object(dict(id=f'{n:09d}_cls{n % 8}', createdAt=rng.random() * 1000,
+                            description=' '.join(rng.choices(words, k=6))))
+    return dbi
+
+
+def rewrite(dbi, num_writes, seed=1):
+    rng = random.Random(seed)
+    for obj_id in rng.sample(sorted(dbi.objects), num_writes):
+        dbi.add_object(dict(dbi.objects[obj_id], createdAt=rng.random() * 1000))
+
+
+def queries():
+    like = lambda pattern: meta.AttributeComponent(
+        attr_name='description', operate='like', value=pattern)
+    compare = lambda op, value: meta.AttributeComponent(
+        attr_name='createdAt', operate=op, value=value)
+    return dict(
+        or_of_filters=meta.OrQuery(components=[
+            like('*gamma*delta*'), like('*kappa kappa*'), compare('<', 50),
+            meta.AndQuery(components=[like('alpha*')], negated=True)]),
+        nested_and=meta.AndQuery(components=[
+            meta.OrQuery(components=[like('*zeta*'), compare('>', 600)]),
+            like('*theta*'), compare('<', 900)]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--objects', type=int, default=400000)
+    parser.add_argument('--workers', type=int, nargs='*',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--writes', type=int, default=1000)
+    args = parser.parse_args(argv)
+    dbi = make_dbi(args.objects)
+    print(f'{args.objects:,} objects, {os.cpu_count()} cpus')
+    for name, query in queries().items():
+        serial = measure(lambda: query.satisfies(dbi), args.objects, args.repeat)['best']
+        print(f'{name:16} serial    {serial * 1000:10.1f} ms')
+        for workers in args.workers:
+            with ParallelEvaluator(dbi, max_workers=workers, chunk_size=args.chunk_size,
+                                   min_parallel=args.chunk_size) as evaluator:
+                if evaluator.satisfies(query) != query.satisfies(dbi):
+                    raise Exception(f'{name} with {workers} workers differs from serial')
+                best = measure(lambda: evaluator.satisfies(query), args.objects,
+                               args.repeat)['best']
+                rewrite(dbi, args.writes)
+                started = time.perf_counter()
+                found = evaluator.satisfies(query)
+                after = time.perf_counter() - started
+                if found != query.satisfies(dbi):
+                    raise Exception(f'{name} with {workers} workers missed writes')
+                restarts = evaluator.restarts
+            print(f'{name:16} {workers:2} workers {best * 1000:10.1f} ms '
+                  f'{serial / best:6.2f}x, after {args.writes} writes '
+                  f'{after * 1000:10.1f} ms, {restarts} restarts')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
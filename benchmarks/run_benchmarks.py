@@ -0,0 +1,229 @@
+"""
+Benchmarks of MetaContext, schema and query hot paths.
+
+    python benchmarks/run_benchmarks.py [--cases NAME ...] [--scale 0.1]
+        [--output results.json] [--baseline baseline.json] [--threshold 0.1]
+
+With --baseline the results are compared against a saved run and the exit
+status is 1 if any case lost more than threshold of its throughput.  Save
+a baseline with --output.
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import harness
+from benchmarks.harness import case
+from uopmeta.schemas import meta
+from uopmeta.schemas.meta import MetaContext, MetaQuery, Schema, Tagged, Related
+
+attribute_kinds = ['string', 'int', 'epoch', 'float', 'email']
+
+
+def make_schema(num_classes, attrs_per_class=4, fanout=4, seed=0):
+    """
+    Schema of num_classes classes in a tree under DescribedComponent.
+    """
+    rng = random.Random(seed)
+    names = []
+    classes = []
+    for n in range(num_classes):
+        superclass = names[(n - 1) // fanout] if n else 'DescribedComponent'
+        name = f'Class{n}'
+        attrs = [meta.app_attr(f'c{n}_a{k}', rng.choice(attribute_kinds))
+                 for k in range(attrs_per_class)]
+        classes.append(meta.app_class(name, superclass, *attrs))
+        names.append(name)
+    return Schema(name=f'bench_{num_classes}', classes=classes)
+
+
+_schemas = {}
+
+
+def schema(num_classes):
+    known = _schemas.get(num_classes)
+    if known is None:
+        known = _schemas[num_classes] = make_schema(num_classes)
+    return known
+
+
+def context(num_classes):
+    return MetaContext.from_schema(schema(num_classes))
+
+
+@case('from_schema', [10, 100, 1000])
+def from_schema(size):
+    a_schema = schema(size)
+    return lambda: MetaContext.from_schema(a_schema), size
+
+
+@case('complete_classes', [10, 100, 1000])
+def complete_classes(size):
+    ctx = context(size)
+    return ctx.complete_classes, size
+
+
+@case('deep_copy', [10, 100, 1000])
+def deep_copy(size):
+    ctx = context(size)
+    return ctx.deep_copy, size
+
+
+@case('subclasses', [100, 1000])
+def subclasses(size):
+    ctx = context(size)
+    root_id = ctx.classes.by_name['DescribedComponent'].id
+
+    def operation():
+        ctx.class_children = {}
+        ctx.subclasses(root_id)
+    return operation, size
+
+
+@case('get_meta_named', [1000, 10000])
+def get_meta_named(size):
+    ctx = context(100)
+    names = [f'Class{n % 100}' for n in range(size)]
+
+    def operation():
+        for name in names:
+            ctx.get_meta_named('classes', name)
+    return operation, size
+
+
+class _ChangeLog:
+    """
+    Collects the changes gather_schema_changes reports, per kind.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __getattr__(self, kind):
+        return self
+
+    def insert(self, data):
+        self.records.append(('insert', data))
+
+    def modify(self, an_id, data):
+        self.records.append(('modify', an_id, data))
+
+    modified = modify
+
+    def delete(self, an_id):
+        self.records.append(('delete', an_id))
+
+
+@case('gather_schema_changes', [10, 100, 1000])
+def gather_schema_changes(size):
+    ctx = context(size)
+    changed = make_schema(size)
+    for n, cls in enumerate(changed.classes):
+        if n % 10 == 0:
+            cls.description = 'changed'
+    return lambda: ctx.gather_schema_changes(changed, _ChangeLog()), size
+
+
+def query_dicts(size, seed=0):
+    rng = random.Random(seed)
+    res = []
+    for n in range(size):
+        res.append(dict(name=f'q{n}', query={'and': {'negated': False, 'components': [
+            {'class': {f'Class{n % 50}': {'include_subclasses': True}}},
+            {'tags': {rng.choice(['all', 'any', 'none']): [f'tag_{n % 7}', f'tag_{n % 11}']}},
+            {'attribute': {'createdAt': {rng.choice(['>', '<', '==']): n}}}]}}))
+    return res
+
+
+@case('meta_query_from_dict_cold', [100, 1000])
+def from_dict_cold(size):
+    dicts = query_dicts(size)
+
+    def operation():
+        meta.query_parse_cache.clear()
+        for d in dicts:
+            MetaQuery.from_dict(d)
+    return operation, size
+
+
+@case('meta_query_from_dict_cached', [100, 1000])
+def from_dict_cached(size):
+    dicts = query_dicts(size)
+
+    def operation():
+        for d in dicts:
+            MetaQuery.from_dict(d)
+    return operation, size
+
+
+@case('attribute_obj_eval', [1000, 100000])
+def attribute_obj_eval(size):
+    rng = random.Random(0)
+    objects = [dict(id=str(n), createdAt=rng.random() * 1000) for n in range(size)]
+    test = meta.AttributeComponent(attr_name='createdAt', operate='>', value=500).obj_eval()
+
+    def operation():
+        for obj in objects:
+            test(obj)
+    return operation, size
+
+
+@case('make_instance', [1000, 10000])
+def make_instance(size):
+    cls = context(10).classes.by_name['Class9']
+
+    def operation():
+        for n in range(size):
+            cls.make_instance(c9_a0=n)
+    return operation, size
+
+
+@case('random_instance', [1000, 10000])
+def random_instance(size):
+    cls = context(10).classes.by_name['Class9']
+
+    def operation():
+        for _ in range(size):
+            cls.random_instance()
+    return operation, size
+
+
+@case('association_hashing', [1000, 100000])
+def association_hashing(size):
+    ids = [f'{n:011d}_cls{n % 10}' for n in range(size)]
+    assocs = [Tagged(assoc_id=f'tag{n % 100}', object_id=i) for n, i in enumerate(ids)]
+    assocs += [Related(assoc_id=f'role{n % 10}', object_id=i, subject_id=ids[n - 1])
+               for n, i in enumerate(ids)]
+    return lambda: set(assocs), len(assocs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', nargs='*', help='cases to run, all by default')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier of case sizes')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='json file to save results to')
+    parser.add_argument('--baseline', help='json file of results to compare to')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='fraction of throughput lost counted as a regression')
+    args = parser.parse_args(argv)
+    unknown = set(args.cases or ()) - set(harness.cases)
+    if unknown:
+        parser.error(f'unknown cases {sorted(unknown)}')
+    results = harness.run(args.cases, args.scale, args.repeat)
+    if args.output:
+        harness.save(results, args.output)
+    if args.baseline:
+        rows, regressions = harness.compare(results, harness.load(args.baseline), args.threshold)
+        for name, size, before, after, change in rows:
+            flag = '  REGRESSION' if change < -args.threshold else ''
+            print(f'{name:32} {size:>8} {before:>14,.0f} -> {after:>14,.0f} {change:+8.1%}{flag}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,4 +10,5 @@ setup(name='uopmeta',
       license='internal',
       packages=packages,
       install_requires = ['pydantic==1.10.7','validators', 'pytest', 'sjautils', 'pydantic'],
+      extras_require = {'datagen': ['numpy']},
       zip_safe=False)
@@ -0,0 +1,86 @@
+import random
+import pytest
+from sjautils.dicts import DictObject
+from uopmeta.schemas import meta, predefined
+from uopmeta.memory_dbi import MemoryDBI
+
+
+def make_populated(seed=7, num_instances=200, num_assocs=300, **dbi_kwargs):
+    """
+    WorkingContext of the pkm schema with random instances and
+    associations persisted to a MemoryDBI.  About a fifth of the objects
+    lack the int attribute createdAt, the rest have a value in 0..100.
+    """
+    random.seed(seed)
+    context = meta.WorkingContext.from_schema(predefined.pkm_schema)
+    dbi = MemoryDBI(context, **dbi_kwargs)
+    context.configure(num_assocs=num_assocs, num_instances=num_instances, persist_to=dbi)
+    for obj in dbi.objects.values():
+        if random.random() < .2:
+            obj.pop('createdAt', None)
+        else:
+            obj['createdAt'] = random.randint(0, 100)
+    return DictObject(
+        context=context, dbi=dbi, anchor=context.instances[0]['id'],
+        tags=[t.name for t in context.tags.by_id.values()],
+        groups=[g.name for g in context.groups.by_id.values()],
+        roles=[r.name for r in context.roles.by_id.values()],
+        classes=['Person', 'File', 'DescribedComponent', 'PersistentObject', 'Phone'])
+
+
+def random_query(data, depth=0, related=True):
+    """
+    Random query component over the data of make_populated.
+    """
+    if depth > 2 or random.random() < .3:
+        r = random.random()
+        if r < .2:
+            return meta.ClassComponent(cls_name=random.choice(data.classes),
+                                       positive=random.random() < .7)
+        if r < .4:
+            return meta.TagsComponent(names=random.sample(data.tags[:5], random.randint(1, 3)),
+                                      application=random.choice(['all', 'any', 'none']))
+        if r < .5:
+            return meta.GroupsComponent(names=random.sample(data.groups[:4], random.randint(1, 2)),
+                                        application=random.choice(['all', 'any', 'none']))
+        if r < .9 or not related:
+            return meta.AttributeComponent(
+                attr_name='createdAt', operate=random.choice(['>', '>=', '<', '<=', '==', '!=']),
+                value=random.randint(0, 100))
+        return meta.RelatedTo(obj_id=data.anchor, negated=random.random() < .5)
+    cls = random.choice([meta.AndQuery, meta.OrQuery])
+    return cls(components=[random_query(data, depth + 1, related)
+                           for _ in range(random.randint(1, 4))],
+               negated=random.random() < .3)
+
+
+def random_write(data):
+    """
+    Random write of an object or association to the dbi of make_populated.
+    """
+    context, dbi = data.context, data.dbi
+    r = random.random()
+    if r < .2:
+        obj = context.random_class().random_instance()
+        obj['createdAt'] = random.randint(0, 100)
+        dbi.add_object(obj)
+    elif r < .3 and dbi.objects:
+        dbi.delete_object(random.choice(list(dbi.objects)))
+    elif r < .5:
+        dbi.add_association(meta.Tagged(assoc_id=context.random_tag().id,
+                                        object_id=random.choice(list(dbi.objects))))
+    elif r < .6 and dbi.tagsets:
+        tag_id = random.choice([t for t, s in dbi.tagsets.items() if s])
+        dbi.remove_association(meta.Tagged(assoc_id=tag_id,
+                                           object_id=random.choice(list(dbi.tagsets[tag_id]))))
+    elif r < .8:
+        dbi.add_association(meta.Related(assoc_id=context.random_role().id, subject_id=data.anchor,
+                                         object_id=random.choice(list(dbi.objects))))
+    else:
+        dbi.add_association(meta.Grouped(assoc_id=context.random_group().id,
+                                         object_id=random.choice(list(dbi.objects))))
+
+
+@pytest.fixture
+def populated():
+    return make_populated()
@@ -0,0 +1,48 @@
+import asyncio
+import time
+from uopmeta.async_eval import async_satisfies
+from uopmeta.memory_dbi import AsyncMemoryDBI
+from uopmeta.schemas import meta
+from conftest import random_query
+
+
+def test_async_matches_satisfies(populated):
+    dbi = populated.dbi
+    remote = AsyncMemoryDBI(dbi, latency=0)
+    for _ in range(60):
+        component = random_query(populated)
+        expected = component.satisfies(dbi)
+        assert asyncio.run(async_satisfies(component, remote)) == expected, component
+        # plain functions work as well as coroutines
+        assert asyncio.run(async_satisfies(component, dbi)) == expected
+
+
+def test_calls_run_concurrently_within_bound(populated):
+    dbi = populated.dbi
+    remote = AsyncMemoryDBI(dbi, latency=.001)
+    component = meta.AndQuery(components=[
+        meta.TagsComponent(names=populated.tags[:6], application='any'),
+        meta.AttributeComponent(attr_name='createdAt', operate='>', value=50)])
+    found = asyncio.run(async_satisfies(component, remote, concurrency=4))
+    assert found == component.satisfies(dbi)
+    assert 1 < remote.max_in_flight <= 4
+
+
+def test_wide_class_costs_one_round_trip(populated):
+    dbi, context = populated.dbi, populated.context
+    for n in range(30):
+        dbi.add_meta(meta.MetaClass(name=f'Sub{n}', superclass='Person', attrs=[], attributes=[]))
+    context.complete()
+    for n in range(30):
+        dbi.add_object(context.classes.by_name[f'Sub{n}'].random_instance())
+    latency = .2
+    remote = AsyncMemoryDBI(dbi, latency=latency)
+    component = meta.ClassComponent(cls_name='Person')
+    assert len(component.class_ids(context)) > 30
+    started = time.perf_counter()
+    found = asyncio.run(async_satisfies(component, remote))
+    elapsed = time.perf_counter() - started
+    assert found == component.satisfies(dbi)
+    assert remote.calls == len(component.class_ids(context))
+    assert remote.max_in_flight == remote.calls
+    assert elapsed < 1.5 * latency
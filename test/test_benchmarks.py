@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+from benchmarks import harness
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_compare_flags_lost_throughput():
+    baseline = dict(a={'10': dict(throughput=100.0)}, b={'10': dict(throughput=100.0)})
+    results = dict(a={'10': dict(throughput=95.0)}, b={'10': dict(throughput=50.0)},
+                   c={'10': dict(throughput=10.0)})
+    rows, regressions = harness.compare(results, baseline, threshold=.1)
+    assert [r[0] for r in rows] == ['a', 'b']
+    assert [r[0] for r in regressions] == ['b']
+
+
+def test_measure_reports_throughput():
+    result = harness.measure(lambda: sum(range(1000)), 1000, repeat=2, min_time=.001)
+    assert result['best'] <= result['median']
+    assert result['throughput'] == 1000 / result['median']
+    assert result['peak_memory'] >= 0
+
+
+def test_suite_runs_and_compares_to_baseline(tmp_path):
+    output = str(tmp_path / 'results.json')
+    script = os.path.join(root, 'benchmarks', 'run_benchmarks.py')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+    def run(*args):
+        return subprocess.run([sys.executable, script, '--scale', '.01', '--repeat', '1', *args],
+                              env=env, capture_output=True, text=True, timeout=300)
+
+    done = run('--output', output)
+    assert done.returncode == 0, done.stderr
+    saved = harness.load(output)
+    assert 'from_schema' in saved and 'subclasses' in saved
+    assert all(r['throughput'] for by_size in saved.values() for r in by_size.values())
+    with open(output) as f:
+        data = json.load(f)
+    for by_size in data['results'].values():
+        for size in by_size:
+            by_size[size]['throughput'] *= 100
+    with open(output, 'w') as f:
+        json.dump(data, f)
+    done = run('--cases', 'from_schema', '--baseline', output)
+    assert done.returncode == 1 and 'REGRESSION' in done.stdout
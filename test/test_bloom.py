@@ -0,0 +1,61 @@
+import random
+from uopmeta.bloom import CountingBloomFilter
+from uopmeta.schemas import meta
+
+
+def test_filter_has_no_false_negatives():
+    bloom = CountingBloomFilter(1000, error_rate=.01)
+    for n in range(1000):
+        bloom.add(n)
+    assert all(n in bloom for n in range(1000))
+    false_positives = sum(n in bloom for n in range(1000, 21000)) / 20000
+    assert false_positives < .03
+    for n in range(500):
+        bloom.remove(n)
+    assert len(bloom) == 500 and all(n in bloom for n in range(500, 1000))
+
+
+def members(dbi, component):
+    """
+    Ids satisfying a tags or groups component, from the association sets.
+    """
+    context = dbi.meta_context
+    assoc_sets = dbi.tagsets if component.assoc_kind == 'tagged' else dbi.groupsets
+    name_sets = [set().union(*[assoc_sets.get(i, set()) for i in ids])
+                 for ids in component.named_ids(context)]
+    everything = set(dbi.objects)
+    if component.application == 'all':
+        return set.intersection(everything, *name_sets)
+    found = set().union(*name_sets)
+    return everything - found if component.application == 'none' else found
+
+
+def test_probed_candidates_match_association_sets(populated):
+    dbi, context = populated.dbi, populated.context
+    ids = sorted(dbi.objects)
+    tag = context.tags.by_name[populated.tags[0]]
+    for obj_id in ids[:150]:
+        dbi.add_association(meta.Tagged(assoc_id=tag.id, object_id=obj_id))
+    verified = []
+    assoc_members = dbi.assoc_members
+    dbi.assoc_members = lambda kind, assoc_id, obj_ids: \
+        verified.append(len(obj_ids)) or assoc_members(kind, assoc_id, obj_ids)
+    probed = 0
+    for _ in range(200):
+        candidates = set(random.sample(ids, random.randint(0, 30)))
+        if random.random() < .5:
+            component = meta.TagsComponent(names=random.sample(populated.tags, random.randint(1, 3)),
+                                           application=random.choice(['all', 'any', 'none']))
+        else:
+            component = meta.GroupsComponent(
+                names=random.sample(populated.groups, random.randint(1, 2)),
+                application=random.choice(['all', 'any', 'none']))
+        assert component.satisfies(dbi, candidates) == members(dbi, component) & candidates
+        probed += len(candidates)
+    assert verified and sum(verified) < probed
+    # filters follow removals
+    for assoc in list(populated.context.tagged)[:100]:
+        dbi.remove_association(assoc)
+    for (kind, assoc_id), bloom in dbi.assoc_filters.items():
+        assoc_set = (dbi.tagsets if kind == 'tagged' else dbi.groupsets).get(assoc_id, set())
+        assert len(bloom) == len(assoc_set) and all(i in bloom for i in assoc_set)
@@ -0,0 +1,92 @@
+import random
+import pytest
+from uopmeta import cascade
+from uopmeta.cascade import cascade_delete, AssociationIndex, assoc_key
+from uopmeta.oid import oid_class
+
+
+def associations(dbi):
+    res = set()
+    for kind, assoc_sets in (('tagged', dbi.tagsets), ('grouped', dbi.groupsets)):
+        for assoc_id, obj_ids in assoc_sets.items():
+            res |= {(kind, assoc_id, obj_id, None) for obj_id in obj_ids}
+    for subject_id, role_id, object_id in dbi.relations.edges():
+        res.add(('related', role_id, object_id, subject_id))
+    return res
+
+
+def nodes(dbi):
+    res = {}
+    for key in associations(dbi):
+        for node in key[2:]:
+            if node is not None:
+                res.setdefault(node, set()).add(key)
+    return res
+
+
+def surviving(assocs, deleted_objects, deleted_classes):
+    def deleted(node):
+        return node in deleted_objects or oid_class(node) in deleted_classes
+    return {key for key in assocs
+            if not any(deleted(node) for node in key[2:] if node is not None)}
+
+
+def check_cascade(dbi, with_index, seed=4):
+    if with_index:
+        dbi.enable_assoc_index()
+    listeners = list(dbi.listeners)
+    rng = random.Random(seed)
+    deleted_objects = set(rng.sample(sorted(dbi.objects), 20))
+    deleted_classes = {oid_class(rng.choice(sorted(dbi.objects)))}
+    expected = surviving(associations(dbi), deleted_objects, deleted_classes)
+    counts = cascade_delete(dbi, deleted_objects, deleted_classes, batch_size=7)
+    assert associations(dbi) == expected
+    assert counts['batches'] > 0
+    if with_index:
+        assert dbi.listeners == listeners
+    return counts
+
+
+def test_cascade_attaches_index_once(populated, monkeypatch):
+    dbi = populated.dbi
+    check_cascade(dbi, with_index=False)
+    index = dbi.assoc_index
+    assert index is not None and index.on_change in dbi.listeners
+    monkeypatch.setattr(AssociationIndex, 'index_dbi',
+                        lambda self, dbi: pytest.fail('index rebuilt'))
+    check_cascade(dbi, with_index=False, seed=5)
+    assert dbi.assoc_index is index
+    assert dict(index.by_node) == nodes(dbi)
+
+
+def test_context_keeps_its_index(populated, monkeypatch):
+    context = populated.context
+    context.persist_to = None
+    index = context.association_index()
+    for _ in range(5):
+        context.relate(context.random_related())
+    for assoc in context.related[:3]:
+        context.unrelate(assoc)
+    built = []
+    from_context = AssociationIndex.from_context
+    monkeypatch.setattr(AssociationIndex, 'from_context',
+                        classmethod(lambda cls, c: built.append(c) or from_context(c)))
+    rng = random.Random(4)
+    for _ in range(2):
+        deleted = set(rng.sample([o['id'] for o in context.instances], 10))
+        keys = {assoc_key(a) for kind in cascade.assoc_kinds for a in getattr(context, kind)}
+        expected = {k for k in keys if not ({k[2], k[3]} & deleted)}
+        cascade_delete(context, deleted)
+        assert {assoc_key(a) for kind in cascade.assoc_kinds
+                for a in getattr(context, kind)} == expected
+        assert context.association_index() is index
+    assert built == []
+    assert dict(index.by_node) == dict(from_context(context).by_node)
+
+
+def test_cascade_with_attached_index(populated):
+    dbi = populated.dbi
+    check_cascade(dbi, with_index=True)
+    index = dbi.assoc_index
+    assert index is not None
+    assert dict(index.by_node) == nodes(dbi)
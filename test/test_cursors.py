@@ -0,0 +1,46 @@
+import pytest
+from uopmeta.indexes import sort_key
+from uopmeta.schemas import meta
+from conftest import random_query
+
+
+def all_pages(query, dbi, size, **kwargs):
+    res, cursor = [], None
+    while True:
+        ids, cursor = query.page(dbi, size=size, cursor=cursor, **kwargs)
+        res.extend(ids)
+        if cursor is None:
+            return res
+
+
+def by_attribute(ids, dbi, attr_name):
+    rows = [(sort_key(dbi.get_object(i)[attr_name]), i) for i in ids
+            if attr_name in dbi.get_object(i)]
+    return [i for _, i in sorted(rows)]
+
+
+def test_pages_cover_result_in_order(populated):
+    dbi = populated.dbi
+    queries = [meta.MetaQuery(name=f'q{n}', query=random_query(populated)) for n in range(30)]
+    for size in (1, 7, 50):
+        for query in queries:
+            found = query.query.satisfies(dbi)
+            assert all_pages(query, dbi, size) == sorted(found)
+            assert all_pages(query, dbi, size, sort_attr='createdAt') == \
+                by_attribute(found, dbi, 'createdAt')
+    dbi.index_values('createdAt')
+    for query in queries:
+        assert all_pages(query, dbi, 7, sort_attr='createdAt') == \
+            by_attribute(query.query.satisfies(dbi), dbi, 'createdAt')
+
+
+def test_cursor_belongs_to_its_query(populated):
+    dbi = populated.dbi
+    query = meta.MetaQuery(name='all', query=meta.ClassComponent(cls_name='PersistentObject'))
+    other = meta.MetaQuery(name='people', query=meta.ClassComponent(cls_name='Person'))
+    ids, cursor = query.page(dbi, size=5)
+    assert len(ids) == 5 and cursor
+    with pytest.raises(Exception):
+        other.page(dbi, size=5, cursor=cursor)
+    with pytest.raises(Exception):
+        query.page(dbi, size=5, cursor=cursor, sort_attr='createdAt')
@@ -0,0 +1,66 @@
+import json
+import os
+from collections import Counter
+import pytest
+from uopmeta.memory_dbi import MemoryDBI
+from uopmeta.oid import oid_class
+from uopmeta.schemas import meta, predefined
+
+np = pytest.importorskip('numpy')
+from uopmeta.datagen import DatasetGenerator, encode_ids, _alphabet, _id_digits
+
+
+def encode_id(number):
+    digits = []
+    for _ in range(_id_digits):
+        number, digit = divmod(number, len(_alphabet))
+        digits.append(_alphabet[digit])
+    return ''.join(reversed(digits))
+
+
+def generator(**kwargs):
+    sizes = dict(seed=3, instances=600, tagged=2000, grouped=800, related=2000, chunk_size=250)
+    return DatasetGenerator(predefined.pkm_schema, **dict(sizes, **kwargs))
+
+
+def records(chunks):
+    return [record for chunk in chunks for record in chunk]
+
+
+def test_encode_ids_matches_scalar_encoding():
+    numbers = [0, 1, 61, 62, 2 ** 40 + 7, 2 ** 63 - 1, 2 ** 64 - 1]
+    numbers += np.random.default_rng(1).integers(0, 2 ** 63, 100, dtype=np.uint64).tolist()
+    assert encode_ids(numbers) == [encode_id(n) for n in numbers]
+
+
+def test_same_seed_gives_same_dataset():
+    first, second, other = generator(), generator(), generator(seed=4)
+    for name in ('objects', 'tagged', 'grouped', 'related'):
+        assert records(getattr(first, name)()) == records(getattr(second, name)())
+    assert records(first.objects()) != records(other.objects())
+
+
+def test_loaded_dataset_has_requested_shape(tmp_path):
+    gen = generator()
+    dbi = gen.load(MemoryDBI(gen.context))
+    assert len(dbi.objects) == 600
+    context = gen.context
+    concrete = [c for c in context.classes.by_id.values() if not c.is_abstract]
+    assert {oid_class(i) for i in dbi.objects} == {c.id for c in concrete}
+    tagged = records(gen.tagged())
+    assert len(tagged) == 2000 and all(r['object_id'] in dbi.objects for r in tagged)
+    assert sum(map(len, dbi.tagsets.values())) == len({(r['assoc_id'], r['object_id'])
+                                                       for r in tagged})
+    popularity = Counter(r['assoc_id'] for r in tagged).most_common()
+    assert popularity[0][1] > 5 * popularity[len(popularity) // 2][1]
+    tag = context.tags.by_name['tag_0']
+    query = meta.TagsComponent(names=['tag_0'])
+    assert query.satisfies(dbi) == {r['object_id'] for r in tagged if r['assoc_id'] == tag.id}
+
+    counts = gen.write(str(tmp_path))
+    for name, count in counts.items():
+        with open(os.path.join(tmp_path, name)) as f:
+            assert sum(1 for _ in f) == count
+    with open(os.path.join(tmp_path, 'metas.json')) as f:
+        written = meta.MetaContext.from_data(json.load(f))
+    assert set(written.tags.by_id) == set(context.tags.by_id)
@@ -0,0 +1,45 @@
+import json
+from uopmeta.explain import explain
+from uopmeta.schemas import meta
+from conftest import random_query
+
+
+def nodes(node):
+    yield node
+    for child in node.children:
+        yield from nodes(child)
+
+
+def test_analyze_counts_match_evaluation(populated):
+    dbi = populated.dbi
+    total = len(dbi.all_object_ids())
+    for _ in range(40):
+        component = random_query(populated)
+        plan = explain(component, dbi, analyze=True, memory=False)
+        assert plan.output_count == len(component.satisfies(dbi)), component
+        assert plan.input_count == total and not plan.estimated
+        for node in nodes(plan):
+            assert node.seconds is not None and node.output_count is not None
+            if node.component.kind == 'or' and node.input_count == total:
+                for child in node.children:
+                    assert child.output_count == len(child.component.satisfies(dbi))
+        json.dumps(plan.to_dict())
+        assert str(plan)
+
+
+def test_dry_run_reads_no_objects(populated):
+    dbi = populated.dbi
+    component = meta.AndQuery(components=[
+        meta.ClassComponent(cls_name='Person'),
+        meta.AttributeComponent(attr_name='createdAt', operate='<', value=50)])
+    read = []
+    get_object = dbi.get_object
+    dbi.get_object = lambda obj_id: read.append(obj_id) or get_object(obj_id)
+    plan = explain(component, dbi)
+    assert plan.estimated and not read
+    assert [c.strategy for c in plan.children] == ['class instance ids', 'scan']
+    dbi.index_values('createdAt')
+    plan = explain(component, dbi, analyze=True)
+    assert plan.children[1].strategy == 'value index'
+    assert plan.memory_peak is not None
+    assert plan.output_count == len(component.satisfies(dbi))
@@ -0,0 +1,59 @@
+import pytest
+from uopmeta import instrument
+from uopmeta.schemas import predefined
+from uopmeta.schemas.meta import MetaContext, AttributeComponent
+from conftest import random_query
+
+
+@pytest.fixture
+def instrumented():
+    instrument.reset()
+    instrument.enable()
+    try:
+        yield instrument
+    finally:
+        instrument.disable()
+        instrument.reset()
+
+
+def test_instrumented_results_match(populated, instrumented):
+    dbi = populated.dbi
+    queries = [random_query(populated) for _ in range(30)]
+    instrumented.disable()
+    expected = [q.satisfies(dbi) for q in queries]
+    instrumented.enable()
+    assert [q.satisfies(dbi) for q in queries] == expected
+    timers = instrumented.snapshot()['timers']
+    evaluated = sum(t['count'] for name, t in timers.items() if name.startswith('query.'))
+    assert evaluated >= len(queries)
+    for timer in timers.values():
+        assert sum(timer['buckets'].values()) == timer['count']
+
+
+def test_disable_restores_methods(instrumented):
+    instrumented.disable()
+    original = MetaContext.__dict__['from_schema']
+    instrumented.enable()
+    assert MetaContext.__dict__['from_schema'] is not original
+    MetaContext.from_schema(predefined.pkm_schema)
+    complete = instrumented.snapshot()['timers']['context.complete']['count']
+    assert complete
+    instrumented.disable()
+    assert MetaContext.__dict__['from_schema'] is original
+    MetaContext.from_schema(predefined.pkm_schema)
+    assert instrumented.snapshot()['timers']['context.complete']['count'] == complete
+
+
+def test_errors_and_exposition(populated, instrumented):
+    with pytest.raises(ZeroDivisionError):
+        with instrumented.timed('custom'):
+            1 / 0
+    instrumented.count('custom.events', 3)
+    snapshot = instrumented.snapshot()
+    assert snapshot['timers']['custom']['errors'] == 1
+    assert snapshot['counters']['custom.events'] == 3
+    AttributeComponent(attr_name='createdAt', operate='>', value=10).satisfies(populated.dbi)
+    text = instrumented.prometheus_text()
+    assert 'uopmeta_operation_seconds_count{operation="query.AttributeComponent"} 1' in text
+    assert 'uopmeta_operation_errors_total{operation="custom"} 1' in text
+    assert 'uopmeta_events_total{event="custom.events"} 3' in text
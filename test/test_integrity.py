@@ -0,0 +1,113 @@
+import random
+from uopmeta.schemas import meta
+from uopmeta.cascade import assoc_key
+from uopmeta.integrity import IntegrityScanner, position
+
+
+def plain_orphans(dbi):
+    context = dbi.meta_context
+    groups, res = context.groups.by_id, set()
+    for tag_id, obj_ids in dbi.tagsets.items():
+        for obj_id in obj_ids:
+            if tag_id not in context.tags.by_id or obj_id not in dbi.objects:
+                res.add(('tagged', tag_id, obj_id, None))
+    for group_id, obj_ids in dbi.groupsets.items():
+        for obj_id in obj_ids:
+            if group_id not in groups or (obj_id not in dbi.objects and obj_id not in groups):
+                res.add(('grouped', group_id, obj_id, None))
+    for subject_id, role_id, obj_id in dbi.relations.edges():
+        if role_id not in context.roles.by_id or obj_id not in dbi.objects or \
+                subject_id not in dbi.objects:
+            res.add(('related', role_id, obj_id, subject_id))
+    return res
+
+
+def make_orphans(data):
+    context, dbi = data.context, data.dbi
+    groups = list(context.groups.by_id.values())
+    # a group holding a group is not an orphan, one holding a removed group is
+    dbi.add_association(meta.Grouped(assoc_id=groups[0].id, object_id=groups[1].id))
+    dbi.add_association(meta.Grouped(assoc_id=groups[0].id, object_id=groups[2].id))
+    context.remove(groups[2])
+    # only groups hold groups, a tagged group id is an orphan
+    tags = list(context.tags.by_id.values())
+    dbi.add_association(meta.Tagged(assoc_id=tags[0].id, object_id=groups[1].id))
+    for obj_id in random.sample(list(dbi.objects), 20):
+        dbi.delete_object(obj_id)
+    context.remove(tags[1])
+    return groups
+
+
+def test_scan_finds_plain_orphans_across_checkpoints(populated, tmp_path):
+    groups = make_orphans(populated)
+    dbi = populated.dbi
+    expected = plain_orphans(dbi)
+    assert ('grouped', groups[0].id, groups[2].id, None) in expected
+    assert ('grouped', groups[0].id, groups[1].id, None) not in expected
+    assert any(key[0] == 'tagged' and key[2] == groups[1].id for key in expected)
+    path = str(tmp_path / 'scan.json')
+    slept = []
+    first = IntegrityScanner(dbi, chunk_size=37, budget=.5, checkpoint_path=path,
+                             sleep=slept.append)
+    first.run(max_chunks=4)
+    assert slept and not first.done
+    rest = IntegrityScanner(dbi, chunk_size=37, checkpoint_path=path, max_reported=10 ** 6)
+    report = rest.run()
+    assert {key for key, _ in first.reported + rest.reported} == expected
+    assert report['scanned'] == sum(map(len, dbi.tagsets.values())) + \
+        sum(map(len, dbi.groupsets.values())) + len(dbi.relations)
+
+
+def test_repair_removes_orphans(populated):
+    make_orphans(populated)
+    dbi = populated.dbi
+    expected = plain_orphans(dbi)
+    report = IntegrityScanner(dbi, chunk_size=50, repair=True).run()
+    assert report['repaired'] == len(expected)
+    assert not plain_orphans(dbi)
+
+
+def test_context_scan(populated):
+    context = populated.context
+    context.persist_to = None
+    context.instances = context.instances[10:]
+    report = IntegrityScanner(context, chunk_size=40, repair=True).run()
+    assert report['repaired']
+    assert IntegrityScanner(context).run()['orphans'] == {}
+
+
+def context_keys(context):
+    return {assoc_key(a) for kind in ('tagged', 'grouped', 'related')
+            for a in getattr(context, kind)}
+
+
+def test_context_scan_resumes_in_order_and_batches_repairs(populated, tmp_path, monkeypatch):
+    context = populated.context
+    context.persist_to = None
+    context.instances = context.instances[10:]
+    live, groups = {o['id'] for o in context.instances}, context.groups.by_id
+
+    def survives(key):
+        kind, _, object_id, subject_id = key
+        return (object_id in live or (kind == 'grouped' and object_id in groups)) and \
+            subject_id in live | {None}
+    order = sorted(context_keys(context), key=position)
+    expected = set(filter(survives, order))
+    checked, passes = [], []
+    check = IntegrityScanner.check
+    monkeypatch.setattr(IntegrityScanner, 'check',
+                        lambda self, keys: checked.extend(keys) or check(self, keys))
+    remove = meta.WorkingContext.remove_associations
+    monkeypatch.setattr(meta.WorkingContext, 'remove_associations',
+                        lambda self, keys: passes.append(keys) or remove(self, keys))
+    path = str(tmp_path / 'scan.json')
+    first = IntegrityScanner(context, chunk_size=7, repair=True, checkpoint_path=path)
+    for _ in range(5):
+        first.scan_chunk()
+    report = IntegrityScanner(context, chunk_size=7, repair=True, checkpoint_path=path).run()
+    assert checked == order
+    assert report['scanned'] == len(order)
+    assert report['repaired'] == len(order) - len(expected) and not report['pending']
+    assert context_keys(context) == expected
+    # removals are batched, each pass over the lists takes an eighth of them or more
+    assert 0 < len(passes) <= 9
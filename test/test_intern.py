@@ -0,0 +1,64 @@
+import random
+from uopmeta.memory_dbi import MemoryDBI
+from uopmeta.schemas import meta
+from conftest import make_populated, random_query, random_write
+
+
+def test_interned_dbi_gives_same_results():
+    data = make_populated()
+    interned = MemoryDBI.from_context(data.context, intern_ids=True)
+    for _ in range(100):
+        query = random_query(data)
+        assert query.satisfies(interned) == query.satisfies(data.dbi)
+
+
+def test_ids_are_shared():
+    data = make_populated()
+    dbi = MemoryDBI(data.context, intern_ids=True)
+    obj = dict(data.context.random_class().random_instance())
+    obj['id'] = ''.join(list(obj['id']))
+    dbi.add_object(obj)
+    tag_id = data.context.random_tag().id
+    dbi.add_association(meta.Tagged(assoc_id=tag_id, object_id=''.join(list(obj['id']))))
+    stored = next(iter(dbi.tagsets[tag_id]))
+    assert stored is obj['id'] and next(k for k in dbi.objects) is stored
+    tag = data.context.tags.by_id[tag_id]
+    assert next(k for k in dbi.tagsets) is tag.id
+
+
+def replay(dbi):
+    def on_change(change):
+        record, insert = change.record, change.op == 'insert'
+        if change.kind == 'objects':
+            dbi.add_object(dict(record)) if insert else dbi.delete_object(record['id'])
+        elif change.kind in ('tagged', 'grouped', 'related'):
+            (dbi.add_association if insert else dbi.remove_association)(record)
+    return on_change
+
+
+def test_surrogate_structures_follow_writes():
+    data = make_populated()
+    plain = data.dbi
+    interned = MemoryDBI.from_context(data.context, intern_ids=True)
+    plain.add_listener(replay(interned))
+    for _ in range(300):
+        random_write(data)
+    for structure in (interned.class_ids, interned.tagsets, interned.groupsets):
+        assert all(type(k) is int for k in structure.data)
+        assert all(type(i) is int for ids in structure.data.values() for i in ids.surrogates)
+    assert all(type(k) is int for k in interned.relations.surrogate_forward)
+    assert len(interned.objects.slots) <= len(interned.interner)
+    assert dict(interned.objects) == plain.objects
+    for name in ('class_ids', 'tagsets', 'groupsets'):
+        assert {k: set(v) for k, v in getattr(interned, name).items() if v} == \
+            {k: v for k, v in getattr(plain, name).items() if v}, name
+    assert set(interned.relations.edges()) == set(plain.relations.edges())
+    for tag_id, members in plain.tagsets.items():
+        bloom = interned.assoc_filter('tagged', tag_id)
+        assert all(interned.bloom_key(i) in bloom for i in members)
+    ids = sorted(plain.objects)
+    for _ in range(100):
+        query = random_query(data)
+        assert query.satisfies(interned) == query.satisfies(plain), query
+        subset = set(random.sample(ids, 40))
+        assert query.satisfies(interned, subset) == query.satisfies(plain, subset), query
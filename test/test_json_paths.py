@@ -0,0 +1,101 @@
+import json
+import random
+from uopmeta.attr_info import attribute_types, JsonType, json_entry_size
+from uopmeta.lru import LRUCache
+from uopmeta.memory import deep_sizeof
+from uopmeta.memory_dbi import MemoryDBI
+from uopmeta.schemas import meta
+
+operations = ['==', '!=', '<', '<=', '>', '>=']
+
+
+def make_dbi(seed=6, num_objects=400):
+    """
+    Objects whose json attribute settings holds, in most, a number at
+    limits.count and a list at tags, and in some is missing, not json or
+    without that path.
+    """
+    rng = random.Random(seed)
+    dbi = MemoryDBI()
+    for n in range(num_objects):
+        obj = dict(id=f'obj{n}_cls{n % 4}')
+        r = rng.random()
+        if r < .7:
+            obj['settings'] = json.dumps(dict(
+                limits=dict(count=rng.randint(0, 20), rate=rng.random()),
+                tags=rng.sample(['a', 'b', 'c', 'd'], 2)))
+        elif r < .8:
+            obj['settings'] = json.dumps(dict(limits={}))
+        elif r < .9:
+            obj['settings'] = 'not json'
+        dbi.add_object(obj)
+    return dbi
+
+
+def scan(component, dbi, obj_ids=None):
+    test = component.obj_eval()
+    res = set()
+    for obj_id in dbi.all_object_ids() if obj_ids is None else obj_ids:
+        try:
+            if test(dbi.get_object(obj_id)):
+                res.add(obj_id)
+        except KeyError:
+            pass
+    return res
+
+
+def test_path_index_matches_scan():
+    dbi = make_dbi()
+    expected = {}
+    components = [meta.AttributeComponent(attr_name=attr_name, operate=operate, value=value)
+                  for operate in operations
+                  for attr_name, value in (('settings.limits.count', 7),
+                                           ('settings.limits.rate', .5),
+                                           ('settings.tags.0', 'b'))]
+    for component in components:
+        expected[component.attr_name, component.operate] = scan(component, dbi)
+        assert component.satisfies(dbi) == expected[component.attr_name, component.operate]
+    assert expected['settings.limits.count', '<']
+    for attr_name in ('settings.limits.count', 'settings.limits.rate', 'settings.tags.0'):
+        dbi.index_values(attr_name)
+    subset = set(random.Random(1).sample(sorted(dbi.objects), 100))
+    for component in components:
+        assert component.satisfies(dbi) == expected[component.attr_name, component.operate], \
+            (component.attr_name, component.operate)
+        assert component.satisfies(dbi, subset) == scan(component, dbi, subset)
+
+
+def test_path_index_follows_writes():
+    dbi = make_dbi()
+    dbi.index_values('settings.limits.count')
+    rng = random.Random(2)
+    for obj_id in rng.sample(sorted(dbi.objects), 80):
+        obj = dict(dbi.get_object(obj_id))
+        obj['settings'] = json.dumps(dict(limits=dict(count=rng.randint(0, 20))))
+        dbi.add_object(obj)
+    for obj_id in rng.sample(sorted(dbi.objects), 40):
+        dbi.delete_object(obj_id)
+    for operate in operations:
+        component = meta.AttributeComponent(
+            attr_name='settings.limits.count', operate=operate, value=11)
+        assert component.satisfies(dbi) == scan(component, dbi), operate
+
+
+def test_json_values_are_parsed_once():
+    json_type = attribute_types['json']
+    text = json.dumps(dict(limits=dict(count=3)))
+    assert json_type.parse(text) is json_type.parse(''.join(list(text)))
+    assert meta.attribute_value(dict(settings=text), 'settings.limits.count') == 3
+
+
+def test_json_cache_counts_parsed_values():
+    text = json.dumps(dict(values=list(range(1000))))
+    parsed = json.loads(text)
+    assert json_entry_size(text, parsed) > len(text) + deep_sizeof(parsed) / 2
+    cache = LRUCache(maxsize=None, max_bytes=5 * json_entry_size(text, parsed),
+                     sizeof=json_entry_size)
+    json_type = JsonType(cache)
+    for n in range(20):
+        json_type.parse(json.dumps(dict(values=list(range(n, n + 1000)))))
+    assert len(cache.entries) <= 5
+    assert cache.total_size <= cache.max_bytes
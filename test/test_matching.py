@@ -0,0 +1,70 @@
+import random
+from uopmeta.memory_dbi import MemoryDBI
+from uopmeta.schemas import meta
+
+words = ['alpha', 'beta', 'gamma', 'delta', 'al', 'ph']
+patterns = ['*', 'alpha*', '*beta', '*gam*', '*al*ph*', 'al', 'beta gamma', '*a*', '*zz*']
+
+
+def make_dbi(seed=5, num_objects=500):
+    """
+    Objects whose description is a string, a number, None or missing.
+    """
+    rng = random.Random(seed)
+    dbi = MemoryDBI()
+    for n in range(num_objects):
+        obj = dict(id=f'obj{n}_cls{n % 3}')
+        r = rng.random()
+        if r < .6:
+            obj['description'] = ' '.join(rng.choices(words, k=rng.randint(1, 3)))
+        elif r < .75:
+            obj['description'] = rng.randint(0, 10)
+        elif r < .85:
+            obj['description'] = None
+        dbi.add_object(obj)
+    return dbi
+
+
+def scan(component, dbi, obj_ids=None):
+    test = component.obj_eval()
+    ids = dbi.all_object_ids() if obj_ids is None else obj_ids
+    res = set()
+    for obj_id in ids:
+        obj = dbi.get_object(obj_id)
+        if obj and 'description' in obj and test(obj):
+            res.add(obj_id)
+    return res
+
+
+def test_indexed_like_matches_scan():
+    dbi = make_dbi()
+    dbi.index_trigrams('description')
+    rng = random.Random(1)
+    subset = set(rng.sample(sorted(dbi.objects), 150))
+    for operate in ('like', 'not_like'):
+        for pattern in patterns:
+            component = meta.AttributeComponent(
+                attr_name='description', operate=operate, value=pattern)
+            assert component.satisfies(dbi) == scan(component, dbi), (operate, pattern)
+            assert component.satisfies(dbi, subset) == scan(component, dbi, subset), \
+                (operate, pattern)
+
+
+def test_index_follows_writes():
+    dbi = make_dbi()
+    index = dbi.index_trigrams('description')
+    rng = random.Random(2)
+    for obj_id in rng.sample(sorted(dbi.objects), 100):
+        obj = dict(dbi.get_object(obj_id))
+        if rng.random() < .5:
+            obj['description'] = rng.choice(['alpha beta', 7, None])
+        else:
+            obj.pop('description', None)
+        dbi.add_object(obj)
+    for obj_id in rng.sample(sorted(dbi.objects), 50):
+        dbi.delete_object(obj_id)
+    assert set(index.ids()) == {i for i, o in dbi.objects.items() if 'description' in o}
+    for pattern in patterns:
+        component = meta.AttributeComponent(
+            attr_name='description', operate='not_like', value=pattern)
+        assert component.satisfies(dbi) == scan(component, dbi), pattern
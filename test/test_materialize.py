@@ -0,0 +1,30 @@
+from uopmeta.schemas import meta
+from conftest import random_query, random_write
+
+
+def test_materialized_queries_follow_writes(populated):
+    dbi = populated.dbi
+    queries = [meta.MetaQuery(name=f'q{n}', query=random_query(populated)) for n in range(25)]
+    materialized = [q.materialize(dbi) for q in queries]
+    writes = 200
+    for _ in range(writes):
+        random_write(populated)
+        for query, view in zip(queries, materialized):
+            expected = {i for i in query.query.satisfies(dbi) if i in dbi.objects}
+            assert view.ids() == expected, query.query
+    # writes are applied by delta rather than by recomputing
+    assert sum(view.refreshes for view in materialized) < len(materialized) * writes / 2
+    for view in materialized:
+        view.close()
+    assert not any(view.on_change in dbi.listeners for view in materialized)
+
+
+def test_tag_query_is_maintained_incrementally(populated):
+    dbi = populated.dbi
+    query = meta.MetaQuery(name='tagged', query=meta.TagsComponent(
+        names=populated.tags[:3], application='any'))
+    view = query.materialize(dbi)
+    for _ in range(100):
+        random_write(populated)
+        assert view.ids() == {i for i in query.query.satisfies(dbi) if i in dbi.objects}
+    assert view.refreshes == 1
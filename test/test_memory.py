@@ -0,0 +1,54 @@
+import sys
+from uopmeta.memory import deep_sizeof, memory_report, format_report
+from uopmeta.oid import oid_class
+
+
+def plain_sizeof(obj, seen=None):
+    """
+    sys.getsizeof summed over containers of str and int, each object once.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(plain_sizeof(k, seen) + plain_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(plain_sizeof(item, seen) for item in obj)
+    return size
+
+
+def test_deep_sizeof_matches_plain_walk():
+    shared = [f'value{n}' * 3 for n in range(50)]
+    data = dict(a=shared, b=[shared, {n: (f'k{n}', n * 1000) for n in range(100)}],
+                c={f'x{n}' for n in range(30)})
+    assert deep_sizeof(data) == plain_sizeof(data)
+    assert deep_sizeof(data, exclude=[shared]) == \
+        plain_sizeof(data) - plain_sizeof(shared)
+
+
+def test_report_sections(populated):
+    context = populated.context
+    report = memory_report(context)
+    for kind in ('classes', 'attributes', 'tags', 'groups', 'roles'):
+        section = report['kinds'][kind]
+        assert section['count'] == len(getattr(context, kind).by_id)
+        assert section['bytes'] == section['exclusive'] + section['shared'] > 0
+    for kind in ('tagged', 'grouped', 'related'):
+        assert report['associations'][kind]['count'] == len(getattr(context, kind))
+    by_class = {}
+    for obj in context.instances:
+        cls = context.classes.by_id[oid_class(obj['id'])]
+        by_class[cls.name] = by_class.get(cls.name, 0) + 1
+    assert {k: s['count'] for k, s in report['instances'].items()} == by_class
+    assert report['exclusive'] <= report['total']
+    assert report['total'] <= deep_sizeof(context)
+    assert format_report(report, top=3)[0].startswith('estimate total')
+
+    exact = memory_report(context, exact=True)
+    assert exact['mode'] == 'tracemalloc'
+    assert set(exact['instances']) == set(report['instances'])
+    assert exact['total'] == sum(s['bytes'] for group in ('kinds', 'indexes', 'associations',
+                                                            'instances')
+                                 for s in exact[group].values())
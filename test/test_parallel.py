@@ -0,0 +1,65 @@
+import random
+from uopmeta.parallel import ParallelEvaluator
+from uopmeta.schemas import meta
+from conftest import random_query, random_write
+
+
+def test_parallel_results_equal_serial(populated):
+    dbi = populated.dbi
+    with ParallelEvaluator(dbi, max_workers=2, chunk_size=40, min_parallel=20) as evaluator:
+        executor = evaluator.pool()
+        for n in range(100):
+            query = random_query(populated)
+            assert evaluator.satisfies(query) == query.satisfies(dbi), query.to_dict()
+            obj_ids = set(random.sample(list(dbi.objects), 60))
+            assert evaluator.satisfies(query, obj_ids) == query.satisfies(dbi, obj_ids)
+            for _ in range(random.randint(0, 5)):
+                random_write(populated)
+        # workers caught up with the writes instead of being restarted
+        assert evaluator.executor is executor
+        assert evaluator.restarts == 0
+        assert evaluator.version > 0
+
+
+def test_branches_go_to_workers(populated):
+    dbi = populated.dbi
+    submitted = []
+    with ParallelEvaluator(dbi, max_workers=2, min_parallel=10 ** 6) as evaluator:
+        submit = evaluator._submit
+        evaluator._submit = lambda work, component, *args: \
+            submitted.append(component.kind) or submit(work, component, *args)
+        query = meta.OrQuery(components=[
+            meta.ClassComponent(cls_name='Person'),
+            meta.TagsComponent(names=populated.tags[:3], application='any'),
+            meta.RelatedTo(obj_id=populated.anchor, role=populated.context.random_role().name),
+            meta.AttributeComponent(attr_name='createdAt', operate='>', value=50)])
+        assert evaluator.satisfies(query) == query.satisfies(dbi)
+    assert sorted(submitted) == ['attribute', 'class', 'related', 'tags']
+
+
+def test_log_past_max_deltas_restarts_pool(populated):
+    dbi = populated.dbi
+    with ParallelEvaluator(dbi, max_workers=1, max_deltas=5) as evaluator:
+        query = random_query(populated, related=False)
+        executor = evaluator.pool()
+        for _ in range(3):
+            random_write(populated)
+        assert evaluator.satisfies(query) == query.satisfies(dbi)
+        assert evaluator.executor is executor
+        for _ in range(10):
+            random_write(populated)
+        assert evaluator.satisfies(query) == query.satisfies(dbi)
+        assert evaluator.executor is not executor
+        assert evaluator.restarts == 1
+        assert evaluator.version == 0
+
+
+def test_parallel_satisfies_uses_dbi_evaluator(populated):
+    dbi = populated.dbi
+    evaluator = dbi.enable_parallel(max_workers=1, chunk_size=50, min_parallel=10)
+    try:
+        query = random_query(populated)
+        assert query.parallel_satisfies(dbi) == query.satisfies(dbi)
+        assert evaluator.executor is not None
+    finally:
+        evaluator.close()
@@ -0,0 +1,35 @@
+from uopmeta.schemas import meta
+from conftest import random_query, random_write
+
+
+def uncached(dbi, component):
+    cache, dbi.query_cache = dbi.query_cache, None
+    try:
+        return component.satisfies(dbi)
+    finally:
+        dbi.query_cache = cache
+
+
+def test_cached_results_follow_writes(populated):
+    dbi = populated.dbi
+    cache = dbi.enable_query_cache(maxsize=50)
+    queries = [random_query(populated) for _ in range(20)]
+    for _ in range(150):
+        random_write(populated)
+        for query in queries:
+            assert set(meta.component_ids(query, dbi)) == uncached(dbi, query)
+    assert cache.stats()['hits'] and cache.invalidations
+
+
+def test_materialized_queries_with_query_cache(populated):
+    dbi = populated.dbi
+    queries = [meta.MetaQuery(name=f'q{n}', query=random_query(populated)) for n in range(20)]
+    materialized = [q.materialize(dbi) for q in queries]
+    dbi.enable_query_cache(maxsize=50)
+    for _ in range(150):
+        random_write(populated)
+        for query, view in zip(queries, materialized):
+            expected = {i for i in uncached(dbi, query.query) if i in dbi.objects}
+            assert view.ids() == expected
+            # fills the cache with the results of the query's components
+            meta.component_ids(query.query, dbi)
@@ -0,0 +1,73 @@
+import datetime
+import pickle
+import pytest
+from pydantic import BaseModel
+from uopmeta.schemas import meta
+
+
+def query_dict():
+    return {'name': 'recent',
+            'query': {'and': {'components': [
+                {'class': {'Person': {}}},
+                {'tags': {'any': ['a', 'b']}}]}}}
+
+
+def test_cached_parse_equals_fresh_parse():
+    meta.query_parse_cache.clear()
+    first = meta.MetaQuery.from_dict(query_dict())
+    second = meta.MetaQuery.from_dict(query_dict())
+    assert first.query.to_dict() == second.query.to_dict()
+    assert first.id != second.id
+    fresh = meta.qc_dict_to_component(query_dict()['query'])
+    assert meta.parse_query(query_dict()['query']).to_dict() == fresh.to_dict()
+    assert meta.parse_query(query_dict()['query']).to_dict() == fresh.to_dict()
+
+
+def test_cached_components_are_frozen_and_copies_editable():
+    meta.query_parse_cache.clear()
+    expected = meta.MetaQuery.from_dict(query_dict()).to_dict()
+    shared = meta.MetaQuery.from_dict(query_dict())
+    for edit in (lambda q: q.add_component(meta.ClassComponent(cls_name='File')),
+                 lambda q: q.components[1].names.append('c'),
+                 lambda q: q.components.pop(),
+                 lambda q: setattr(q.components[0], 'cls_name', 'File'),
+                 lambda q: q.simplify()):
+        with pytest.raises(Exception, match='frozen'):
+            edit(shared.query)
+    shared.name = 'renamed'
+    edited = shared.query.copy(deep=True)
+    edited.add_component(meta.ClassComponent(cls_name='File'))
+    edited.components[1].names.append('c')
+    edited.components[0].cls_name = 'File'
+    assert len(pickle.loads(pickle.dumps(shared.query)).components) == 2
+    again = meta.MetaQuery.from_dict(query_dict()).to_dict()
+    again.pop('id')
+    expected.pop('id')
+    assert again == expected
+    assert len(meta.parse_query(query_dict()['query']).components) == 2
+
+
+def test_hit_constructs_no_models(monkeypatch):
+    meta.query_parse_cache.clear()
+    first = meta.parse_query(query_dict()['query'])
+    query = meta.MetaQuery.from_dict(query_dict())
+    built = []
+    init = BaseModel.__init__
+    monkeypatch.setattr(BaseModel, '__init__',
+                        lambda self, **data: built.append(self) or init(self, **data))
+    for _ in range(3):
+        assert meta.parse_query(query_dict()['query']) is first
+        hit = meta.MetaQuery.from_dict(query_dict())
+        assert hit.query is query.query and hit.id != query.id
+    assert built == []
+
+
+def test_values_of_other_types_do_not_share_keys():
+    when = datetime.datetime(2020, 1, 2, 3, 4, 5)
+    as_date = {'attribute': {'modified': {'>': when}}}
+    as_string = {'attribute': {'modified': {'>': str(when)}}}
+    assert meta.canonical_json(as_date, tagged=True) != meta.canonical_json(as_string, tagged=True)
+    assert meta.query_hash(as_date) != meta.query_hash(as_string)
+    meta.query_parse_cache.clear()
+    assert meta.parse_query(as_string).value == str(when)
+    assert isinstance(meta.parse_query(as_date).value, datetime.datetime)
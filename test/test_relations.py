@@ -0,0 +1,59 @@
+import random
+from uopmeta.graph import RelationIndex, traverse
+from uopmeta.schemas import meta
+
+
+def edges(index):
+    return set(index.edges())
+
+
+def test_context_index_matches_dbi(populated):
+    context, dbi = populated.context, populated.dbi
+    index = context.relation_index()
+    assert edges(index) == edges(dbi.relations)
+    for obj in random.sample(context.instances, 20):
+        for depth in (1, 2, None):
+            query = meta.RelatedTo(obj_id=obj['id'], max_depth=depth)
+            hops = query.hops(context)
+            assert traverse(index, {obj['id']}, hops, depth) == query.satisfies(dbi)
+
+
+def test_context_index_kept_current(populated):
+    context = populated.context
+    context.persist_to = None
+    index = context.relation_index()
+    assert context.relation_index() is index
+    for _ in range(50):
+        if random.random() < .6 or not context.related:
+            context.relate(context.random_related())
+        else:
+            assert context.unrelate(random.choice(context.related))
+        assert context.relation_index() is index
+        assert edges(index) == edges(RelationIndex.from_related(context.related))
+    context.related.append(context.random_related())
+    rebuilt = context.relation_index()
+    assert rebuilt is not index
+    assert edges(rebuilt) == edges(RelationIndex.from_related(context.related))
+
+
+def test_duplicate_edges_survive_one_unrelate(populated):
+    context = populated.context
+    context.persist_to = None
+    assoc = context.random_related()
+    context.relate(assoc)
+    context.relate(assoc.copy())
+    context.unrelate(assoc)
+    assert assoc.object_id in context.relation_index().neighbors({assoc.subject_id}, assoc.role_id)
+    context.unrelate(assoc)
+    assert not context.unrelate(assoc)
+    assert edges(context.relation_index()) == edges(RelationIndex.from_related(context.related))
+
+
+def test_relate_persists_to_dbi(populated):
+    context, dbi = populated.context, populated.dbi
+    assoc = meta.Related(assoc_id=context.random_role().id, subject_id=populated.anchor,
+                         object_id=context.random_instance()['id'])
+    context.relate(assoc)
+    assert assoc.object_id in dbi.relations.neighbors({populated.anchor}, assoc.role_id)
+    context.unrelate(assoc)
+    assert edges(dbi.relations) == edges(RelationIndex.from_related(context.related))
@@ -0,0 +1,40 @@
+import random
+from uopmeta.schemas import meta
+from uopmeta.rewrite import normalize
+from conftest import random_query
+
+
+def live(dbi, ids):
+    return {i for i in ids if dbi.get_object(i) is not None}
+
+
+def test_normalized_queries_are_equivalent(populated):
+    dbi, context = populated.dbi, populated.context
+    for _ in range(300):
+        query = random_query(populated)
+        normal = normalize(query, context)
+        assert live(dbi, normal.satisfies(dbi)) == live(dbi, query.satisfies(dbi)), \
+            (query.to_dict(), normal.to_dict())
+
+
+def test_negated_attributes_keep_objects_lacking_them(populated):
+    dbi = populated.dbi
+    compare = meta.AttributeComponent(attr_name='createdAt', operate='>', value=50)
+    negated = meta.AndQuery(components=[compare], negated=True)
+    pushed = normalize(negated)
+    assert pushed.to_dict() == negated.to_dict()
+    lacking = {i for i, obj in dbi.objects.items() if 'createdAt' not in obj}
+    assert lacking and lacking <= pushed.satisfies(dbi)
+    either = meta.OrQuery(components=[compare, compare.negated()])
+    assert normalize(either).satisfies(dbi) == either.satisfies(dbi)
+    assert not lacking & normalize(either).satisfies(dbi)
+    assert normalize(meta.OrQuery(components=[compare, negated])).satisfies(dbi) == \
+        dbi.all_object_ids()
+    assert not normalize(meta.AndQuery(components=[compare, negated])).satisfies(dbi)
+
+
+def test_double_negation_removed():
+    compare = meta.AttributeComponent(attr_name='createdAt', operate='<', value=3)
+    twice = meta.OrQuery(negated=True, components=[
+        meta.AndQuery(components=[compare], negated=True)])
+    assert normalize(twice).to_dict() == compare.to_dict()
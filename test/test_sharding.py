@@ -0,0 +1,46 @@
+import random
+import pytest
+from uopmeta.schemas import meta
+from uopmeta.sharding import ShardedContext
+from conftest import random_query
+
+
+def sharded(data, **kwargs):
+    context, dbi = data.context, data.dbi
+    res = ShardedContext(context.deep_copy(), batch_size=50, **kwargs)
+    res.load(list(dbi.objects.values()), context.tagged, context.grouped, context.related)
+    return res
+
+
+@pytest.mark.parametrize('by', ['oid', 'class'])
+def test_scatter_gather_matches_single_dbi(populated, by):
+    dbi = populated.dbi
+    with sharded(populated, shards=3, by=by, processes=False) as shards:
+        assert shards.all_object_ids() == dbi.all_object_ids()
+        assert sum(c['objects'] for c in shards.counts()) == len(dbi.objects)
+        for cls_name in populated.classes:
+            assert shards.class_instance_ids(cls_name) == dbi.class_instance_ids(cls_name)
+        ids = sorted(dbi.objects)
+        for _ in range(60):
+            component = random_query(populated)
+            assert shards.satisfies(component) == component.satisfies(dbi), component
+            subset = set(random.sample(ids, 50))
+            assert shards.satisfies(component, subset) == component.satisfies(dbi, subset)
+        for depth in (1, 2, None):
+            component = meta.RelatedTo(obj_id=populated.anchor, max_depth=depth)
+            assert shards.satisfies(component) == component.satisfies(dbi)
+
+        removed = ids[:10]
+        for obj_id in removed:
+            shards.delete_object(obj_id)
+            dbi.delete_object(obj_id)
+        assert shards.all_object_ids() == dbi.all_object_ids()
+        assert shards.get_object(ids[10]) == dbi.get_object(ids[10])
+
+
+def test_shard_processes_match_single_dbi(populated):
+    dbi = populated.dbi
+    with sharded(populated, shards=2, processes=True) as shards:
+        for _ in range(10):
+            component = random_query(populated)
+            assert shards.satisfies(component) == component.satisfies(dbi), component
@@ -0,0 +1,99 @@
+import glob
+import os
+import subprocess
+import sys
+import uuid
+from uopmeta.schemas import predefined
+from uopmeta.schemas.meta import MetaContext, MetaTag, ClassComponent
+from uopmeta.shared_meta import SharedMetaPublisher, SharedMetaContext
+from uopmeta.memory_dbi import MemoryDBI
+
+
+def test_reader_matches_context_and_follows_versions():
+    context = MetaContext.from_schema(predefined.pkm_schema)
+    context.complete()
+    name = f'uoptest{uuid.uuid4().hex[:12]}'
+    with SharedMetaPublisher(name) as publisher:
+        assert publisher.publish(context) == 1
+        with SharedMetaContext(name) as shared:
+            for kind in ('classes', 'attributes', 'tags', 'groups', 'roles'):
+                assert set(shared.by_id(kind)) == set(context.by_id(kind)), kind
+                for meta in context.metas_of_kind(kind):
+                    assert shared.get_meta(kind, meta.id) == meta
+                    assert shared.get_meta_named(kind, meta.name).name == meta.name
+            for cls in context.metas_of_kind('classes'):
+                assert shared.subclasses(cls.id) == context.subclasses(cls.id)
+            plain, through_shared = MemoryDBI(context), MemoryDBI(shared)
+            for cls in context.metas_of_kind('classes')[:10]:
+                for _ in range(5):
+                    obj = cls.random_instance()
+                    plain.add_object(obj)
+                    through_shared.add_object(dict(obj))
+            for cls_name in ('Person', 'PersistentObject', 'File'):
+                query = ClassComponent(cls_name=cls_name)
+                assert query.satisfies(through_shared) == query.satisfies(plain)
+
+            context.add(MetaTag(name='added_tag'))
+            assert publisher.publish(context) == 2
+            assert shared.get_meta_named('tags', 'added_tag').name == 'added_tag'
+            assert shared.version == 2
+    assert not glob.glob(f'/dev/shm/{name}*')
+
+
+script = '''
+from uopmeta.schemas import predefined
+from uopmeta.schemas.meta import MetaContext
+from uopmeta.shared_meta import SharedMetaPublisher, SharedMetaContext
+context = MetaContext.from_schema(predefined.pkm_schema)
+publisher = SharedMetaPublisher(%r)
+publisher.publish(context)
+shared = SharedMetaContext(%r)
+publisher.publish(context)
+shared.refresh()
+shared.close()
+publisher.close()
+'''
+
+
+def test_reader_in_publishing_process_leaves_tracker_quiet():
+    name = f'uoptest{uuid.uuid4().hex[:12]}'
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    done = subprocess.run([sys.executable, '-c', script % (name, name)], env=env,
+                          capture_output=True, text=True, timeout=60)
+    assert done.returncode == 0, done.stderr
+    assert 'Traceback' not in done.stderr and 'leaked' not in done.stderr, done.stderr
+    assert not glob.glob(f'/dev/shm/{name}*')
+
+
+def test_iteration_keeps_its_version_across_publishes():
+    context = MetaContext.from_schema(predefined.pkm_schema)
+    for n in range(5):
+        context.add(MetaTag(name=f'tag{n}'))
+    context.complete()
+    name = f'uoptest{uuid.uuid4().hex[:12]}'
+    expected = sorted(context.by_id('tags'))
+    with SharedMetaPublisher(name) as publisher:
+        publisher.publish(context)
+        with SharedMetaContext(name) as shared:
+            first = shared.snapshot
+            seen = []
+            for n, tag_id in enumerate(shared.by_id('tags')):
+                seen.append(tag_id)
+                if n == 1:
+                    context.add(MetaTag(name=f'added_tag{n}'))
+                    publisher.publish(context)
+                    assert shared.refresh() and first.segment is not None
+                    # other reads move to the new version meanwhile
+                    assert shared.get_meta_named('tags', 'added_tag1') is not None
+            assert seen == expected
+            assert first.segment is None
+            assert len(list(shared.by_id('tags'))) == len(expected) + 1
+            left = iter(shared.by_id('tags'))
+            next(left)
+            context.add(MetaTag(name='another_tag'))
+            publisher.publish(context)
+            shared.refresh()
+            kept = shared.snapshot
+            left.close()
+            assert kept.segment is not None
+    assert not glob.glob(f'/dev/shm/{name}*')
@@ -0,0 +1,67 @@
+import json
+import random
+from uopmeta.schemas import meta, predefined
+from uopmeta.stats import StatsCatalog, HyperLogLog, Histogram
+
+
+def test_hyperloglog_is_close():
+    sketch = HyperLogLog(12)
+    for n in range(20000):
+        sketch.add(f'x{n}')
+    assert abs(sketch.count() - 20000) < 20000 * .05
+
+
+def test_histogram_fractions_are_close():
+    random.seed(3)
+    values = [random.uniform(0, 1000) for _ in range(5000)]
+    histogram = Histogram()
+    for value in values:
+        histogram.add(value)
+    for cut in (100, 500, 900):
+        exact = sum(v < cut for v in values) / len(values)
+        assert abs(histogram.fraction('<', cut) - exact) < .05
+
+
+def test_counts_follow_writes(populated):
+    dbi, context = populated.dbi, populated.context
+    stats = dbi.enable_stats()
+    for obj_id in random.sample(list(dbi.objects), 20):
+        dbi.delete_object(obj_id)
+    assert stats.count() == len(dbi.objects)
+    persistent = meta.ClassComponent(cls_name='PersistentObject')
+    assert stats.count('classes', 'PersistentObject') == len(persistent.satisfies(dbi))
+    tag = context.random_tag()
+    assert stats.count('tags', tag.name) == len(dbi.tagsets.get(tag.id, ()))
+    restored = StatsCatalog.from_dict(json.loads(json.dumps(stats.to_dict())), context)
+    assert restored.to_dict() == stats.to_dict()
+
+
+def test_context_with_stats_serializes():
+    random.seed(5)
+    context = meta.WorkingContext.from_schema(predefined.pkm_schema)
+    context.configure(num_assocs=20, num_instances=20)
+    context.collect_stats()
+    assert context.stats.count() == len(context.instances)
+    data = json.loads(context.json())
+    assert 'stats' not in data and 'stats' not in context.dict()
+    assert context.stats is not None
+
+
+def test_context_stats_follow_mutators():
+    random.seed(6)
+    context = meta.WorkingContext.from_schema(predefined.pkm_schema)
+    context.configure(num_assocs=10, num_instances=10)
+    stats = context.collect_stats()
+    context.configure(num_assocs=30, num_instances=25)
+    for _ in range(5):
+        context.relate(context.random_related())
+    for assoc in context.related[:4]:
+        context.unrelate(assoc)
+    fresh = StatsCatalog.from_context(context).to_dict()
+    kept = stats.to_dict()
+    # distinct count sketches only grow, the counts follow removals
+    for key in ('object_count', 'class_counts', 'assoc_counts', 'histograms'):
+        assert kept[key] == fresh[key], key
+    assert stats.count() == len(context.instances) == 25
+    context.stats = StatsCatalog()
+    assert context.collected_stats() is None
@@ -0,0 +1,53 @@
+import random
+from uopmeta.schemas import meta
+from uopmeta import streaming
+from uopmeta.streaming import stream_ids
+from conftest import random_query
+
+
+def test_stream_matches_satisfies(populated):
+    dbi = populated.dbi
+    for n in range(60):
+        component = random_query(populated)
+        query = meta.MetaQuery(name=f'q{n}', query=component)
+        expected = sorted(component.satisfies(dbi))
+        assert list(query.stream(dbi)) == expected, component
+        offset, limit = random.randint(0, 10), random.randint(1, 20)
+        assert list(query.stream(dbi, limit=limit, offset=offset)) == \
+            expected[offset:offset + limit]
+        if expected:
+            after = random.choice(expected)
+            assert list(stream_ids(component, dbi, after=after)) == \
+                [i for i in expected if i > after]
+
+
+def test_limit_stops_early(populated):
+    dbi = populated.dbi
+    component = meta.AndQuery(components=[
+        meta.ClassComponent(cls_name='PersistentObject'),
+        meta.AttributeComponent(attr_name='createdAt', operate='>=', value=0)])
+    query = meta.MetaQuery(name='q', query=component)
+    expected = sorted(component.satisfies(dbi))
+    assert len(expected) > 20
+    fetched = []
+    get_object = dbi.get_object
+    dbi.get_object = lambda obj_id: fetched.append(obj_id) or get_object(obj_id)
+    assert list(query.stream(dbi, limit=3)) == expected[:3]
+    assert len(fetched) < len(expected) / 2
+
+
+def test_chunked_branches_match_satisfies(populated, monkeypatch):
+    dbi = populated.dbi
+    monkeypatch.setattr(streaming, 'chunk_size', 3)
+    dbi.index_values('createdAt')
+    traversals = []
+    related_ids = meta.RelatedTo.related_ids
+    monkeypatch.setattr(meta.RelatedTo, 'related_ids',
+                        lambda self, dbi: traversals.append(self) or related_ids(self, dbi))
+    for n in range(60):
+        component = random_query(populated)
+        expected = sorted(component.satisfies(dbi))
+        del traversals[:]
+        assert list(stream_ids(component, dbi)) == expected, component
+        related = [c for c in traversals if c.kind == 'related']
+        assert len(related) == len({id(c) for c in related})
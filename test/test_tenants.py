@@ -0,0 +1,105 @@
+import threading
+from uopmeta.schemas import meta, predefined
+from uopmeta.schemas.meta import Schema, MetaContext
+from uopmeta.tenants import TenantContextCache
+
+core = Schema.core_schema()
+
+
+def tenant_schema(n):
+    return Schema(name=f'tenant{n}', uses_schemas=[predefined.pkm_schema], requires_schemas=[core],
+                  classes=[meta.app_class(f'Custom{n}', 'Person',
+                                          meta.app_attr(f'extra{n}', 'string'))])
+
+
+schemas = {}
+
+
+def loader(tenant):
+    n = int(tenant[1:])
+    if n not in schemas:
+        schemas[n] = tenant_schema(n)
+    return schemas[n]
+
+
+def attribute_names(context):
+    return {name: [a.name for a in cls.attributes] for name, cls in context.classes.by_name.items()}
+
+
+def test_shared_contexts_equal_unshared():
+    cache = TenantContextCache(loader)
+    contexts = [cache.get(f't{n}') for n in range(3)]
+    for n, context in enumerate(contexts):
+        assert attribute_names(context) == attribute_names(MetaContext.from_schema(loader(f't{n}')))
+    assert contexts[0].classes.by_name['Person'] is contexts[1].classes.by_name['Person']
+    assert 'Custom0' not in contexts[1].classes.by_name
+    assert cache.get('t0') is contexts[0] and cache.hits == 1
+
+
+def test_shared_metas_are_not_modified():
+    cache = TenantContextCache(loader)
+    person = cache.get('t0').classes.by_name['Person']
+    attrs, attributes = person.attrs, person.attributes
+    cache.get('t1')
+    cache.get('t2')
+    assert person.attrs is attrs and person.attributes is attributes
+
+
+def test_budget_evicts_least_recent():
+    small = TenantContextCache(loader, max_tenants=3)
+    for n in range(6):
+        small.get(f't{n}')
+    assert len(small) == 3 and 't5' in small and 't0' not in small
+    small.clear()
+    assert small.shared == {} and small.total_bytes == 0
+    sized = TenantContextCache(loader, max_bytes=150_000)
+    for n in range(20):
+        sized.get(f't{n}')
+    assert sized.total_bytes <= 150_000 and sized.evictions == 20 - len(sized)
+
+
+def test_slow_load_does_not_block_other_tenants():
+    release = threading.Event()
+    calls = []
+
+    def slow_loader(tenant):
+        calls.append(tenant)
+        if tenant == 'slow':
+            assert release.wait(10)
+            return loader('t9')
+        return loader(tenant)
+
+    cache = TenantContextCache(slow_loader)
+    cache.get('t1')
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('slow')))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    # a hit and a load of another tenant finish while slow is loading
+    assert cache.get('t1') is not None
+    assert cache.get('t2') is not None
+    assert 'slow' not in cache
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    assert len(results) == 3 and all(r is results[0] for r in results)
+    assert calls.count('slow') == 1
+
+
+def test_invalidate_during_load_is_not_cached():
+    started, release = threading.Event(), threading.Event()
+
+    def slow_loader(tenant):
+        started.set()
+        assert release.wait(10)
+        return loader('t1')
+
+    cache = TenantContextCache(slow_loader)
+    thread = threading.Thread(target=cache.get, args=('t1',))
+    thread.start()
+    assert started.wait(10)
+    cache.invalidate('t1')
+    release.set()
+    thread.join(10)
+    assert 't1' not in cache and cache.shared == {} and cache.shared_bytes == 0
@@ -0,0 +1,58 @@
+import random
+from sjautils.dicts import DictObject
+from uopmeta.memory_dbi import MemoryDBI
+from uopmeta.schemas import meta, predefined
+from uopmeta.workload import WorkloadRecorder, LatencyHistogram, read_trace, replay
+from conftest import random_query
+
+
+def state(dbi):
+    return (dbi.objects, {k: v for k, v in dbi.tagsets.items() if v},
+            {k: v for k, v in dbi.groupsets.items() if v}, set(dbi.relations.edges()))
+
+
+def fresh_dbi():
+    return MemoryDBI(meta.WorkingContext.from_schema(predefined.pkm_schema))
+
+
+def test_replay_reproduces_recorded_state(tmp_path):
+    random.seed(4)
+    path = str(tmp_path / 'trace.jsonl')
+    dbi = fresh_dbi()
+    recorder = WorkloadRecorder(path).attach(dbi)
+    context = meta.WorkingContext.from_schema(predefined.pkm_schema)
+    context.configure(num_assocs=200, num_instances=100, persist_to=dbi)
+    data = DictObject(context=context, dbi=dbi, anchor=context.instances[0]['id'],
+                      tags=[t.name for t in context.tags.by_id.values()],
+                      groups=[g.name for g in context.groups.by_id.values()],
+                      classes=['Person', 'File', 'DescribedComponent'])
+    queries = [meta.MetaQuery(name=f'q{n}', query=random_query(data)) for n in range(10)]
+    for n in range(200):
+        recorder.satisfies(random.choice(queries))
+        if n % 5 == 0:
+            dbi.delete_object(random.choice(list(dbi.objects)))
+    recorder.close()
+    entries = list(read_trace(path))
+    assert len(entries) == recorder.count
+    assert sum(e['type'] == 'query' for e in entries) == 200
+    for kwargs in (dict(), dict(concurrency=4), dict(rate=20000, concurrency=2)):
+        replayed = fresh_dbi()
+        report = replay(path, replayed, **kwargs)
+        assert report['errors'] == 0
+        assert report['query']['count'] == 200
+        assert state(replayed) == state(dbi)
+        for query in queries:
+            assert query.satisfies(replayed) == query.satisfies(dbi)
+
+
+def test_histogram_percentiles_are_close():
+    rng = random.Random(2)
+    latencies = [rng.lognormvariate(-8, 1.5) for _ in range(20000)]
+    histogram = LatencyHistogram()
+    for latency in latencies:
+        histogram.add(latency)
+    latencies.sort()
+    for fraction in (.5, .9, .99, .999):
+        exact = latencies[int(fraction * len(latencies)) - 1]
+        assert abs(histogram.percentile(fraction) / exact - 1) < .03, fraction
+    assert histogram.percentile(1) == max(latencies)
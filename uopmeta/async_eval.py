@@ -0,0 +1,138 @@
+"""
+Asynchronous query evaluation for dbis whose calls are round trips to a
+store.  Independent dbi calls, such as the instance ids of a class and
+each of its subclasses or the tagsets of several tags, are issued
+concurrently under a bounded semaphore and their results folded into the
+set algebra as they arrive.  Dbi methods may be coroutines or plain
+functions.
+
+By default every call a component needs is issued at once, so a class
+with thirty subclasses costs one round trip.  A concurrency bound
+protects a store from wide queries at the cost of a round trip for each
+further concurrency calls.
+"""
+import asyncio
+import inspect
+from functools import reduce
+from uopmeta.oid import oid_class
+from uopmeta.graph import traverse
+from uopmeta.streaming import is_filter
+
+
+async def _await(value):
+    return (await value) if inspect.isawaitable(value) else value
+
+
+class AsyncEvaluator:
+    def __init__(self, dbi, concurrency=None):
+        """
+        :param concurrency: most dbi calls in flight at once, None for no bound
+        """
+        self.dbi = dbi
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def call(self, method, *args):
+        if self.semaphore is None:
+            return await _await(getattr(self.dbi, method)(*args))
+        async with self.semaphore:
+            return await _await(getattr(self.dbi, method)(*args))
+
+    async def fold(self, awaitables, combine, initial):
+        res = initial
+        for done in asyncio.as_completed(list(awaitables)):
+            res = combine(res, await done)
+        return res
+
+    async def union(self, awaitables):
+        return await self.fold(awaitables, lambda a, b: a | set(b), set())
+
+    async def candidates(self, obj_ids):
+        if obj_ids is not None:
+            return set(obj_ids)
+        return set(await self.call('all_object_ids'))
+
+    async def satisfies(self, component, obj_ids=None):
+        handler = getattr(self, f'_{component.kind}', None)
+        if handler is None:
+            raise Exception(f'no async handler for {component.kind} query component')
+        return await handler(component, obj_ids)
+
+    async def _class(self, component, obj_ids):
+        context = self.dbi.meta_context
+        cls_ids = component.class_ids(context)
+        if obj_ids is not None:
+            return {i for i in obj_ids if (oid_class(i) in cls_ids) == component.positive}
+        by_id = context.classes.by_id
+        res = await self.union(self.call('class_instance_ids', by_id[i].name)
+                               for i in cls_ids)
+        if component.positive:
+            return res
+        return await self.candidates(None) - res
+
+    async def _associated(self, component, obj_ids):
+        method = 'get_tagset' if component.assoc_kind == 'tagged' else 'get_groupset'
+        named_ids = component.named_ids(self.dbi.meta_context)
+        name_sets = await asyncio.gather(*[
+            self.union(self.call(method, i) for i in ids) for ids in named_ids])
+        if component.application == 'all':
+            if not name_sets:
+                return await self.candidates(obj_ids)
+            res = reduce(lambda a, b: a & b, name_sets)
+        else:
+            res = set().union(*name_sets)
+            if component.application == 'none':
+                return await self.candidates(obj_ids) - res
+        return res if obj_ids is None else res.intersection(obj_ids)
+
+    _tags = _associated
+    _groups = _associated
+
+    async def _attribute(self, component, obj_ids):
+        obj_ids = await self.candidates(obj_ids)
+        test = component.obj_eval()
+
+        async def check(obj_id):
+            obj = await self.call('get_object', obj_id)
+            try:
+                return {obj_id} if obj and test(obj) else set()
+            except KeyError:
+                return set()
+
+        return await self.union(check(i) for i in obj_ids)
+
+    async def _related(self, component, obj_ids):
+        index = await self.call('relation_index')
+        found = traverse(index, {component.obj_id},
+                         component.hops(self.dbi.meta_context), component.max_depth)
+        if component.negated:
+            return await self.candidates(obj_ids) - found
+        return found if obj_ids is None else found.intersection(obj_ids)
+
+    async def _negate(self, component, obj_ids, res):
+        return (await self.candidates(obj_ids)) - res if component.negated else res
+
+    async def _and(self, component, obj_ids):
+        sources = [c for c in component.components if not is_filter(c)]
+        filters = [c for c in component.components if is_filter(c)]
+        res = obj_ids
+        if sources:
+            found = await asyncio.gather(*[self.satisfies(c, obj_ids) for c in sources])
+            res = reduce(lambda a, b: a & b, found)
+        for child in filters:
+            if res is not None and not res:
+                break
+            res = await self.satisfies(child, res)
+        res = await self.candidates(res)
+        return await self._negate(component, obj_ids, res)
+
+    async def _or(self, component, obj_ids):
+        res = await self.union(self.satisfies(c, obj_ids) for c in component.components)
+        return await self._negate(component, obj_ids, res)
+
+
+async def async_satisfies(component, dbi, obj_ids=None, concurrency=None):
+    """
+    Asynchronous counterpart of component.satisfies(dbi, obj_ids).
+    :param concurrency: most dbi calls in flight at once, None for no bound
+    """
+    return await AsyncEvaluator(dbi, concurrency).satisfies(component, obj_ids)
@@ -1,5 +1,6 @@
-import random, time
+import random, time, json
 from uopmeta import oid
+from uopmeta.lru import LRUCache
 from sjautils import index, date_time
 import datetime
 
@@ -79,7 +80,8 @@ class PhoneType(AttrType):
         super().__init__(html5='tel')
 
     def random_instance(self):
-        super().random_instance()
+        return '1-%03d-%03d-%04d' % (random.randint(200, 999), random.randint(0, 999),
+                                     random.randint(0, 9999))
 
     def default(self):
         return '1-999-999-9999'
@@ -94,6 +96,36 @@ class StringType(AttrType):
 class TextType(StringType):
     pass
 
+def json_entry_size(key, value):
+    """
+    Bytes held by a cached json string and its parsed value.
+    """
+    from uopmeta.memory import deep_sizeof
+    return deep_sizeof(key, value)
+
+json_cache = LRUCache(maxsize=10000, max_bytes=64 * 1024 * 1024, sizeof=json_entry_size)
+
+class JsonType(StringType):
+    """
+    Json values are stored as strings.  Parsed values are cached by string
+    so each distinct json value is parsed once while it stays in the
+    cache.  Parsed values are shared and must not be modified.
+    """
+    def __init__(self, cache=json_cache):
+        super().__init__()
+        self.cache = cache
+
+    def parse(self, value):
+        if not isinstance(value, str):
+            return value
+        return self.cache.get_or_compute(value, lambda: json.loads(value))
+
+    def random_instance(self):
+        return json.dumps(dict(value=random_string()))
+
+    def default(self):
+        return '{}'
+
 class EmailType(AttrType):
     def __init__(self):
         super().__init__(html5='email')
@@ -125,6 +157,25 @@ attribute_types = {
     'text': TextType(),
     'date': EpochType(),
     'datetime': EpochType(),
-    'json': StringType(),
+    'json': JsonType(),
     'epoch': EpochType(),
 }
+
+json_path_sep = '.'
+
+def json_path_value(data, path):
+    """
+    Value at the path, a sequence of keys and list indices, within parsed
+    json data.  Raises KeyError if there is no such value.
+    """
+    for part in path:
+        if isinstance(data, dict):
+            data = data[part]
+        elif isinstance(data, list):
+            try:
+                data = data[int(part)]
+            except (ValueError, IndexError):
+                raise KeyError(part)
+        else:
+            raise KeyError(part)
+    return data
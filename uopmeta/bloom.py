@@ -0,0 +1,71 @@
+"""
+Counting Bloom filters for compact membership tests of association sets.
+A candidate id is hashed once with bloom_hashes and the pair of hashes
+probed against any number of filters.  Counters make removal possible;
+a counter that saturates stays set.
+"""
+import hashlib
+import math
+
+
+def bloom_hashes(item):
+    digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class CountingBloomFilter:
+    def __init__(self, capacity=1024, error_rate=0.01):
+        """
+        :param capacity: members the filter is sized for
+        :param error_rate: false positive rate at capacity
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.counters = bytearray(self.size)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, item):
+        return self.contains_hashes(bloom_hashes(item))
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def _positions(self, hashes):
+        h1, h2 = hashes
+        size = self.size
+        return [(h1 + n * h2) % size for n in range(self.num_hashes)]
+
+    def contains_hashes(self, hashes):
+        counters = self.counters
+        return all(counters[p] for p in self._positions(hashes))
+
+    def add(self, item):
+        counters = self.counters
+        for p in self._positions(bloom_hashes(item)):
+            if counters[p] < 255:
+                counters[p] += 1
+        self.count += 1
+
+    def remove(self, item):
+        """
+        Removes an item known to have been added.
+        """
+        counters = self.counters
+        for p in self._positions(bloom_hashes(item)):
+            if 0 < counters[p] < 255:
+                counters[p] -= 1
+        self.count -= 1
+
+    @classmethod
+    def of(cls, items, capacity=None, error_rate=0.01):
+        items = list(items)
+        res = cls(capacity or max(1024, 2 * len(items)), error_rate)
+        for item in items:
+            res.add(item)
+        return res
@@ -0,0 +1,204 @@
+"""
+Bulk removal of the associations left dangling by deleted objects and
+classes.  An AssociationIndex maps every object and subject id to the
+associations it takes part in and partitions those ids by class, so the
+associations of deleted objects and of all instances of deleted classes
+are found without scanning the association records or splitting ids.
+"""
+from collections import defaultdict
+from itertools import islice
+from uopmeta.oid import oid_class
+from uopmeta.schemas.meta import Tagged, Grouped, Related
+
+assoc_kinds = ('tagged', 'grouped', 'related')
+
+
+def assoc_key(assoc):
+    return assoc.kind, assoc.assoc_id, assoc.object_id, getattr(assoc, 'subject_id', None)
+
+
+def assoc_record(key):
+    kind, assoc_id, object_id, subject_id = key
+    if kind == 'related':
+        return Related(assoc_id=assoc_id, object_id=object_id, subject_id=subject_id)
+    cls = Tagged if kind == 'tagged' else Grouped
+    return cls(assoc_id=assoc_id, object_id=object_id)
+
+
+class AssociationIndex:
+    """
+    Associations, as (kind, assoc_id, object_id, subject_id) keys, by the
+    ids of the objects and subjects they associate, and those ids by class.
+    Keys are also kept by (kind, assoc_id).
+    """
+
+    def __init__(self):
+        self.by_node = defaultdict(set)
+        self.class_nodes = defaultdict(set)
+        self.by_assoc = defaultdict(set)
+
+    def __len__(self):
+        return len(self.by_node)
+
+    @classmethod
+    def from_context(cls, context):
+        res = cls()
+        for assocs in (context.tagged, context.grouped, context.related):
+            for assoc in assocs:
+                res.add(assoc)
+        return res
+
+    @classmethod
+    def from_dbi(cls, dbi):
+        """
+        Index of the associations of a MemoryDBI as they are now.
+        """
+        return cls().index_dbi(dbi)
+
+    def index_dbi(self, dbi):
+        for kind, assoc_sets in (('tagged', dbi.tagsets), ('grouped', dbi.groupsets)):
+            for assoc_id, obj_ids in assoc_sets.items():
+                for obj_id in obj_ids:
+                    self.add_key((kind, assoc_id, obj_id, None))
+        for subject_id, role_id, object_id in dbi.relations.edges():
+            self.add_key(('related', role_id, object_id, subject_id))
+        return self
+
+    def attach(self, dbi):
+        """
+        Indexes the associations of a MemoryDBI and keeps up with its writes.
+        """
+        self.index_dbi(dbi)
+        dbi.add_listener(self.on_change)
+        dbi.assoc_index = self
+        return self
+
+    def detach(self, dbi):
+        dbi.remove_listener(self.on_change)
+        if getattr(dbi, 'assoc_index', None) is self:
+            dbi.assoc_index = None
+
+    def on_change(self, change):
+        if change.kind in assoc_kinds:
+            (self.add if change.op == 'insert' else self.remove)(change.record)
+
+    def _nodes(self, key):
+        return key[2:] if key[3] is not None else key[2:3]
+
+    def add_key(self, key):
+        self.by_assoc[key[:2]].add(key)
+        for node in self._nodes(key):
+            self.by_node[node].add(key)
+            self.class_nodes[oid_class(node)].add(node)
+
+    def remove_key(self, key):
+        keys = self.by_assoc.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.by_assoc[key[:2]]
+        for node in self._nodes(key):
+            keys = self.by_node.get(node)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self.by_node[node]
+                nodes = self.class_nodes.get(oid_class(node))
+                if nodes is not None:
+                    nodes.discard(node)
+                    if not nodes:
+                        del self.class_nodes[oid_class(node)]
+
+    def add(self, assoc):
+        self.add_key(assoc_key(assoc))
+
+    def remove(self, assoc):
+        self.remove_key(assoc_key(assoc))
+
+    def deleted_nodes(self, deleted_objects=(), deleted_classes=()):
+        res = set(deleted_objects)
+        for cls_id in deleted_classes:
+            res |= self.class_nodes.get(cls_id, set())
+        return res
+
+    def affected(self, deleted_objects=(), deleted_classes=()):
+        """
+        :return: keys of the associations that contain a deleted object or
+        an instance of a deleted class, as Associated.contains_deleted
+        """
+        res = set()
+        for node in self.deleted_nodes(deleted_objects, deleted_classes):
+            res |= self.by_node.get(node, set())
+        return res
+
+
+def _batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def remove_from_context(context, keys, counts):
+    for kind, removed in context.remove_associations(keys).items():
+        counts[kind] += removed
+
+
+def cascade_delete(target, deleted_objects=(), deleted_classes=(), index=None,
+                   batch_size=10000, delete_objects=False, on_batch=None):
+    """
+    Removes every association of target containing a deleted object or an
+    instance of a deleted class.
+    :param target: MemoryDBI or WorkingContext holding the associations
+    :param deleted_objects: ids of deleted objects
+    :param deleted_classes: ids of deleted classes
+    :param index: AssociationIndex of target, by default the one a dbi keeps
+    current once enable_assoc_index attached it, which this attaches on
+    first use, or the association_index a context keeps
+    :param batch_size: associations removed from a dbi per batch
+    :param delete_objects: also delete the objects themselves from a dbi
+    :param on_batch: called with the counts so far after each batch
+    :return: dict of counts removed by association kind and of batches and,
+    with delete_objects, of objects
+    """
+    is_dbi = hasattr(target, 'remove_association')
+    own = index is None
+    if own and is_dbi:
+        enable = getattr(target, 'enable_assoc_index', None)
+        index = enable() if enable else AssociationIndex.from_dbi(target)
+    elif own:
+        index = target.association_index()
+    affected = index.affected(deleted_objects, deleted_classes)
+    counts = dict(tagged=0, grouped=0, related=0, batches=0)
+    if is_dbi:
+        listening = index.on_change in target.listeners
+        for batch in _batches(affected, batch_size):
+            for key in batch:
+                if target.remove_association(assoc_record(key)):
+                    counts[key[0]] += 1
+                if not listening:
+                    index.remove_key(key)
+            counts['batches'] += 1
+            if on_batch:
+                on_batch(dict(counts))
+    elif affected:
+        # a context keeps associations in lists so one pass removes them all
+        remove_from_context(target, affected, counts)
+        if not own:
+            for key in affected:
+                index.remove_key(key)
+        counts['batches'] = 1
+        if on_batch:
+            on_batch(dict(counts))
+    if delete_objects and is_dbi:
+        removed = 0
+        for cls_id in deleted_classes:
+            for obj_id in list(target.class_ids.get(cls_id, ())):
+                removed += target.delete_object(obj_id) is not None
+        for obj_id in deleted_objects:
+            removed += target.delete_object(obj_id) is not None
+        counts['objects'] = removed
+    return counts
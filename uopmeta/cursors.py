@@ -0,0 +1,124 @@
+"""
+Keyset pagination over query results.  A page ends with an opaque cursor
+naming the last id returned, and the sort value when sorting by an
+attribute, so the next page resumes just past it instead of recomputing
+and sorting the whole result.
+"""
+import base64, json
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from uopmeta.indexes import sort_key
+from uopmeta.schemas.meta import attribute_value, query_hash
+from uopmeta.streaming import stream_ids, ids_after
+
+
+def query_fingerprint(component):
+    return query_hash(component)[:16]
+
+
+class Cursor:
+    def __init__(self, fingerprint, last_id, sort_attr=None, last_value=None):
+        self.fingerprint = fingerprint
+        self.last_id = last_id
+        self.sort_attr = sort_attr
+        self.last_value = last_value
+
+    def encode(self):
+        data = [self.fingerprint, self.last_id, self.sort_attr, self.last_value]
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+    @classmethod
+    def decode(cls, token):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token.encode()))
+            return cls(*data)
+        except (ValueError, TypeError):
+            raise Exception(f'invalid cursor {token}')
+
+
+def _id_page(component, dbi, limit, state):
+    after = state.last_id if state else None
+    return [(i, None) for i in islice(stream_ids(component, dbi, after=after), limit)]
+
+
+def _indexed_page(component, dbi, index, limit, state, batch_size=256):
+    keys, values = index.ordered()
+    pos = bisect_left(keys, sort_key(state.last_value)) if state else 0
+    last_key = sort_key(state.last_value) if state else None
+    res = []
+    batch = []
+
+    def flush():
+        found = component.satisfies(dbi, {i for i, _ in batch})
+        for obj_id, value in batch:
+            if obj_id in found:
+                res.append((obj_id, value))
+                if len(res) == limit:
+                    break
+        batch.clear()
+
+    for n in range(pos, len(keys)):
+        value = values[n]
+        ids = sorted(index.by_value[value])
+        if keys[n] == last_key:
+            ids = ids_after(ids, state.last_id)
+        batch.extend((i, value) for i in ids)
+        if len(batch) >= batch_size:
+            flush()
+            if len(res) == limit:
+                return res
+    if batch:
+        flush()
+    return res
+
+
+def _sorted_page(component, dbi, sort_attr, limit, state):
+    rows = []
+    for obj_id in component.satisfies(dbi):
+        obj = dbi.get_object(obj_id)
+        if not obj:
+            continue
+        try:
+            value = attribute_value(obj, sort_attr)
+        except KeyError:
+            continue
+        rows.append((sort_key(value), obj_id, value))
+    rows.sort(key=lambda r: r[:2])
+    start = 0
+    if state:
+        start = bisect_right([r[:2] for r in rows], (sort_key(state.last_value), state.last_id))
+    return [(obj_id, value) for _, obj_id, value in rows[start:start + limit]]
+
+
+def page(query, dbi, size=50, cursor=None, sort_attr=None):
+    """
+    One page of the result of a MetaQuery or query component in ascending
+    id order or, given sort_attr, ascending order of that attribute.
+    Sorting by an attribute uses the dbi's value index for the attribute
+    when there is one and otherwise sorts the whole result.  Objects
+    without the attribute are left out when sorting by it.
+    :param cursor: cursor returned with the previous page or None
+    :return: (ids, cursor) where cursor is None after the last page
+    """
+    component = getattr(query, 'query', query)
+    fingerprint = query_fingerprint(component)
+    state = Cursor.decode(cursor) if cursor else None
+    if state and (state.fingerprint != fingerprint or state.sort_attr != sort_attr):
+        raise Exception('cursor does not belong to this query')
+    limit = size + 1
+    if sort_attr is None:
+        rows = _id_page(component, dbi, limit, state)
+    else:
+        get_index = getattr(dbi, 'value_index', None)
+        index = get_index(sort_attr) if get_index else None
+        if index is not None:
+            rows = _indexed_page(component, dbi, index, limit, state)
+        else:
+            rows = _sorted_page(component, dbi, sort_attr, limit, state)
+    rows = rows[:limit]
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        last_id, last_value = rows[-1]
+        next_cursor = Cursor(fingerprint, last_id, sort_attr, last_value).encode()
+    return [obj_id for obj_id, _ in rows], next_cursor
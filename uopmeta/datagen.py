@@ -0,0 +1,283 @@
+"""
+Seeded synthetic datasets for load testing.  A DatasetGenerator takes a
+Schema and target sizes and produces tags, groups and roles, instances of
+every concrete class and tagged, grouped and related associations.
+Values are drawn with NumPy a chunk at a time, so datasets far larger
+than memory can be written to disk or loaded into a dbi.  Tag and group
+popularity follow a Zipf law and relationship subjects a power law of
+rank, so a few objects have most of the relationships.
+
+The same schema, seed, sizes and chunk_size give the same dataset.
+Associations are drawn independently so a few pairs may repeat; stores
+treat repeated association inserts as no-ops.
+
+Requires numpy, installed with the datagen extra.
+"""
+import json
+import math
+import os
+from uopmeta.oid import oid_sep
+from uopmeta.attr_info import attribute_types
+from uopmeta.schemas.meta import MetaContext, MetaTag, MetaGroup, MetaRole
+from sjautils import index
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_alphabet = index.radix.alphabet
+_id_digits = 11
+
+
+def encode_ids(numbers):
+    """
+    :param numbers: array of non-negative integers below 2**64
+    :return: list of their fixed width encodings in the id alphabet
+    """
+    base = len(_alphabet)
+    numbers = np.asarray(numbers, dtype=np.uint64)
+    codes = np.frombuffer(_alphabet.encode(), dtype=np.uint8)
+    digits = np.empty((len(numbers), _id_digits), dtype=np.uint8)
+    for n in range(_id_digits - 1, -1, -1):
+        digits[:, n] = codes[(numbers % base).astype(np.intp)]
+        numbers = numbers // base
+    return [s.decode() for s in digits.view(f'S{_id_digits}').ravel()]
+
+
+def zipf_weights(n, skew):
+    """
+    :return: probabilities of ranks 0 to n - 1 proportional to 1 / (rank + 1) ** skew
+    """
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** skew
+    return weights / weights.sum()
+
+
+def power_law_ranks(rng, n, skew, size):
+    """
+    Ranks 0 to n - 1 drawn with probability falling off as rank ** -skew.
+    """
+    u = rng.random(size)
+    if skew == 1:
+        ranks = np.power(float(n), u)
+    else:
+        top = 1 - skew
+        ranks = np.power((float(n) ** top - 1) * u + 1, 1 / top)
+    return np.minimum(ranks.astype(np.int64) - 1, n - 1).clip(0)
+
+
+class DatasetGenerator:
+    def __init__(self, schema, seed=0, instances=1000, tags=100, groups=50, roles=20,
+                 tagged=10000, grouped=5000, related=10000, tag_skew=1.1,
+                 group_skew=1.1, degree_skew=1.2, chunk_size=100_000,
+                 epoch_base=1.7e9):
+        """
+        :param schema: Schema whose concrete classes are instantiated
+        :param seed: seed of every random draw
+        :param instances: number of instances spread evenly over the concrete
+        classes or dict of number of instances by class name
+        :param tags: number of tags, likewise groups and roles
+        :param tagged: number of tagged associations, likewise grouped and related
+        :param tag_skew: Zipf exponent of tag popularity, likewise group_skew
+        :param degree_skew: power law exponent of relationship subject ranks
+        :param chunk_size: instances or associations drawn at a time
+        :param epoch_base: latest epoch of generated epoch values
+        """
+        if np is None:
+            raise Exception('DatasetGenerator requires numpy')
+        self.seed = seed
+        self.sizes = dict(tags=tags, groups=groups, roles=roles,
+                          tagged=tagged, grouped=grouped, related=related)
+        self.tag_skew = tag_skew
+        self.group_skew = group_skew
+        self.degree_skew = degree_skew
+        self.chunk_size = chunk_size
+        self.epoch_base = epoch_base
+        self.context = MetaContext.from_schema(schema)
+        self.classes = [c for c in self.context.classes.by_id.values() if not c.is_abstract]
+        self.classes.sort(key=lambda c: c.name)
+        if isinstance(instances, dict):
+            counts = [instances.get(c.name, 0) for c in self.classes]
+        else:
+            share, extra = divmod(instances, len(self.classes))
+            counts = [share + (n < extra) for n in range(len(self.classes))]
+        self.class_counts = np.array(counts, dtype=np.int64)
+        self.class_starts = np.concatenate(([0], np.cumsum(self.class_counts)))
+        self.num_instances = int(self.class_starts[-1])
+        rng = self.rng('ids')
+        self.id_base = int(rng.integers(0, 2 ** 62))
+        self.class_ids = [c.id for c in self.classes]
+        self._add_metas(rng)
+
+    def rng(self, stream, chunk=0):
+        streams = ('ids', 'objects', 'tagged', 'grouped', 'related')
+        return np.random.default_rng([self.seed, streams.index(stream), chunk])
+
+    def _add_metas(self, rng):
+        self.metas = {}
+        for kind, cls, prefix in (('tags', MetaTag, 'tag'), ('groups', MetaGroup, 'group'),
+                                  ('roles', MetaRole, 'role')):
+            n = self.sizes[kind]
+            ids = encode_ids(rng.integers(0, 2 ** 63, n, dtype=np.uint64))
+            metas = [cls(id=i, name=f'{prefix}_{k}') for k, i in enumerate(ids)]
+            for meta in metas:
+                self.context.add(meta)
+            self.metas[kind] = [m.id for m in metas]
+
+    def class_attributes(self, cls):
+        """
+        Attributes of cls and its superclasses by name.
+        """
+        res = {}
+        by_name = self.context.classes.by_name
+        while cls is not None:
+            for attr in cls.attributes or []:
+                res.setdefault(attr.name, attr)
+            cls = by_name.get(cls.superclass) if cls.superclass != cls.name else None
+        return res
+
+    def object_ids(self, indexes):
+        """
+        :param indexes: array of instance numbers
+        :return: ids of those instances
+        """
+        indexes = np.asarray(indexes, dtype=np.int64)
+        class_numbers = np.searchsorted(self.class_starts, indexes, side='right') - 1
+        seqs = encode_ids(indexes.astype(np.uint64) + np.uint64(self.id_base))
+        class_ids = self.class_ids
+        return [f'{s}{oid_sep}{class_ids[c]}' for s, c in zip(seqs, class_numbers.tolist())]
+
+    def _values(self, rng, attr, cls_id, n):
+        kind = attr.type
+        if kind in ('int', 'long'):
+            return rng.integers(0, 2 ** 32, n).tolist()
+        if kind == 'float':
+            return (rng.random(n) * 1e6).tolist()
+        if kind in ('epoch', 'date', 'datetime'):
+            return (self.epoch_base - rng.exponential(365 * 86400, n)).tolist()
+        if kind == 'uuid':
+            return [f'{s}{oid_sep}{cls_id}' for s in
+                    encode_ids(rng.integers(0, 2 ** 63, n, dtype=np.uint64))]
+        numbers = rng.integers(0, 2 ** 32, n).tolist()
+        if kind == 'email':
+            return [f'user{k}@example.com' for k in numbers]
+        if kind == 'phone':
+            return [f'1-{k % 800 + 200:03d}-{k // 800 % 1000:03d}-{k // 800000 % 10000:04d}'
+                    for k in numbers]
+        if kind == 'json':
+            return [json.dumps(dict(value=f'str{k}')) for k in numbers]
+        if kind in ('string', 'text'):
+            return [f'str{k}' for k in numbers]
+        return [attribute_types[kind].default() if kind in attribute_types else None] * n
+
+    def objects(self):
+        """
+        :return: iterator over lists of at most chunk_size instance dicts
+        """
+        chunk = 0
+        for number, cls in enumerate(self.classes):
+            attributes = list(self.class_attributes(cls).values())
+            start, end = int(self.class_starts[number]), int(self.class_starts[number + 1])
+            for first in range(start, end, self.chunk_size):
+                last = min(first + self.chunk_size, end)
+                rng = self.rng('objects', chunk)
+                chunk += 1
+                n = last - first
+                columns = {a.name: self._values(rng, a, cls.id, n) for a in attributes}
+                ids = self.object_ids(np.arange(first, last))
+                names = list(columns)
+                rows = zip(*[columns[k] for k in names]) if names else [()] * n
+                yield [dict(zip(names, row), id=obj_id) for obj_id, row in zip(ids, rows)]
+
+    def _chunks(self, kind):
+        total = self.sizes[kind]
+        for chunk, first in enumerate(range(0, total, self.chunk_size)):
+            yield self.rng(kind, chunk), min(self.chunk_size, total - first)
+
+    def _membership(self, kind, meta_kind, skew):
+        assoc_ids = self.metas[meta_kind]
+        if not assoc_ids or not self.num_instances:
+            return
+        weights = zipf_weights(len(assoc_ids), skew)
+        for rng, n in self._chunks(kind):
+            metas = rng.choice(len(assoc_ids), n, p=weights)
+            objects = self.object_ids(rng.integers(0, self.num_instances, n))
+            yield [dict(kind=kind, assoc_id=assoc_ids[m], object_id=o)
+                   for m, o in zip(metas.tolist(), objects)]
+
+    def tagged(self):
+        """
+        :return: iterator over lists of tagged dicts
+        """
+        return self._membership('tagged', 'tags', self.tag_skew)
+
+    def grouped(self):
+        return self._membership('grouped', 'groups', self.group_skew)
+
+    def _scramble(self):
+        # multiplier coprime with the number of instances, so that ranks map
+        # one to one onto instances spread over every class
+        n = self.num_instances
+        k = 2654435761 % n if n > 1 else 1
+        while k > 1 and math.gcd(k, n) != 1:
+            k += 1
+        return max(k, 1)
+
+    def related(self):
+        role_ids = self.metas['roles']
+        n = self.num_instances
+        if not role_ids or not n:
+            return
+        k = self._scramble()
+        for rng, size in self._chunks('related'):
+            ranks = power_law_ranks(rng, n, self.degree_skew, size)
+            subjects = self.object_ids(ranks * k % n)
+            objects = self.object_ids(rng.integers(0, n, size))
+            roles = rng.integers(0, len(role_ids), size).tolist()
+            yield [dict(kind='related', assoc_id=role_ids[r], object_id=o, subject_id=s)
+                   for r, o, s in zip(roles, objects, subjects)]
+
+    def meta_data(self):
+        """
+        :return: metas by kind as MetaContext.from_data reads them
+        """
+        return {kind: [m.dict() for m in self.context.metas_of_kind(kind)]
+                for kind in ('classes', 'attributes', 'tags', 'groups', 'roles')}
+
+    def write(self, directory):
+        """
+        Writes metas.json and one json lines file of objects and of each
+        kind of association to directory.
+        :return: number of records written by file name
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'metas.json'), 'w') as f:
+            json.dump(self.meta_data(), f, default=str)
+        counts = {}
+        for name, chunks in (('objects', self.objects()), ('tagged', self.tagged()),
+                             ('grouped', self.grouped()), ('related', self.related())):
+            path = os.path.join(directory, f'{name}.jsonl')
+            written = 0
+            with open(path, 'w') as f:
+                for chunk in chunks:
+                    f.writelines(json.dumps(record) + '\n' for record in chunk)
+                    written += len(chunk)
+            counts[f'{name}.jsonl'] = written
+        return counts
+
+    def load(self, dbi):
+        """
+        Adds the generated metas, objects and associations to dbi, normally
+        a MemoryDBI over this generator's context.
+        """
+        for kind in ('tags', 'groups', 'roles'):
+            for meta in self.context.metas_of_kind(kind):
+                dbi.meta_insert(meta)
+        for chunk in self.objects():
+            for obj in chunk:
+                dbi.add_object(obj)
+        for chunks in (self.tagged(), self.grouped(), self.related()):
+            for chunk in chunks:
+                for record in chunk:
+                    dbi.meta_insert(record)
+        return dbi
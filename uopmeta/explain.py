@@ -0,0 +1,308 @@
+"""
+Explain plans for queries.  explain walks a query component tree and
+reports for each node the strategy evaluation uses and its input and
+output cardinalities.  A dry run only estimates the cardinalities, from
+an Estimator, without touching object data.  An analyze run evaluates the
+query through a proxy of the dbi and adds the dbi calls each node issued,
+its wall time and, with memory on, the memory it allocated as traced by
+tracemalloc.  Times and memory of a node include those of its children.
+"""
+import time
+import tracemalloc
+from uopmeta.schemas.meta import CompositeQuery, canonical_json
+
+
+def _index(dbi, component):
+    if component.kind != 'attribute':
+        return None
+    name = 'trigram_index' if component.operate in ('like', 'not_like') else 'value_index'
+    get_index = getattr(dbi, name, None)
+    return name if get_index and get_index(component.attr_name) is not None else None
+
+
+def strategy(component, dbi, filtering):
+    """
+    :param filtering: component is given candidate ids
+    :return: short description of how component is evaluated
+    """
+    kind = component.kind
+    if kind == 'and':
+        res = 'filter chain'
+    elif kind == 'or':
+        res = 'union'
+    elif kind == 'class':
+        res = 'class filter' if filtering else 'class instance ids'
+        if not component.positive and not filtering:
+            res += ' complement'
+    elif kind in ('tags', 'groups'):
+        res = 'bloom probe' if filtering and hasattr(dbi, 'assoc_filter') \
+            else 'association sets'
+        if component.application == 'none':
+            res += ' complement'
+    elif kind == 'attribute':
+        index = _index(dbi, component)
+        res = index.replace('_', ' ') if index else 'scan'
+    elif kind == 'related':
+        res = 'graph traversal'
+    else:
+        res = 'satisfies'
+    if getattr(component, 'negated', False) is True:
+        res += ' negated'
+    return res
+
+
+class PlanNode:
+    def __init__(self, component, strategy):
+        self.component = component
+        self.strategy = strategy
+        self.children = []
+        self.input_count = None
+        self.output_count = None
+        self.dbi_calls = {}
+        self.seconds = None
+        self.memory = None
+        self.memory_peak = None
+        self.estimated = True
+
+    @property
+    def label(self):
+        if isinstance(self.component, CompositeQuery):
+            return self.component.kind
+        return canonical_json(self.component.to_dict())
+
+    def to_dict(self):
+        return dict(
+            label=self.label,
+            strategy=self.strategy,
+            estimated=self.estimated,
+            input_count=self.input_count,
+            output_count=self.output_count,
+            dbi_calls=dict(self.dbi_calls),
+            seconds=self.seconds,
+            memory=self.memory,
+            memory_peak=self.memory_peak,
+            children=[c.to_dict() for c in self.children])
+
+    def lines(self, depth=0):
+        approx = '~' if self.estimated else ''
+        parts = [f'{self.label}  [{self.strategy}]',
+                 f'in={approx}{self.input_count} out={approx}{self.output_count}']
+        if self.seconds is not None:
+            parts.append(f'time={self.seconds * 1000:.3f}ms')
+        if self.memory_peak is not None:
+            parts.append(f'mem={self.memory_peak}B')
+        if self.dbi_calls:
+            parts.append('calls=' + ','.join(f'{k}:{v}' for k, v in sorted(self.dbi_calls.items())))
+        res = ['  ' * depth + '  '.join(parts)]
+        for child in self.children:
+            res.extend(child.lines(depth + 1))
+        return res
+
+    def __str__(self):
+        return '\n'.join(self.lines())
+
+
+class Estimator:
+    """
+    Cardinality estimates for dry runs from fixed selectivities.  Replace
+    result_size with something better informed where there is one.
+    """
+    selectivity = {'class': 0.1, 'tags': 0.1, 'groups': 0.1,
+                   'attribute': 1 / 3, 'related': 0.01}
+
+    def __init__(self, dbi):
+        self.dbi = dbi
+        self._total = None
+
+    def total(self):
+        if self._total is None:
+            self._total = len(self.dbi.all_object_ids())
+        return self._total
+
+    def result_size(self, component):
+        """
+        :return: estimated size of the unfiltered result of a leaf component
+        """
+        fraction = self.selectivity.get(component.kind, 1.0)
+        positive = getattr(component, 'positive', True) and \
+            getattr(component, 'application', None) != 'none' and \
+            getattr(component, 'negated', False) is not True
+        return self.total() * (fraction if positive else 1 - fraction)
+
+
+def _estimated_calls(component, dbi, filtering, input_count):
+    kind = component.kind
+    if kind == 'class':
+        if filtering:
+            return {}
+        calls = {'class_instance_ids': len(component.class_ids(dbi.meta_context))}
+        if not component.positive:
+            calls['all_object_ids'] = 1
+        return calls
+    if kind in ('tags', 'groups'):
+        method = 'get_tagset' if kind == 'tags' else 'get_groupset'
+        calls = {method: sum(len(ids) for ids in component.named_ids(dbi.meta_context))}
+        if component.application == 'none' and not filtering:
+            calls['all_object_ids'] = 1
+        return calls
+    if kind == 'attribute':
+        index = _index(dbi, component)
+        if index:
+            return {index: 1}
+        calls = {'get_object': int(input_count)}
+        if not filtering:
+            calls['all_object_ids'] = 1
+        return calls
+    if kind == 'related':
+        return {'relation_index': 1}
+    return {}
+
+
+def _estimate(component, dbi, estimator, input_count, filtering):
+    node = PlanNode(component, strategy(component, dbi, filtering))
+    node.input_count = round(input_count)
+    total = estimator.total()
+    if isinstance(component, CompositeQuery):
+        if component.kind == 'and':
+            res, child_filtering = input_count, filtering
+            for child in component.components:
+                child_node = _estimate(child, dbi, estimator, res, child_filtering)
+                node.children.append(child_node)
+                res, child_filtering = child_node.output_count, True
+        else:
+            missing = 1.0
+            for child in component.components:
+                child_node = _estimate(child, dbi, estimator, input_count, filtering)
+                node.children.append(child_node)
+                if input_count:
+                    missing *= 1 - child_node.output_count / input_count
+            res = input_count * (1 - missing)
+        if component.negated:
+            res = input_count - res
+    else:
+        fraction = estimator.result_size(component) / total if total else 0
+        res = input_count * min(fraction, 1.0)
+        node.dbi_calls = _estimated_calls(component, dbi, filtering, input_count)
+    node.output_count = round(res)
+    return node
+
+
+class _TracingDBI:
+    """
+    Proxy of a dbi counting the calls made through it for the current plan
+    node.  Components evaluate their children through its query_cache.
+    """
+
+    def __init__(self, dbi, analyzer):
+        self._dbi = dbi
+        self._analyzer = analyzer
+
+    @property
+    def query_cache(self):
+        return self._analyzer
+
+    def __getattr__(self, name):
+        value = getattr(self._dbi, name)
+        if not callable(value):
+            return value
+        analyzer = self._analyzer
+
+        def counted(*args, **kwargs):
+            analyzer.count(name)
+            return value(*args, **kwargs)
+        return counted
+
+
+class _Analyzer:
+    def __init__(self, dbi, memory):
+        self.dbi = dbi
+        self.cache = getattr(dbi, 'query_cache', None)
+        self.tracing = _TracingDBI(dbi, self)
+        self.memory = memory
+        self.stack = []  # (node, start memory, highest peak seen before resets)
+        self.root = None
+        self._total = None
+
+    def count(self, name):
+        if self.stack:
+            calls = self.stack[-1][0].dbi_calls
+            calls[name] = calls.get(name, 0) + 1
+
+    def total(self):
+        if self._total is None:
+            self._total = len(self.dbi.all_object_ids())
+        return self._total
+
+    def _enter(self, node):
+        start = None
+        if self.memory:
+            start, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1][2] = max(self.stack[-1][2], peak)
+            tracemalloc.reset_peak()
+        self.stack.append([node, start, start])
+
+    def _exit(self, node):
+        _, start, carried = self.stack.pop()
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(carried, peak)
+            node.memory = current - start
+            node.memory_peak = peak - start
+            if self.stack:
+                self.stack[-1][2] = max(self.stack[-1][2], peak)
+
+    def satisfies(self, component, dbi, obj_ids=None):
+        node = PlanNode(component, strategy(component, self.dbi, obj_ids is not None))
+        node.estimated = False
+        node.input_count = len(obj_ids) if obj_ids is not None else self.total()
+        cache = self.cache
+        if cache is not None and obj_ids is None and component.canonical_key() in cache.cache:
+            node.strategy = 'query cache'
+        if self.stack:
+            self.stack[-1][0].children.append(node)
+        else:
+            self.root = node
+        self._enter(node)
+        started = time.perf_counter()
+        try:
+            if cache is not None:
+                res = cache.satisfies(component, self.tracing, obj_ids)
+            else:
+                res = component.satisfies(self.tracing, obj_ids)
+        finally:
+            node.seconds = time.perf_counter() - started
+            self._exit(node)
+        node.output_count = len(res)
+        return res
+
+
+def explain(query, dbi, analyze=False, obj_ids=None, memory=True, estimator=None):
+    """
+    Explain plan of a MetaQuery or query component.
+    :param analyze: evaluate the query and report what evaluation did,
+    otherwise only estimate
+    :param obj_ids: candidate ids the query is evaluated against, None for all
+    :param memory: trace memory allocated during an analyze run, which
+    slows evaluation down
+    :param estimator: cardinality estimates for a dry run, by default the
+    StatsCatalog of dbi or its meta context if there is one, else an
+    Estimator over dbi
+    :return: root PlanNode
+    """
+    component = getattr(query, 'query', query)
+    if not analyze:
+        estimator = estimator or getattr(dbi, 'stats', None) or \
+            getattr(dbi.meta_context, 'stats', None) or Estimator(dbi)
+        input_count = estimator.total() if obj_ids is None else len(obj_ids)
+        return _estimate(component, dbi, estimator, input_count, obj_ids is not None)
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        analyzer = _Analyzer(dbi, memory)
+        analyzer.satisfies(component, dbi, obj_ids)
+    finally:
+        if started:
+            tracemalloc.stop()
+    return analyzer.root
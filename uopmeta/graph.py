@@ -0,0 +1,154 @@
+def _add_to(adjacency, role_id, from_id, to_id):
+    by_node = adjacency.get(role_id)
+    if by_node is None:
+        by_node = adjacency[role_id] = {}
+    targets = by_node.get(from_id)
+    if targets is None:
+        targets = by_node[from_id] = set()
+    if to_id in targets:
+        return False
+    targets.add(to_id)
+    return True
+
+
+def _remove_from(adjacency, role_id, from_id, to_id):
+    by_node = adjacency.get(role_id)
+    targets = by_node.get(from_id) if by_node else None
+    if not targets or to_id not in targets:
+        return False
+    targets.discard(to_id)
+    if not targets:
+        del by_node[from_id]
+        if not by_node:
+            del adjacency[role_id]
+    return True
+
+
+def _neighbors(adjacency, node_ids, role_id):
+    maps = [adjacency.get(role_id, {})] if role_id is not None \
+        else list(adjacency.values())
+    res = set()
+    for by_node in maps:
+        if len(node_ids) < len(by_node):
+            for node in node_ids:
+                targets = by_node.get(node)
+                if targets:
+                    res |= targets
+        else:
+            for node, targets in by_node.items():
+                if node in node_ids:
+                    res |= targets
+    return res
+
+
+class RelationIndex:
+    """
+    Adjacency index over Related records, keeping for each role id the
+    objects of each subject and the subjects of each object.
+    """
+
+    def __init__(self):
+        self.forward = {}  # role_id -> subject_id -> object ids
+        self.backward = {}  # role_id -> object_id -> subject ids
+        self.num_edges = 0
+
+    def __len__(self):
+        return self.num_edges
+
+    @classmethod
+    def from_related(cls, related):
+        index = cls()
+        for assoc in related:
+            index.add(assoc)
+        return index
+
+    def add(self, related):
+        return self.add_edge(related.subject_id, related.role_id, related.object_id)
+
+    def remove(self, related):
+        return self.remove_edge(related.subject_id, related.role_id, related.object_id)
+
+    def add_edge(self, subject_id, role_id, object_id):
+        if _add_to(self.forward, role_id, subject_id, object_id):
+            _add_to(self.backward, role_id, object_id, subject_id)
+            self.num_edges += 1
+            return True
+        return False
+
+    def remove_edge(self, subject_id, role_id, object_id):
+        if _remove_from(self.forward, role_id, subject_id, object_id):
+            _remove_from(self.backward, role_id, object_id, subject_id)
+            self.num_edges -= 1
+            return True
+        return False
+
+    def role_ids(self):
+        return set(self.forward)
+
+    def neighbors(self, node_ids, role_id=None, reverse=False):
+        """
+        Ids one hop away from any of node_ids.
+        :param node_ids: ids to step from
+        :param role_id: role to follow or None for any role
+        :param reverse: step from objects to their subjects if True
+        :return: set of neighbor ids
+        """
+        return _neighbors(self.backward if reverse else self.forward, node_ids, role_id)
+
+    def edges(self):
+        """
+        (subject_id, role_id, object_id) of every edge.
+        """
+        for role_id, by_node in self.forward.items():
+            for subject_id, object_ids in by_node.items():
+                for object_id in object_ids:
+                    yield subject_id, role_id, object_id
+
+    def edges_of(self, node_id):
+        """
+        (subject_id, role_id, object_id) of every edge touching node_id.
+        """
+        res = []
+        for role_id, by_node in self.forward.items():
+            for object_id in by_node.get(node_id, ()):
+                res.append((node_id, role_id, object_id))
+        for role_id, by_node in self.backward.items():
+            for subject_id in by_node.get(node_id, ()):
+                if subject_id != node_id:
+                    res.append((subject_id, role_id, node_id))
+        return res
+
+
+def resolve_role(context, role_name):
+    """
+    :param context: MetaContext holding roles
+    :param role_name: name or reverse name of a role or None for any role
+    :return: (role_id, reverse) pair
+    """
+    if role_name is None:
+        return None, False
+    role = context.get_meta_named('roles', role_name)
+    if role is None:
+        raise Exception(f'no role named {role_name}')
+    return role.id, role.name != role_name
+
+
+def traverse(index: RelationIndex, start_ids, hops, max_depth=1):
+    """
+    Ids reachable from start_ids by following the hops, a list of
+    (role_id, reverse) steps, between 1 and max_depth times.
+    :param max_depth: number of repetitions of hops allowed, None for no limit
+    :return: set of reachable ids
+    """
+    result = set()
+    frontier = set(start_ids)
+    depth = 0
+    while frontier and (max_depth is None or depth < max_depth):
+        for role_id, reverse in hops:
+            frontier = index.neighbors(frontier, role_id, reverse)
+            if not frontier:
+                break
+        frontier -= result
+        result |= frontier
+        depth += 1
+    return result
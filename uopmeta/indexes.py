@@ -0,0 +1,124 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from numbers import Number
+
+
+def _order_class(value):
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, Number):
+        return Number
+    return type(value)
+
+
+def sort_key(value):
+    """
+    Total order over indexed values: by kind of value then by value.
+    """
+    return _order_class(value).__name__, value
+
+
+class ValueIndex:
+    """
+    Index from attribute values to the ids of objects holding them.
+    Equality lookups are hashed.  Range lookups bisect a sorted list of the
+    distinct values comparable with the one looked up, built on demand
+    and dropped when the set of distinct values changes.
+    Unhashable values are not indexed.
+    """
+
+    def __init__(self):
+        self.by_value = defaultdict(set)
+        self.values = {}
+        self._sorted = {}
+        self._ordered = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def ids(self):
+        return self.values.keys()
+
+    def add(self, obj_id, value):
+        if obj_id in self.values:
+            self.remove(obj_id)
+        try:
+            ids = self.by_value[value]
+        except TypeError:
+            return
+        if not ids:
+            self._values_changed(value)
+        ids.add(obj_id)
+        self.values[obj_id] = value
+
+    def remove(self, obj_id):
+        if obj_id not in self.values:
+            return
+        value = self.values.pop(obj_id)
+        ids = self.by_value[value]
+        ids.discard(obj_id)
+        if not ids:
+            del self.by_value[value]
+            self._values_changed(value)
+
+    def _values_changed(self, value):
+        self._sorted.pop(_order_class(value), None)
+        self._ordered = None
+
+    def ordered(self):
+        """
+        :return: (keys, values), the distinct values in sort_key order
+        and their sort keys in the same order
+        """
+        if self._ordered is None:
+            values = sorted(self.by_value, key=sort_key)
+            self._ordered = [sort_key(v) for v in values], values
+        return self._ordered
+
+    def sorted_values(self, like_value):
+        order = _order_class(like_value)
+        known = self._sorted.get(order)
+        if known is None:
+            known = self._sorted[order] = sorted(
+                v for v in self.by_value if _order_class(v) == order)
+        return known
+
+    def equal(self, value):
+        try:
+            return set(self.by_value.get(value, ()))
+        except TypeError:
+            return set()
+
+    def range(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        like = low if low is not None else high
+        values = self.sorted_values(like)
+        start = 0 if low is None else \
+            (bisect_left if low_inclusive else bisect_right)(values, low)
+        end = len(values) if high is None else \
+            (bisect_right if high_inclusive else bisect_left)(values, high)
+        res = set()
+        by_value = self.by_value
+        for value in values[start:end]:
+            res |= by_value[value]
+        return res
+
+    def lookup(self, operate, value):
+        """
+        :param operate: comparison operator as in AttributeOperation
+        :param value: value compared to
+        :return: ids of objects whose value satisfies the comparison
+        """
+        if operate == '==':
+            return self.equal(value)
+        if operate == '!=':
+            equal = self.by_value.get(value, ())
+            return {i for i in self.values if i not in equal}
+        if operate == '>=':
+            return self.range(low=value)
+        if operate == '>':
+            return self.range(low=value, low_inclusive=False)
+        if operate == '<=':
+            return self.range(high=value)
+        if operate == '<':
+            return self.range(high=value, high_inclusive=False)
+        raise Exception(f'no index lookup for operation {operate}')
@@ -0,0 +1,213 @@
+"""
+Opt-in counters and timers on uopmeta hot paths: context construction,
+meta lookups, query evaluation per component kind and instance creation.
+Nothing is measured until enable() wraps the instrumented methods, and
+disable() puts the originals back, so disabled instrumentation costs
+nothing.
+
+    from uopmeta import instrument
+    instrument.enable()
+    ...
+    instrument.snapshot()           # plain dict
+    instrument.prometheus_text()    # Prometheus text exposition format
+
+Timings are inclusive: a composite query's time includes that of its
+components, from_schema's that of complete.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# upper bounds of the latency histogram buckets in seconds
+buckets = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 0.1, 1.0, 10.0)
+
+
+class Timer:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bucket_counts = [0] * (len(buckets) + 1)
+
+    def add(self, seconds, failed=False):
+        self.count += 1
+        self.errors += failed
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.bucket_counts[bisect_left(buckets, seconds)] += 1
+
+    def to_dict(self):
+        return dict(count=self.count, errors=self.errors, total=self.total,
+                    mean=self.total / self.count if self.count else None, max=self.max,
+                    buckets=dict(zip([*map(str, buckets), '+Inf'], self.bucket_counts)))
+
+
+class Instrumentation:
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        self.patched = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.patched)
+
+    def record(self, name, seconds, failed=False):
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = Timer()
+            timer.add(seconds, failed)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timed(self, name):
+        """
+        Times the block as operation name.
+        """
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.record(name, time.perf_counter() - started, failed)
+
+    def _wrap(self, fn, name):
+        record = self.record
+        clock = time.perf_counter
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = clock()
+            try:
+                res = fn(*args, **kwargs)
+            except BaseException:
+                record(name(args[0]) if callable(name) else name, clock() - started, True)
+                raise
+            record(name(args[0]) if callable(name) else name, clock() - started)
+            return res
+        return wrapper
+
+    def patch(self, cls, attr, name):
+        """
+        Times calls of cls.attr, a method or classmethod defined on cls.
+        :param name: operation name or function of the receiver giving it
+        """
+        original = cls.__dict__[attr]
+        if isinstance(original, classmethod):
+            wrapped = classmethod(self._wrap(original.__func__, name))
+        else:
+            wrapped = self._wrap(original, name)
+        setattr(cls, attr, wrapped)
+        self.patched.append((cls, attr, original))
+
+    def enable(self):
+        if self.enabled:
+            return self
+        for cls, attr, name in _targets():
+            self.patch(cls, attr, name)
+        return self
+
+    def disable(self):
+        while self.patched:
+            cls, attr, original = self.patched.pop()
+            setattr(cls, attr, original)
+        return self
+
+    def reset(self):
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+
+    def snapshot(self):
+        """
+        :return: dict of the counters and of the timers by operation name
+        """
+        with self._lock:
+            return dict(enabled=self.enabled, counters=dict(self.counters),
+                        timers={k: t.to_dict() for k, t in sorted(self.timers.items())})
+
+    def prometheus_text(self, prefix='uopmeta'):
+        """
+        :return: counters and timers in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items())
+        if timers:
+            metric = f'{prefix}_operation_seconds'
+            lines.append(f'# HELP {metric} Time spent in uopmeta operations.')
+            lines.append(f'# TYPE {metric} histogram')
+            for name, timer in timers:
+                label = _label(name)
+                seen = 0
+                for bound, n in zip([*map(repr, buckets), '+Inf'], timer.bucket_counts):
+                    seen += n
+                    lines.append(f'{metric}_bucket{{operation="{label}",le="{bound}"}} {seen}')
+                lines.append(f'{metric}_sum{{operation="{label}"}} {timer.total!r}')
+                lines.append(f'{metric}_count{{operation="{label}"}} {timer.count}')
+            metric = f'{prefix}_operation_errors_total'
+            lines.append(f'# HELP {metric} uopmeta operations that raised.')
+            lines.append(f'# TYPE {metric} counter')
+            for name, timer in timers:
+                lines.append(f'{metric}{{operation="{_label(name)}"}} {timer.errors}')
+        if counters:
+            metric = f'{prefix}_events_total'
+            lines.append(f'# HELP {metric} Counted uopmeta events.')
+            lines.append(f'# TYPE {metric} counter')
+            for name, n in counters:
+                lines.append(f'{metric}{{event="{_label(name)}"}} {n}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _query_name(component):
+    return f'query.{type(component).__name__}'
+
+
+def _subclasses(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _subclasses(sub)
+
+
+def _targets():
+    from uopmeta.schemas.meta import (MetaContext, WorkingContext, MetaClass,
+                                      QueryComponent, MetaQuery)
+    res = [(MetaContext, 'from_schema', 'context.from_schema'),
+           (MetaContext, 'from_data', 'context.from_data'),
+           (WorkingContext, 'from_schema', 'working_context.from_schema'),
+           (MetaContext, 'complete', 'context.complete'),
+           (MetaContext, 'get_meta', 'context.get_meta'),
+           (MetaContext, 'get_meta_named', 'context.get_meta_named'),
+           (MetaContext, 'subclasses', 'context.subclasses'),
+           (MetaContext, 'subgroups', 'context.subgroups'),
+           (MetaClass, 'make_instance', 'class.make_instance'),
+           (MetaClass, 'random_instance', 'class.random_instance')]
+    for cls in (QueryComponent, *_subclasses(QueryComponent), MetaQuery):
+        if 'satisfies' in cls.__dict__:
+            res.append((cls, 'satisfies', _query_name))
+    return res
+
+
+instrumentation = Instrumentation()
+enable = instrumentation.enable
+disable = instrumentation.disable
+reset = instrumentation.reset
+snapshot = instrumentation.snapshot
+prometheus_text = instrumentation.prometheus_text
+timed = instrumentation.timed
+count = instrumentation.count
@@ -0,0 +1,248 @@
+"""
+Incremental integrity scanning of associations.  An IntegrityScanner walks
+the associations of a MemoryDBI or WorkingContext in a fixed order, a
+chunk at a time, checks the objects and tag, group and role metas each
+chunk refers to in bulk and reports or removes the orphans, associations
+referring to something that no longer exists.  Between chunks it sleeps
+to stay within its busy time budget and records its position in a
+checkpoint so an interrupted scan resumes where it stopped.
+"""
+import json
+import os
+import time
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from uopmeta.cascade import assoc_record
+
+_kind_order = ('tagged', 'grouped', 'related')
+_meta_kinds = dict(tagged='tags', grouped='groups', related='roles')
+
+
+def position(key):
+    """
+    Scan order of an association key: by kind, association id, then for
+    related by subject and object and otherwise by object.
+    """
+    kind, assoc_id, object_id, subject_id = key
+    if kind == 'related':
+        return [2, assoc_id, subject_id, object_id]
+    return [_kind_order.index(kind), assoc_id, object_id, '']
+
+
+def _after(items, value, inclusive):
+    return (bisect_right if inclusive else bisect_left)(items, value)
+
+
+def _dbi_keys(dbi, after=None):
+    after = list(after) if after else [-1, '', '', '']
+    for n, kind in enumerate(_kind_order[:2]):
+        if n < after[0]:
+            continue
+        assoc_sets = dbi.tagsets if kind == 'tagged' else dbi.groupsets
+        assoc_ids = sorted(assoc_sets)
+        same = n == after[0]
+        for assoc_id in assoc_ids[_after(assoc_ids, after[1], False) if same else 0:]:
+            obj_ids = dbi.sorted_assoc_ids(kind, assoc_id)
+            start = _after(obj_ids, after[2], True) if same and assoc_id == after[1] else 0
+            for obj_id in obj_ids[start:]:
+                yield kind, assoc_id, obj_id, None
+    forward = dbi.relations.forward
+    role_ids = sorted(forward)
+    same = after[0] == 2
+    for role_id in role_ids[_after(role_ids, after[1], False) if same else 0:]:
+        by_subject = forward.get(role_id, {})
+        subject_ids = sorted(by_subject)
+        on_role = same and role_id == after[1]
+        for subject_id in subject_ids[_after(subject_ids, after[2], False) if on_role else 0:]:
+            object_ids = sorted(by_subject.get(subject_id, ()))
+            start = _after(object_ids, after[3], True) \
+                if on_role and subject_id == after[2] else 0
+            for object_id in object_ids[start:]:
+                yield 'related', role_id, object_id, subject_id
+
+
+def _group_position(group):
+    return [_kind_order.index(group[0]), group[1]]
+
+
+def _context_keys(context, after=None):
+    """
+    Keys of the associations of context in scan order.  Only the keys of
+    one association id at a time are sorted, taken from the association
+    index the context keeps.
+    """
+    groups = sorted(context.association_index().by_assoc, key=_group_position)
+    if after:
+        # resume in the group of after, past it
+        groups = groups[bisect_left([_group_position(g) for g in groups], list(after[:2])):]
+    for group in groups:
+        keys = sorted(context.association_index().by_assoc.get(group, ()), key=position)
+        start = bisect_right([position(k) for k in keys], list(after)) if after else 0
+        yield from keys[start:]
+
+
+class IntegrityScanner:
+    def __init__(self, source, chunk_size=1000, budget=1.0, repair=False,
+                 checkpoint_path=None, max_reported=1000, sleep=time.sleep):
+        """
+        :param source: MemoryDBI or WorkingContext to scan
+        :param chunk_size: associations checked per chunk
+        :param budget: fraction of wall time spent scanning, the rest sleeping
+        :param repair: remove orphans as they are found
+        :param checkpoint_path: json file the position is saved to after each
+        chunk and resumed from
+        :param max_reported: most orphans kept in the report
+        """
+        self.source = source
+        self.is_dbi = hasattr(source, 'remove_association')
+        self.chunk_size = chunk_size
+        self.budget = budget
+        self.repair = repair
+        self.checkpoint_path = checkpoint_path
+        self.max_reported = max_reported
+        self.sleep = sleep
+        self.state = dict(after=None, scanned=0, orphans={}, repaired=0, pending=[], done=False)
+        self.reported = []
+        self._keys = None
+        self._instance_ids = None
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                self.state = json.load(f)
+
+    @property
+    def done(self):
+        return self.state['done']
+
+    def save_checkpoint(self):
+        if self.checkpoint_path:
+            temp = self.checkpoint_path + '.tmp'
+            with open(temp, 'w') as f:
+                json.dump(self.state, f)
+            os.replace(temp, self.checkpoint_path)
+
+    def _existing_objects(self, obj_ids):
+        if self.is_dbi:
+            return self.source.existing_ids(obj_ids)
+        if self._instance_ids is None:
+            self._instance_ids = {o['id'] for o in self.source.instances}
+        return {i for i in obj_ids if i in self._instance_ids}
+
+    def _meta_context(self):
+        return self.source.meta_context if self.is_dbi else self.source
+
+    def check(self, keys):
+        """
+        :return: (key, reason) for each orphan among the association keys
+        """
+        context = self._meta_context()
+        groups = context.by_id('groups')
+        # groups contain groups as well as objects
+        is_subgroup = lambda kind, object_id: kind == 'grouped' and object_id in groups
+        obj_ids = set()
+        for kind, _, object_id, subject_id in keys:
+            if not is_subgroup(kind, object_id):
+                obj_ids.add(object_id)
+            if subject_id is not None:
+                obj_ids.add(subject_id)
+        live = self._existing_objects(obj_ids)
+        res = []
+        for key in keys:
+            kind, assoc_id, object_id, subject_id = key
+            meta_kind = _meta_kinds[kind]
+            if assoc_id not in context.by_id(meta_kind):
+                res.append((key, f'missing {meta_kind}'))
+            elif object_id not in live and not is_subgroup(kind, object_id):
+                res.append((key, 'missing object'))
+            elif subject_id is not None and subject_id not in live:
+                res.append((key, 'missing subject'))
+        return res
+
+    def _remove(self, keys):
+        """
+        Removes orphans from a dbi at once.  Those of a context wait in the
+        checkpointed state until enough of them make a pass over its lists
+        worthwhile, see flush.
+        """
+        if self.is_dbi:
+            for key in keys:
+                self.source.remove_association(assoc_record(key))
+            self.state['repaired'] += len(keys)
+            return
+        pending = self.state.setdefault('pending', [])
+        pending.extend(keys)
+        held = sum(len(getattr(self.source, kind)) for kind in _kind_order)
+        if len(pending) >= max(self.chunk_size, held // 8):
+            self.flush()
+
+    def flush(self):
+        """
+        Removes the orphans of a context found so far in one pass.
+        """
+        pending = self.state.get('pending')
+        if pending:
+            removed = self.source.remove_associations({tuple(key) for key in pending})
+            self.state['repaired'] += sum(removed.values())
+            self.state['pending'] = []
+            self.save_checkpoint()
+
+    def scan_chunk(self):
+        """
+        Checks the next chunk.
+        :return: orphans found in it, None when the scan is complete
+        """
+        if self.done:
+            return None
+        if self._keys is None:
+            after = self.state['after']
+            self._keys = _dbi_keys(self.source, after) if self.is_dbi \
+                else _context_keys(self.source, after)
+        chunk = list(islice(self._keys, self.chunk_size))
+        if not chunk:
+            self.flush()
+            self.state['done'] = True
+            self.save_checkpoint()
+            return None
+        orphans = self.check(chunk)
+        state = self.state
+        for key, reason in orphans:
+            state['orphans'][reason] = state['orphans'].get(reason, 0) + 1
+            if len(self.reported) < self.max_reported:
+                self.reported.append((key, reason))
+        if self.repair and orphans:
+            self._remove([key for key, _ in orphans])
+        state['scanned'] += len(chunk)
+        state['after'] = position(chunk[-1])
+        self.save_checkpoint()
+        return orphans
+
+    def run(self, max_chunks=None, max_seconds=None):
+        """
+        Scans chunk after chunk, throttled to the budget, until done or
+        max_chunks chunks or max_seconds have passed.
+        :return: report of the scan so far
+        """
+        started = time.monotonic()
+        chunks = 0
+        while not self.done:
+            if max_chunks is not None and chunks >= max_chunks:
+                break
+            if max_seconds is not None and time.monotonic() - started >= max_seconds:
+                break
+            busy = time.monotonic()
+            self.scan_chunk()
+            chunks += 1
+            busy = time.monotonic() - busy
+            if self.budget < 1.0 and not self.done:
+                self.sleep(busy * (1 / self.budget - 1))
+        self.flush()
+        return self.report()
+
+    def report(self):
+        return dict(self.state, reported=list(self.reported))
+
+    def reset(self):
+        self.state = dict(after=None, scanned=0, orphans={}, repaired=0, pending=[], done=False)
+        self.reported = []
+        self._keys = None
+        self._instance_ids = None
+        self.save_checkpoint()
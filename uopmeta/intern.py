@@ -0,0 +1,280 @@
+"""
+Dense integer surrogates for meta and object ids.  An IdInterner keeps
+one canonical string per id, sys.intern'ed so metas share it too, and
+numbers ids densely in the order first seen.  Structures holding many
+ids keep the surrogates and translate to and from strings only at their
+interface:
+
+- an ObjectTable holds objects in a list indexed by the surrogates of
+  their ids,
+- a SurrogateDict holds its entries under surrogates, a SurrogateSet
+  holds surrogates,
+- an InternedRelationIndex is a RelationIndex over surrogates.
+
+A MemoryDBI created with intern_ids=True keeps its objects, class, tag
+and group sets, Bloom filters and relations in these, so they read as
+the plain dicts and sets keyed by id.
+
+Surrogates are never reused, so the interner holds every id it has seen
+until it is dropped.
+"""
+import sys
+from itertools import compress
+from collections.abc import Mapping, MutableMapping, MutableSet
+from uopmeta.graph import RelationIndex, _add_to, _remove_from, _neighbors
+
+
+class IdInterner:
+    def __init__(self):
+        self.ids = {}  # canonical string -> surrogate
+        self.strings = []  # surrogate -> canonical string
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __contains__(self, an_id):
+        return an_id in self.ids
+
+    def surrogate(self, an_id):
+        """
+        :return: the surrogate of an_id, assigning the next one if it is new
+        """
+        res = self.ids.get(an_id)
+        if res is None:
+            an_id = sys.intern(an_id)
+            res = self.ids[an_id] = len(self.strings)
+            self.strings.append(an_id)
+        return res
+
+    def get(self, an_id):
+        """
+        :return: the surrogate of an_id or None if it was never seen
+        """
+        return self.ids.get(an_id)
+
+    def string(self, surrogate):
+        return self.strings[surrogate]
+
+    def canonical(self, an_id):
+        """
+        :return: the canonical string equal to an_id
+        """
+        return self.strings[self.surrogate(an_id)]
+
+    def encode(self, ids):
+        """
+        :return: set of the surrogates of those of ids that were seen
+        """
+        res = set(map(self.ids.get, ids))
+        res.discard(None)
+        return res
+
+    def decode(self, surrogates):
+        return set(map(self.strings.__getitem__, surrogates))
+
+
+class ObjectTable(MutableMapping):
+    """
+    Objects by id held in a list indexed by the surrogates of their ids.
+    """
+
+    def __init__(self, interner):
+        self.interner = interner
+        self.slots = []
+        self.count = 0
+
+    def get(self, an_id, default=None):
+        try:
+            obj = self.slots[self.interner.ids.get(an_id)]
+        except (IndexError, TypeError):
+            # an id never seen or seen after the last object added
+            return default
+        return default if obj is None else obj
+
+    def __getitem__(self, an_id):
+        obj = self.get(an_id)
+        if obj is None:
+            raise KeyError(an_id)
+        return obj
+
+    def __contains__(self, an_id):
+        return self.get(an_id) is not None
+
+    def __setitem__(self, an_id, obj):
+        surrogate = self.interner.surrogate(an_id)
+        slots = self.slots
+        if surrogate >= len(slots):
+            slots.extend([None] * (surrogate + 1 - len(slots)))
+        self.count += slots[surrogate] is None
+        slots[surrogate] = obj
+
+    def __delitem__(self, an_id):
+        if an_id not in self:
+            raise KeyError(an_id)
+        self.slots[self.interner.ids[an_id]] = None
+        self.count -= 1
+
+    def __iter__(self):
+        # objects are never empty so a slot is true exactly when it is used
+        return compress(self.interner.strings, self.slots)
+
+    def __len__(self):
+        return self.count
+
+    def values(self):
+        return list(filter(None, self.slots))
+
+
+class SurrogateSet(MutableSet):
+    """
+    Set of ids held as their surrogates.
+    """
+    __slots__ = ('interner', 'surrogates')
+
+    def __init__(self, interner, ids=()):
+        self.interner = interner
+        self.surrogates = set()
+        for an_id in ids:
+            self.add(an_id)
+
+    def _from_iterable(self, ids):
+        return set(ids)
+
+    def __contains__(self, an_id):
+        surrogate = self.interner.ids.get(an_id)
+        return surrogate is not None and surrogate in self.surrogates
+
+    def __iter__(self):
+        return map(self.interner.strings.__getitem__, self.surrogates)
+
+    def __len__(self):
+        return len(self.surrogates)
+
+    def __repr__(self):
+        return f'SurrogateSet({set(self)!r})'
+
+    def add(self, an_id):
+        self.surrogates.add(self.interner.surrogate(an_id))
+
+    def discard(self, an_id):
+        surrogate = self.interner.ids.get(an_id)
+        if surrogate is not None:
+            self.surrogates.discard(surrogate)
+
+
+class SurrogateDict(MutableMapping):
+    """
+    Dict by id holding its entries under the surrogates of the ids.  With
+    a default_factory a missing id read by [] gets a new entry, as with
+    defaultdict.
+    """
+
+    def __init__(self, interner, default_factory=None):
+        self.interner = interner
+        self.default_factory = default_factory
+        self.data = {}
+
+    def __getitem__(self, an_id):
+        surrogate = self.interner.ids.get(an_id)
+        if surrogate is not None and surrogate in self.data:
+            return self.data[surrogate]
+        if self.default_factory is None:
+            raise KeyError(an_id)
+        res = self.data[self.interner.surrogate(an_id)] = self.default_factory()
+        return res
+
+    def get(self, an_id, default=None):
+        surrogate = self.interner.ids.get(an_id)
+        return self.data.get(surrogate, default) if surrogate is not None else default
+
+    def __contains__(self, an_id):
+        surrogate = self.interner.ids.get(an_id)
+        return surrogate is not None and surrogate in self.data
+
+    def __setitem__(self, an_id, value):
+        self.data[self.interner.surrogate(an_id)] = value
+
+    def __delitem__(self, an_id):
+        surrogate = self.interner.ids.get(an_id)
+        if surrogate is None or surrogate not in self.data:
+            raise KeyError(an_id)
+        del self.data[surrogate]
+
+    def __iter__(self):
+        return map(self.interner.strings.__getitem__, self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class DecodedMap(Mapping):
+    """
+    Read only view by id of a dict keyed by surrogates, nested depth
+    dicts deep, whose innermost values are sets of surrogates decoded as
+    they are read.
+    """
+
+    def __init__(self, data, interner, depth=1):
+        self.data = data
+        self.interner = interner
+        self.depth = depth
+
+    def __getitem__(self, an_id):
+        surrogate = self.interner.ids.get(an_id)
+        value = self.data.get(surrogate) if surrogate is not None else None
+        if value is None:
+            raise KeyError(an_id)
+        if self.depth > 1:
+            return DecodedMap(value, self.interner, self.depth - 1)
+        return self.interner.decode(value)
+
+    def __iter__(self):
+        return map(self.interner.strings.__getitem__, self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class InternedRelationIndex(RelationIndex):
+    """
+    RelationIndex keyed by surrogates.  forward and backward are views by
+    id of the surrogate adjacency maps.
+    """
+
+    def __init__(self, interner=None):
+        super().__init__()
+        self.interner = interner or IdInterner()
+        self.surrogate_forward = {}
+        self.surrogate_backward = {}
+        self.forward = DecodedMap(self.surrogate_forward, self.interner, 2)
+        self.backward = DecodedMap(self.surrogate_backward, self.interner, 2)
+
+    def add_edge(self, subject_id, role_id, object_id):
+        surrogate = self.interner.surrogate
+        subject, role, obj = surrogate(subject_id), surrogate(role_id), surrogate(object_id)
+        if _add_to(self.surrogate_forward, role, subject, obj):
+            _add_to(self.surrogate_backward, role, obj, subject)
+            self.num_edges += 1
+            return True
+        return False
+
+    def remove_edge(self, subject_id, role_id, object_id):
+        get = self.interner.get
+        subject, role, obj = get(subject_id), get(role_id), get(object_id)
+        if None in (subject, role, obj):
+            return False
+        if _remove_from(self.surrogate_forward, role, subject, obj):
+            _remove_from(self.surrogate_backward, role, obj, subject)
+            self.num_edges -= 1
+            return True
+        return False
+
+    def neighbors(self, node_ids, role_id=None, reverse=False):
+        role = None
+        if role_id is not None:
+            role = self.interner.get(role_id)
+            if role is None:
+                return set()
+        adjacency = self.surrogate_backward if reverse else self.surrogate_forward
+        return self.interner.decode(
+            _neighbors(adjacency, self.interner.encode(node_ids), role))
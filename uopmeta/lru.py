@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from threading import RLock
+
+_missing = object()
+
+
+class LRUCache:
+    """
+    Least recently used cache bounded by number of entries and optionally by
+    total size, where the size of an entry is given by the sizeof function.
+    Keeps hit, miss and eviction counts.
+    """
+
+    def __init__(self, maxsize=1024, max_bytes=None, sizeof=None, on_evict=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda key, value: 1)
+        self.on_evict = on_evict
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self.entries.get(key, _missing)
+            if value is _missing:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(key, value)
+        with self._lock:
+            if key in self.entries:
+                self._discard(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return value
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.total_size += size
+            self._shrink()
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = self.put(key, compute())
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self.entries:
+                return default
+            return self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.total_size = 0
+
+    def _discard(self, key):
+        value = self.entries.pop(key)
+        self.total_size -= self.sizes.pop(key)
+        return value
+
+    def _over_budget(self):
+        if self.maxsize is not None and len(self.entries) > self.maxsize:
+            return True
+        return self.max_bytes is not None and self.total_size > self.max_bytes
+
+    def _shrink(self):
+        while self.entries and self._over_budget():
+            key = next(iter(self.entries))
+            value = self._discard(key)
+            self.evictions += 1
+            if self.on_evict:
+                self.on_evict(key, value)
+
+    def stats(self):
+        return dict(entries=len(self.entries), size=self.total_size,
+                    hits=self.hits, misses=self.misses,
+                    evictions=self.evictions)
@@ -0,0 +1,135 @@
+from collections import defaultdict
+from functools import lru_cache
+
+wildcard = '*'
+
+
+def _is_str(val):
+    return isinstance(val, str)
+
+
+@lru_cache(maxsize=4096)
+def compile_like(pattern):
+    """
+    Compiles a like pattern, where '*' matches any run of characters, into a
+    matcher function taking a value and returning whether it matches.
+    Compiled matchers are cached by pattern so each pattern is only
+    compiled once no matter how many components or evaluations use it.
+    """
+    parts = pattern.split(wildcard)
+    if len(parts) == 1:
+        return lambda val: val == pattern
+    prefix, suffix = parts[0], parts[-1]
+    middle = tuple(p for p in parts[1:-1] if p)
+    if not (prefix or suffix):
+        if not middle:
+            return _is_str
+        if len(middle) == 1:
+            part = middle[0]
+            return lambda val: _is_str(val) and (part in val)
+    min_len = len(prefix) + len(suffix) + sum(len(p) for p in middle)
+    start = len(prefix)
+
+    def matcher(val):
+        if not _is_str(val) or len(val) < min_len:
+            return False
+        if not (val.startswith(prefix) and val.endswith(suffix)):
+            return False
+        pos, end = start, len(val) - len(suffix)
+        for part in middle:
+            found = val.find(part, pos, end)
+            if found < 0:
+                return False
+            pos = found + len(part)
+        return True
+
+    return matcher
+
+
+def trigrams(s):
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def pattern_trigrams(pattern):
+    res = set()
+    for part in pattern.split(wildcard):
+        res |= trigrams(part)
+    return res
+
+
+class TrigramIndex:
+    """
+    Index from character trigrams of string values to the ids of the objects
+    holding them.  Like patterns are answered by intersecting the postings of
+    the pattern's trigrams and verifying the remaining candidates with the
+    compiled matcher.  Ids of objects whose value is not a string are kept
+    too, so the index knows every object having the attribute.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.values = {}
+        self.others = set()  # ids with values that are not strings
+
+    def __len__(self):
+        return len(self.values) + len(self.others)
+
+    def __contains__(self, obj_id):
+        return obj_id in self.values or obj_id in self.others
+
+    def ids(self):
+        """
+        :return: ids of every object having the attribute
+        """
+        return self.values.keys() | self.others
+
+    def add(self, obj_id, value):
+        if obj_id in self:
+            self.remove(obj_id)
+        if not _is_str(value):
+            self.others.add(obj_id)
+            return
+        self.values[obj_id] = value
+        for gram in trigrams(value):
+            self.postings[gram].add(obj_id)
+
+    def remove(self, obj_id):
+        self.others.discard(obj_id)
+        value = self.values.pop(obj_id, None)
+        if value is None:
+            return
+        for gram in trigrams(value):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(obj_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def candidates(self, pattern):
+        """
+        :param pattern: like pattern
+        :return: superset of the matching ids or None if the pattern has
+        no trigrams to narrow by
+        """
+        grams = pattern_trigrams(pattern)
+        if not grams:
+            return None
+        postings = sorted((self.postings.get(g, ()) for g in grams), key=len)
+        res = set(postings[0])
+        for ids in postings[1:]:
+            if not res:
+                break
+            res &= ids
+        return res
+
+    def search(self, pattern, obj_ids=None):
+        matcher = compile_like(pattern)
+        candidates = self.candidates(pattern)
+        if candidates is None:
+            candidates = self.values.keys()
+        if obj_ids is not None:
+            candidates = [i for i in candidates if i in obj_ids] \
+                if len(candidates) <= len(obj_ids) else \
+                [i for i in obj_ids if i in candidates]
+        values = self.values
+        return {i for i in candidates if i in values and matcher(values[i])}
@@ -0,0 +1,50 @@
+class MaterializedQuery:
+    """
+    Result set of a MetaQuery over a dbi kept current as the dbi reports
+    writes.  Each write is mapped by the query components' delta rules
+    (affected_ids) to the ids whose membership may have changed and only
+    those are re-evaluated.  Writes the rules cannot localize, such as
+    class hierarchy changes, recompute the result.
+    Results only contain ids of objects present in the dbi.
+    """
+
+    def __init__(self, query, dbi):
+        self.query = query
+        self.component = query.query
+        self.dbi = dbi
+        self.refreshes = 0
+        self.result = set()
+        self.refresh()
+        dbi.add_listener(self.on_change)
+
+    def __len__(self):
+        return len(self.result)
+
+    def __contains__(self, obj_id):
+        return obj_id in self.result
+
+    def ids(self):
+        return self.result
+
+    def count(self):
+        return len(self.result)
+
+    def _live(self, obj_ids):
+        get_object = self.dbi.get_object
+        return {i for i in obj_ids if get_object(i) is not None}
+
+    def refresh(self):
+        self.result = self._live(self.component.satisfies(self.dbi))
+        self.refreshes += 1
+
+    def on_change(self, change):
+        affected = self.component.affected_ids(self.dbi, change)
+        if affected is None:
+            self.refresh()
+        elif affected:
+            now = self.component.satisfies(self.dbi, self._live(affected))
+            self.result -= affected
+            self.result |= now
+
+    def close(self):
+        self.dbi.remove_listener(self.on_change)
@@ -0,0 +1,223 @@
+"""
+Memory accounting of MetaContexts and WorkingContexts.  memory_report
+breaks the bytes a context retains down by section: each meta kind,
+the class and group children indexes and stats, each association list
+and the instances of each class.
+
+The default estimate walks the objects reachable from each section and
+sums sys.getsizeof.  An object reachable from a single section is
+exclusive to it; one reachable from several, such as a meta referenced
+by name from another or an id string shared by associations, is shared
+and counted in the shared bytes of each.  Dropping a section frees
+about its exclusive bytes.
+
+With exact=True each section is instead rebuilt on its own from a
+pickled copy with tracemalloc tracing, which counts allocator overhead
+the estimate misses but duplicates anything the section shares.  It
+needs memory for a copy of the largest section while it runs and its
+total is the sum of the sections.
+"""
+import io
+import pickle
+import sys
+import tracemalloc
+import types
+from collections import defaultdict
+from pydantic import BaseModel
+from uopmeta.oid import oid_class
+from uopmeta.attr_info import meta_kinds, assoc_kinds
+
+_skipped = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+            types.MethodType, type(None), bool)
+_atoms = (str, bytes, int, float, complex)
+_shared = -1
+
+
+def _children(obj):
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            yield k
+            yield v
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        yield from obj
+    else:
+        if isinstance(obj, BaseModel):
+            yield obj.__fields_set__
+        attrs = getattr(obj, '__dict__', None)
+        if attrs is not None:
+            yield attrs
+        for slot in getattr(type(obj), '__slots__', ()):
+            value = getattr(obj, slot, None)
+            if value is not None:
+                yield value
+
+
+class _Walker:
+    """
+    Sizes objects reachable from sections, recording which sections
+    reach each.
+    """
+
+    def __init__(self, stop=()):
+        self.sizes = {}
+        self.owner = {}
+        self.sharing = {}
+        self.stop = {id(obj) for obj in stop}
+
+    def walk(self, section, roots):
+        seen = set(self.stop)
+        stack = list(roots)
+        while stack:
+            obj = stack.pop()
+            if isinstance(obj, _skipped):
+                continue
+            key = id(obj)
+            if key in seen:
+                continue
+            seen.add(key)
+            owner = self.owner.get(key)
+            if owner is None:
+                self.owner[key] = section
+                self.sizes[key] = sys.getsizeof(obj)
+            elif owner != section:
+                if owner != _shared:
+                    self.sharing[key] = {owner}
+                    self.owner[key] = _shared
+                self.sharing[key].add(section)
+            if not isinstance(obj, _atoms):
+                stack.extend(_children(obj))
+
+    def totals(self, sections):
+        exclusive = defaultdict(int)
+        shared = defaultdict(int)
+        for key, owner in self.owner.items():
+            if owner != _shared:
+                exclusive[owner] += self.sizes[key]
+        for key, owners in self.sharing.items():
+            for section in owners:
+                shared[section] += self.sizes[key]
+        return {s: dict(bytes=exclusive[s] + shared[s], exclusive=exclusive[s],
+                        shared=shared[s]) for s in sections}
+
+
+def deep_sizeof(*roots, exclude=()):
+    """
+    :param exclude: objects held elsewhere, nothing reachable from them is counted
+    :return: estimated bytes of the objects reachable from roots
+    """
+    excluded = _Walker()
+    excluded.walk(0, exclude)
+    walker = _Walker()
+    walker.stop = set(excluded.sizes)
+    walker.walk(0, roots)
+    return sum(walker.sizes.values())
+
+
+def _sections(context):
+    """
+    :return: (group, name, roots, count) of each section of context
+    """
+    res = []
+    for kind in meta_kinds:
+        by_name_id = getattr(context, kind)
+        res.append(('kinds', kind, [by_name_id], len(by_name_id.by_id)))
+    for name in ('class_children', 'group_children', 'stats'):
+        value = getattr(context, name, None)
+        if value is not None:
+            res.append(('indexes', name, [value], len(value) if hasattr(value, '__len__') else 1))
+    for kind in assoc_kinds:
+        items = getattr(context, kind, None)
+        if items is not None:
+            res.append(('associations', kind, [items], len(items)))
+    instances = getattr(context, 'instances', None)
+    if instances:
+        by_class = defaultdict(list)
+        classes = context.classes.by_id
+        for obj in instances:
+            cls_id = oid_class(obj['id']) if obj.get('id') else None
+            cls = classes.get(cls_id)
+            by_class[cls.name if cls else cls_id].append(obj)
+        for name, objs in sorted(by_class.items(), key=lambda kv: str(kv[0])):
+            res.append(('instances', name, objs, len(objs)))
+    return res
+
+
+def _estimate(context, sections):
+    # back references to the context, as from stats, are not followed
+    walker = _Walker(stop=[context])
+    keys = []
+    for n, (group, name, roots, count) in enumerate(sections):
+        walker.walk(n, roots)
+        keys.append(n)
+    totals = walker.totals(keys)
+    # containers holding the sections, such as the context's own dict
+    walker.stop.clear()
+    walker.walk(len(sections), [context])
+    total = sum(walker.sizes.values())
+    return [totals[n] for n in keys], total
+
+
+class _Pickler(pickle.Pickler):
+    def __init__(self, file, context):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.context = context
+
+    def persistent_id(self, obj):
+        return 'context' if obj is self.context else None
+
+
+class _Unpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        return None
+
+
+def _exact(context, sections):
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        res = []
+        for group, name, roots, count in sections:
+            data = io.BytesIO()
+            _Pickler(data, context).dump(roots)
+            data.seek(0)
+            before = tracemalloc.get_traced_memory()[0]
+            copy = _Unpickler(data).load()
+            size = tracemalloc.get_traced_memory()[0] - before
+            del copy, data
+            res.append(dict(bytes=size, exclusive=size, shared=0))
+    finally:
+        if started:
+            tracemalloc.stop()
+    return res, sum(s['bytes'] for s in res)
+
+
+def memory_report(context, exact=False):
+    """
+    :param context: MetaContext or WorkingContext
+    :param exact: measure rebuilt copies with tracemalloc instead of estimating
+    :return: dict of the total bytes and, by group and section, the bytes,
+    exclusive and shared bytes and item count of each section
+    """
+    sections = _sections(context)
+    sizes, total = (_exact if exact else _estimate)(context, sections)
+    report = dict(mode='tracemalloc' if exact else 'estimate', total=total,
+                  kinds={}, indexes={}, associations={}, instances={})
+    for (group, name, roots, count), size in zip(sections, sizes):
+        report[group][name] = dict(size, count=count)
+    report['exclusive'] = sum(s['exclusive'] for s in sizes)
+    return report
+
+
+def format_report(report, top=None):
+    """
+    :return: the report as lines of text, largest sections first
+    """
+    rows = [(f'{group}.{name}', s) for group in ('kinds', 'indexes', 'associations', 'instances')
+            for name, s in report[group].items()]
+    rows.sort(key=lambda r: -r[1]['bytes'])
+    lines = [f'{report["mode"]} total {report["total"]:,} bytes']
+    for name, s in rows[:top]:
+        lines.append(f'{name:40} {s["count"]:>10,} {s["bytes"]:>14,} '
+                     f'{s["exclusive"]:>14,} {s["shared"]:>14,}')
+    return lines
@@ -0,0 +1,404 @@
+import asyncio
+from collections import defaultdict
+from functools import partial
+from uopmeta.oid import oid_class
+from uopmeta.matching import TrigramIndex
+from uopmeta.indexes import ValueIndex
+from uopmeta.graph import RelationIndex
+from uopmeta.bloom import CountingBloomFilter
+from uopmeta.intern import (
+    IdInterner, ObjectTable, SurrogateDict, SurrogateSet, InternedRelationIndex)
+from uopmeta.schemas.meta import (
+    MetaContext, WorkingContext, NameWithId, Associated, attribute_value, as_meta)
+
+
+class Change:
+    """
+    A write seen by MemoryDBI listeners.
+    kind is 'objects', an association kind or a meta kind, op is 'insert'
+    or 'delete' and record the object dict, association or meta object.
+    """
+    __slots__ = ('kind', 'op', 'record')
+
+    def __init__(self, kind, op, record):
+        self.kind = kind
+        self.op = op
+        self.record = record
+
+    def __repr__(self):
+        return f'Change({self.kind}, {self.op}, {self.record!r})'
+
+
+class MemoryDBI:
+    """
+    In memory stand in for a uop database interface.  Holds object
+    instances and their tagged, grouped and related associations for a
+    MetaContext together with the indexes query components can make use of.
+    """
+
+    def __init__(self, meta_context: MetaContext = None, intern_ids=False):
+        """
+        :param intern_ids: keep one canonical string per id and hold objects,
+        class, tag and group sets, Bloom filters and relations by dense
+        integer surrogates of the ids, see uopmeta.intern
+        """
+        self.meta_context = meta_context or MetaContext()
+        self.intern_ids = intern_ids
+        interner = self.interner = IdInterner() if intern_ids else None
+        id_sets = partial(SurrogateDict, interner, partial(SurrogateSet, interner)) \
+            if intern_ids else partial(defaultdict, set)
+        self.objects = ObjectTable(interner) if intern_ids else {}
+        self.class_ids = id_sets()
+        self.trigram_indexes = {}
+        self.value_indexes = {}
+        self.tagsets = id_sets()
+        self.groupsets = id_sets()
+        self.assoc_filters = {}  # (assoc kind, assoc id) -> CountingBloomFilter
+        self.relations = InternedRelationIndex(interner) if intern_ids else RelationIndex()
+        self.listeners = []
+        self.query_cache = None
+        self.stats = None
+        self.assoc_index = None
+        self.parallel_evaluator = None
+        self._sorted = {}
+
+    @classmethod
+    def from_context(cls, context: WorkingContext, **kwargs):
+        dbi = cls(context, **kwargs)
+        for obj in context.instances:
+            dbi.add_object(obj)
+        for assocs in (context.tagged, context.grouped, context.related):
+            for assoc in assocs:
+                dbi.add_association(assoc)
+        return dbi
+
+    def all_object_ids(self):
+        return set(self.objects)
+
+    def get_object(self, obj_id):
+        return self.objects.get(obj_id)
+
+    def existing_ids(self, obj_ids):
+        """
+        :return: the ids of obj_ids of objects held here
+        """
+        objects = self.objects
+        return {i for i in obj_ids if i in objects}
+
+    def class_instance_ids(self, cls_name):
+        cls = self.meta_context.classes.by_name.get(cls_name)
+        if cls is None:
+            return set()
+        return set(self.class_ids.get(cls.id, ()))
+
+    def _sorted_ids(self, key, ids):
+        known = self._sorted.get(key)
+        if known is None:
+            known = self._sorted[key] = sorted(ids)
+        return known
+
+    def sorted_object_ids(self):
+        return self._sorted_ids(('objects',), self.objects)
+
+    def sorted_class_instance_ids(self, cls_name):
+        cls = self.meta_context.classes.by_name.get(cls_name)
+        if cls is None:
+            return []
+        return self._sorted_ids(('classes', cls.id), self.class_ids.get(cls.id, ()))
+
+    def sorted_assoc_ids(self, assoc_kind, assoc_id):
+        assoc_sets = self.tagsets if assoc_kind == 'tagged' else self.groupsets
+        return self._sorted_ids((assoc_kind, assoc_id), assoc_sets.get(assoc_id, ()))
+
+    def get_tagset(self, tag_id):
+        return set(self.tagsets.get(tag_id, ()))
+
+    def get_groupset(self, group_id):
+        return set(self.groupsets.get(group_id, ()))
+
+    def relation_index(self):
+        return self.relations
+
+    def assoc_filter(self, assoc_kind, assoc_id):
+        """
+        :return: counting Bloom filter of the ids tagged or grouped with
+        assoc_id, as bloom_key gives them, or None if there are none
+        """
+        return self.assoc_filters.get((assoc_kind, assoc_id))
+
+    def bloom_key(self, obj_id):
+        """
+        :return: what Bloom filters hold for obj_id, its surrogate if ids
+        are interned
+        """
+        if self.interner is None:
+            return obj_id
+        return self.interner.get(obj_id)
+
+    def assoc_members(self, assoc_kind, assoc_id, obj_ids):
+        """
+        :return: the ids of obj_ids that are tagged or grouped with assoc_id
+        """
+        assoc_sets = self.tagsets if assoc_kind == 'tagged' else self.groupsets
+        members = assoc_sets.get(assoc_id, ())
+        return {i for i in obj_ids if i in members}
+
+    def add_listener(self, listener, first=False):
+        """
+        :param listener: function called with a Change after each write
+        :param first: call it before the listeners already added, as for
+        caches other listeners evaluate queries through
+        """
+        if first:
+            self.listeners.insert(0, listener)
+        else:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def enable_query_cache(self, **kwargs):
+        """
+        Attaches a QueryCache, kept consistent with writes made here, that
+        query components evaluated against this dbi share.
+        """
+        from uopmeta.query_cache import QueryCache
+        if self.query_cache is None:
+            QueryCache(**kwargs).attach(self)
+        return self.query_cache
+
+    def enable_stats(self, **kwargs):
+        """
+        Attaches a StatsCatalog counting what is held here as it changes.
+        """
+        from uopmeta.stats import StatsCatalog
+        if self.stats is None:
+            StatsCatalog(**kwargs).attach(self)
+        return self.stats
+
+    def enable_assoc_index(self):
+        """
+        Attaches an AssociationIndex, used by cascade deletes, kept current
+        with the associations held here.
+        """
+        from uopmeta.cascade import AssociationIndex
+        if self.assoc_index is None:
+            AssociationIndex().attach(self)
+        return self.assoc_index
+
+    def enable_parallel(self, **kwargs):
+        """
+        Keeps a ParallelEvaluator, with its worker processes, that
+        parallel_satisfies of query components against this dbi use.
+        """
+        from uopmeta.parallel import ParallelEvaluator
+        if self.parallel_evaluator is None:
+            self.parallel_evaluator = ParallelEvaluator(self, **kwargs)
+        return self.parallel_evaluator
+
+    def cascade_delete(self, deleted_objects=(), deleted_classes=(), **kwargs):
+        """
+        Removes the associations of deleted objects and of the instances of
+        deleted classes, see uopmeta.cascade.
+        """
+        from uopmeta.cascade import cascade_delete
+        return cascade_delete(self, deleted_objects, deleted_classes, **kwargs)
+
+    def _notify(self, kind, op, record):
+        if self.listeners:
+            change = Change(kind, op, record)
+            for listener in list(self.listeners):
+                listener(change)
+
+    def _assoc_sets(self, assoc: Associated):
+        if assoc.kind == 'tagged':
+            return self.tagsets
+        if assoc.kind == 'grouped':
+            return self.groupsets
+
+    def _add_association(self, assoc: Associated):
+        if assoc.kind == 'related':
+            return self.relations.add(assoc)
+        ids = self._assoc_sets(assoc)[assoc.assoc_id]
+        if assoc.object_id in ids:
+            return False
+        ids.add(assoc.object_id)
+        key = (assoc.kind, assoc.assoc_id)
+        bloom = self.assoc_filters.get(key)
+        if bloom is None or bloom.full:
+            self.assoc_filters[key] = CountingBloomFilter.of(map(self.bloom_key, ids))
+        else:
+            bloom.add(self.bloom_key(assoc.object_id))
+        return True
+
+    def _remove_association(self, assoc: Associated):
+        if assoc.kind == 'related':
+            return self.relations.remove(assoc)
+        assoc_sets = self._assoc_sets(assoc)
+        ids = assoc_sets.get(assoc.assoc_id)
+        if not ids or assoc.object_id not in ids:
+            return False
+        ids.discard(assoc.object_id)
+        key = (assoc.kind, assoc.assoc_id)
+        if not ids:
+            del assoc_sets[assoc.assoc_id]
+            self.assoc_filters.pop(key, None)
+        else:
+            self.assoc_filters[key].remove(self.bloom_key(assoc.object_id))
+        return True
+
+    def add_association(self, assoc: Associated):
+        added = self._add_association(assoc)
+        if added:
+            self._sorted.pop((assoc.kind, assoc.assoc_id), None)
+            self._notify(assoc.kind, 'insert', assoc)
+        return added
+
+    def remove_association(self, assoc: Associated):
+        removed = self._remove_association(assoc)
+        if removed:
+            self._sorted.pop((assoc.kind, assoc.assoc_id), None)
+            self._notify(assoc.kind, 'delete', assoc)
+        return removed
+
+    def add_meta(self, meta: NameWithId):
+        context = self.meta_context
+        if context.get_meta(meta.kind, meta.id) is not meta:
+            context.add(meta)
+        if meta.kind == 'classes':
+            context.class_children = {}
+        elif meta.kind == 'groups':
+            context.group_children = {}
+            context.complete_groups()
+        self._notify(meta.kind, 'insert', meta)
+
+    def remove_meta(self, meta: NameWithId):
+        context = self.meta_context
+        context.remove(meta)
+        if meta.kind == 'classes':
+            context.class_children = {}
+        elif meta.kind == 'groups':
+            context.group_children = {}
+            context.complete_groups()
+        self._notify(meta.kind, 'delete', meta)
+
+    def meta_insert(self, data):
+        """
+        Inserts a meta object or association given as a model or as a dict
+        carrying its kind.
+        """
+        if isinstance(data, dict):
+            data = dict(data)
+            data = as_meta(data.pop('kind'), data)
+        if isinstance(data, Associated):
+            return self.add_association(data)
+        return self.add_meta(data)
+
+    def add_object(self, obj: dict):
+        obj_id = obj['id']
+        if self.interner is not None:
+            obj_id = obj['id'] = self.interner.canonical(obj_id)
+        if obj_id in self.objects:
+            self.delete_object(obj_id)
+        self.objects[obj_id] = obj
+        self.class_ids[oid_class(obj_id)].add(obj_id)
+        self._objects_changed(obj_id)
+        for indexes in (self.trigram_indexes, self.value_indexes):
+            for attr_name, index in indexes.items():
+                self._index_object(index, attr_name, obj_id, obj)
+        self._notify('objects', 'insert', obj)
+
+    def delete_object(self, obj_id):
+        obj = self.objects.pop(obj_id, None)
+        if obj is None:
+            return
+        self.class_ids[oid_class(obj_id)].discard(obj_id)
+        self._objects_changed(obj_id)
+        for indexes in (self.trigram_indexes, self.value_indexes):
+            for index in indexes.values():
+                index.remove(obj_id)
+        self._notify('objects', 'delete', obj)
+        return obj
+
+    def _objects_changed(self, obj_id):
+        self._sorted.pop(('objects',), None)
+        self._sorted.pop(('classes', oid_class(obj_id)), None)
+
+    def _index_object(self, index, attr_name, obj_id, obj):
+        try:
+            index.add(obj_id, attribute_value(obj, attr_name))
+        except KeyError:
+            pass
+
+    def _build_index(self, indexes, attr_name, index_class):
+        index = indexes.get(attr_name)
+        if index is None:
+            index = indexes[attr_name] = index_class()
+            for obj_id, obj in self.objects.items():
+                self._index_object(index, attr_name, obj_id, obj)
+        return index
+
+    def index_trigrams(self, attr_name):
+        """
+        Builds and maintains a trigram index over the string values of the
+        named attribute.
+        """
+        return self._build_index(self.trigram_indexes, attr_name, TrigramIndex)
+
+    def trigram_index(self, attr_name):
+        return self.trigram_indexes.get(attr_name)
+
+    def index_values(self, attr_name):
+        """
+        Builds and maintains a value index over the named attribute, which
+        may be a path into a json attribute such as credentials.account.
+        """
+        return self._build_index(self.value_indexes, attr_name, ValueIndex)
+
+    def value_index(self, attr_name):
+        return self.value_indexes.get(attr_name)
+
+
+class AsyncMemoryDBI:
+    """
+    Asynchronous stand in for a networked dbi over a MemoryDBI.  Each read
+    costs latency seconds.  Counts calls and the most calls in flight at
+    once.
+    """
+
+    def __init__(self, dbi: MemoryDBI, latency=0.01):
+        self.dbi = dbi
+        self.meta_context = dbi.meta_context
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _read(self, fn, *args):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return fn(*args)
+        finally:
+            self.in_flight -= 1
+
+    async def all_object_ids(self):
+        return await self._read(self.dbi.all_object_ids)
+
+    async def get_object(self, obj_id):
+        return await self._read(self.dbi.get_object, obj_id)
+
+    async def class_instance_ids(self, cls_name):
+        return await self._read(self.dbi.class_instance_ids, cls_name)
+
+    async def get_tagset(self, tag_id):
+        return await self._read(self.dbi.get_tagset, tag_id)
+
+    async def get_groupset(self, group_id):
+        return await self._read(self.dbi.get_groupset, group_id)
+
+    async def relation_index(self):
+        return await self._read(self.dbi.relation_index)
@@ -0,0 +1,327 @@
+"""
+Parallel query evaluation.  A ParallelEvaluator keeps one process pool
+whose workers each hold a copy of the dbi: its objects, associations
+and metas.  Large attribute filters are split into chunks filtered by
+the workers and merged back.  A chunk carries only the component,
+compiled in the worker, and the ids it filters, or for a filter of
+every object just the bounds of a slice of the worker's sorted ids, so
+no objects cross between processes.
+
+Branches of and/or queries at every depth are started before any is
+waited on: every branch, class, tag, group and related components as
+well as attribute filters, goes to the pool and the workers evaluate
+them concurrently against their copies.  The filters of an and run once
+its sources are known.
+
+Writes to the dbi are collected as they are made and, before the next
+evaluation, pickled once onto the end of a log file the workers share.
+Each task carries the number of writes logged so far and its worker
+reads the log from where it left off up to that number, applying the
+writes before its work, so workers stay live across writes and each
+write crosses to them once.  Only when more than max_deltas writes were
+logged is the pool restarted from the current dbi, with a new log.
+Small candidate sets outside of branches and indexed attributes are
+evaluated in process as satisfies would.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import os
+import pickle
+import tempfile
+from uopmeta.attr_info import meta_kinds
+from uopmeta.cascade import assoc_kinds, assoc_record
+from uopmeta.memory_dbi import MemoryDBI
+from uopmeta.schemas.meta import MetaContext, AndQuery
+from uopmeta.streaming import is_filter
+
+_worker_dbi = None
+_worker_log = None
+_worker_version = 0
+
+
+def _init_worker(meta_context, objects, assoc_keys, log_path):
+    global _worker_dbi, _worker_log, _worker_version
+    _worker_dbi = MemoryDBI(meta_context)
+    for obj in objects:
+        _worker_dbi.add_object(obj)
+    for key in assoc_keys:
+        _worker_dbi.add_association(assoc_record(key))
+    _worker_log = open(log_path, 'rb')
+    _worker_version = 0
+
+
+def _apply(change):
+    dbi, record, insert = _worker_dbi, change.record, change.op == 'insert'
+    if change.kind == 'objects':
+        dbi.add_object(record) if insert else dbi.delete_object(record['id'])
+    elif change.kind in assoc_kinds:
+        (dbi.add_association if insert else dbi.remove_association)(record)
+    elif change.kind in meta_kinds:
+        (dbi.add_meta if insert else dbi.remove_meta)(record)
+
+
+def _task(version, work, *args):
+    """
+    Applies the writes logged up to version not applied yet, then does
+    the work.
+    """
+    global _worker_version
+    while _worker_version < version:
+        changes = pickle.load(_worker_log)
+        for change in changes:
+            _apply(change)
+        _worker_version += len(changes)
+    return work(*args)
+
+
+def _test_ids(component, obj_ids):
+    test = component.obj_eval()
+    get_object = _worker_dbi.objects.get
+    res = []
+    for obj_id in obj_ids:
+        obj = get_object(obj_id)
+        if not obj:
+            continue
+        try:
+            if test(obj):
+                res.append(obj_id)
+        except KeyError:
+            pass
+    return res
+
+
+def _test_slice(component, start, stop):
+    return _test_ids(component, _worker_dbi.sorted_object_ids()[start:stop])
+
+
+def _evaluate(component, obj_ids):
+    return component.satisfies(_worker_dbi, obj_ids)
+
+
+def _chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _done(result):
+    return lambda: result
+
+
+def _snapshot(dbi, log_path):
+    """
+    :return: arguments of _init_worker copying dbi
+    """
+    context = MetaContext()
+    for kind in meta_kinds:
+        context.load_objects(dbi.meta_context.metas_of_kind(kind))
+    context.complete()
+    keys = [(kind, assoc_id, obj_id, None)
+            for kind, assoc_sets in (('tagged', dbi.tagsets), ('grouped', dbi.groupsets))
+            for assoc_id, obj_ids in assoc_sets.items() for obj_id in obj_ids]
+    keys += [('related', role_id, object_id, subject_id)
+             for subject_id, role_id, object_id in dbi.relations.edges()]
+    return context, list(dbi.objects.values()), keys, log_path
+
+
+class ParallelEvaluator:
+    def __init__(self, dbi, max_workers=None, chunk_size=20000, min_parallel=50000,
+                 max_deltas=10000):
+        """
+        :param dbi: MemoryDBI whose objects are filtered
+        :param max_workers: worker processes, the number of cpus by default
+        :param chunk_size: ids per filter chunk
+        :param min_parallel: fewest candidates worth splitting into chunks
+        :param max_deltas: most writes logged for the workers to catch up
+        with before the pool is restarted instead
+        """
+        self.dbi = dbi
+        self.max_workers = max_workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.min_parallel = min_parallel
+        self.max_deltas = max_deltas
+        self.executor = None
+        self.log_path = None
+        self.version = 0  # writes logged since the workers' snapshot
+        self.unlogged = []  # writes not logged yet
+        self.restarts = 0
+        if hasattr(dbi, 'add_listener'):
+            dbi.add_listener(self.on_change)
+
+    def on_change(self, change):
+        if self.executor is None:
+            return
+        if change.kind == 'objects':
+            # workers get the object as it is now
+            change = type(change)(change.kind, change.op, dict(change.record))
+        self.unlogged.append(change)
+
+    def pool(self):
+        """
+        Logs the writes made since the last call for the workers to read,
+        or restarts the pool from the current dbi once more than max_deltas
+        writes were logged.
+        :return: the process pool
+        """
+        if self.executor is not None and self.unlogged:
+            if self.version + len(self.unlogged) > self.max_deltas:
+                self.restarts += 1
+                self._stop(wait=False)
+            else:
+                with open(self.log_path, 'ab') as log:
+                    pickle.dump(self.unlogged, log)
+                self.version += len(self.unlogged)
+                self.unlogged = []
+        if self.executor is None:
+            fd, self.log_path = tempfile.mkstemp(prefix='uopmeta_deltas_')
+            os.close(fd)
+            self.version = 0
+            self.unlogged = []
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=_init_worker,
+                initargs=_snapshot(self.dbi, self.log_path))
+        return self.executor
+
+    def _stop(self, wait=True):
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+        self.executor = None
+        os.unlink(self.log_path)
+        self.log_path = None
+
+    def close(self):
+        if hasattr(self.dbi, 'remove_listener'):
+            self.dbi.remove_listener(self.on_change)
+        if self.executor is not None:
+            self._stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def satisfies(self, component, obj_ids=None):
+        """
+        Parallel counterpart of component.satisfies(dbi, obj_ids).
+        """
+        self.pool()
+        return self._start(component, obj_ids)()
+
+    def _submit(self, work, *args):
+        return self.executor.submit(_task, self.version, work, *args)
+
+    def _start(self, component, obj_ids, branch=False):
+        """
+        Starts evaluating component.
+        :param branch: component is one of several evaluated together, so
+        worth sending to the pool whole
+        :return: function returning the result once it is done
+        """
+        kind = component.kind
+        if kind in ('and', 'or'):
+            return self._composite(component, obj_ids)
+        if kind == 'attribute':
+            return self._attribute(component, obj_ids, branch)
+        if branch:
+            return self._merge([self._submit(_evaluate, component, obj_ids)])
+        return _done(component.satisfies(self.dbi, obj_ids))
+
+    def _merge(self, futures):
+        def collect():
+            res = set()
+            for future in futures:
+                res.update(future.result())
+            return res
+        return collect
+
+    def _attribute(self, component, obj_ids, branch):
+        dbi = self.dbi
+        index_name = 'trigram_index' if component.operate in ('like', 'not_like') \
+            else 'value_index'
+        get_index = getattr(dbi, index_name, None)
+        if get_index and get_index(component.attr_name) is not None:
+            return _done(component.satisfies(dbi, obj_ids))
+        size = len(dbi.objects) if obj_ids is None else len(obj_ids)
+        if size < self.min_parallel:
+            if branch:
+                return self._merge([self._submit(_evaluate, component, obj_ids)])
+            return _done(component.satisfies(dbi, obj_ids))
+        if obj_ids is None:
+            futures = [self._submit(_test_slice, component, start, start + self.chunk_size)
+                       for start in range(0, size, self.chunk_size)]
+        else:
+            futures = [self._submit(_test_ids, component, chunk)
+                       for chunk in _chunks(obj_ids, self.chunk_size)]
+        return self._merge(futures)
+
+    def _composite(self, component, obj_ids):
+        dbi = self.dbi
+
+        def negate(res):
+            if not component.negated:
+                return set(res)
+            base = set(obj_ids) if obj_ids is not None else dbi.all_object_ids()
+            return base - res
+
+        if component.kind == 'or':
+            branch = len(component.components) > 1
+            started = [self._start(c, obj_ids, branch) for c in component.components]
+            return lambda: negate(set().union(*[collect() for collect in started]))
+        sources = [c for c in component.components if not is_filter(c)]
+        filters = [c for c in component.components if is_filter(c)]
+        if sources:
+            started = [self._start(c, obj_ids, len(sources) > 1) for c in sources]
+        elif filters:
+            started = [self._start(filters.pop(0), obj_ids)]
+        else:
+            started = []
+
+        def collect():
+            res = obj_ids
+            if started:
+                found = [set(collect()) for collect in started]
+                res = set.intersection(*found)
+            for child in filters:
+                if res is not None and not res:
+                    break
+                res = self._start(child, res)()
+            if res is None:
+                res = dbi.all_object_ids()
+            elif obj_ids is None and len(component.components) > 1:
+                res = self._without_objects(component, res, found[0] if sources else set())
+            return negate(res)
+        return collect
+
+    def _without_objects(self, component, res, first):
+        """
+        Serially the components of an and after the first see only the ids
+        it found.  Evaluated each from every object instead, they agree
+        except on ids without an object, such as related ids of deleted
+        objects, so those the first component found are evaluated serially.
+        :param first: ids found by the first component if a source
+        """
+        objects = self.dbi.objects
+        res = {i for i in res if i in objects}
+        if is_filter(component.components[0]):
+            return res
+        missing = {i for i in first if i not in objects}
+        if missing:
+            rest = AndQuery(components=component.components[1:])
+            res |= rest.satisfies(self.dbi, missing)
+        return res
+
+
+def parallel_satisfies(component, dbi, obj_ids=None, evaluator=None, **kwargs):
+    """
+    Parallel counterpart of component.satisfies(dbi, obj_ids).
+    :param evaluator: ParallelEvaluator of dbi, by default that of
+    dbi.enable_parallel or else one made for this call
+    """
+    evaluator = evaluator or getattr(dbi, 'parallel_evaluator', None)
+    if evaluator is not None:
+        return evaluator.satisfies(component, obj_ids)
+    with ParallelEvaluator(dbi, **kwargs) as evaluator:
+        return evaluator.satisfies(component, obj_ids)
@@ -0,0 +1,90 @@
+from collections import defaultdict
+from uopmeta.lru import LRUCache
+from uopmeta.schemas.meta import change_tokens
+
+
+class QueryCache:
+    """
+    Size bounded LRU cache of query component results keyed by the
+    component's canonical form.  Each entry records the dependency tokens
+    of its component (class, tag, group and role ids and object writes)
+    and writes reported by the dbi invalidate only the entries depending
+    on what they changed.  Cached results are shared frozensets.
+    """
+
+    def __init__(self, maxsize=1024, max_ids=10_000_000):
+        self.cache = LRUCache(maxsize=maxsize, max_bytes=max_ids,
+                              sizeof=lambda key, value: len(value) + 1,
+                              on_evict=self._forget)
+        self.dependents = defaultdict(set)  # token -> keys
+        self.key_tokens = {}
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.cache)
+
+    def attach(self, dbi):
+        dbi.query_cache = self
+        # invalidate before listeners such as MaterializedQuery re-evaluate
+        dbi.add_listener(self.on_change, first=True)
+        return self
+
+    def detach(self, dbi):
+        dbi.remove_listener(self.on_change)
+        if getattr(dbi, 'query_cache', None) is self:
+            dbi.query_cache = None
+
+    def _forget(self, key, value=None):
+        for token in self.key_tokens.pop(key, ()):
+            keys = self.dependents.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.dependents[token]
+
+    def lookup(self, component):
+        return self.cache.get(component.canonical_key())
+
+    def satisfies(self, component, dbi, obj_ids=None):
+        """
+        Result of component.satisfies(dbi, obj_ids).  Full results are
+        cached and candidate sets are filtered against a cached full result
+        when there is one.
+        """
+        key = component.canonical_key()
+        res = self.cache.get(key)
+        if res is None:
+            if obj_ids is not None:
+                return component.satisfies(dbi, obj_ids)
+            res = frozenset(component.satisfies(dbi))
+            self.cache.put(key, res)
+            if key in self.cache:
+                tokens = component.dependencies(dbi.meta_context)
+                self.key_tokens[key] = tokens
+                for token in tokens:
+                    self.dependents[token].add(key)
+        if obj_ids is None:
+            return res
+        return res.intersection(obj_ids)
+
+    def invalidate(self, tokens):
+        keys = set()
+        for token in tokens:
+            keys |= self.dependents.get(token, set())
+        for key in keys:
+            self.cache.pop(key)
+            self._forget(key)
+        self.invalidations += len(keys)
+
+    def on_change(self, change):
+        self.invalidate(change_tokens(change))
+
+    def clear(self):
+        self.cache.clear()
+        self.dependents.clear()
+        self.key_tokens.clear()
+
+    def stats(self):
+        res = self.cache.stats()
+        res['invalidations'] = self.invalidations
+        return res
@@ -0,0 +1,267 @@
+"""
+Algebraic rewriting of query components into a normal form before any
+data is touched:
+
+- negation is pushed down to the leaves by De Morgan, negating classes by
+  their positive flag and tags and groups by reverse_application
+- nested and/or of the same kind are flattened and duplicates removed
+- tags and groups components with the same application are merged and
+  comparisons on one attribute collapse to the tightest interval
+- contradictions become the empty query, an or with no components, and
+  tautologies the full query, an and with no components
+
+Objects lacking an attribute satisfy neither a comparison nor its
+reverse, so a negated attribute component is not its reverse comparison.
+It stays a negated and of the component alone, which keeps those objects.
+"""
+from uopmeta.schemas.enums import AssocsRequired
+from uopmeta.schemas.meta import (
+    AndQuery, OrQuery, CompositeQuery, AttributeComponent, AssociatedComponent)
+
+
+def false_query():
+    return OrQuery(components=[])
+
+
+def true_query():
+    return AndQuery(components=[])
+
+
+def is_false(component):
+    return component.kind == 'or' and not component.components and not component.negated
+
+
+def is_true(component):
+    return component.kind == 'and' and not component.components and not component.negated
+
+
+def negate(component):
+    if component.kind in ('and', 'or', 'related'):
+        return component.copy(update=dict(negated=not component.negated))
+    if isinstance(component, AttributeComponent):
+        return AndQuery(components=[component], negated=True)
+    return component.negated()
+
+
+def is_negated_leaf(component):
+    return component.kind == 'and' and component.negated and len(component.components) == 1 \
+        and isinstance(component.components[0], AttributeComponent)
+
+
+def push_negation(component, negating=False):
+    """
+    :return: equivalent of component, negated if negating, without negated
+    and/or components other than negated attribute components
+    """
+    if isinstance(component, CompositeQuery):
+        negating = negating != component.negated
+        children = [push_negation(c, negating) for c in component.components]
+        is_and = component.kind == 'and'
+        cls = AndQuery if is_and != negating else OrQuery
+        return cls(components=children)
+    if negating:
+        negated = negate(component)
+        if isinstance(negated, CompositeQuery) and not is_negated_leaf(negated):
+            return push_negation(negated)
+        return negated
+    return component
+
+
+def _dedupe(components):
+    seen = set()
+    res = []
+    for component in components:
+        key = component.canonical_key()
+        if key not in seen:
+            seen.add(key)
+            res.append(component)
+    return res
+
+
+def _complementary(components):
+    """
+    True if components hold a leaf and its negation.  The reverse
+    comparison of an attribute component is not its negation.
+    """
+    keys = {c.canonical_key() for c in components}
+    for component in components:
+        if isinstance(component, CompositeQuery):
+            continue
+        negated = negate(component)
+        if (is_negated_leaf(negated) or not isinstance(negated, CompositeQuery)) and \
+                negated.canonical_key() in keys:
+            return True
+    return False
+
+
+def _merge_associated(components, is_and):
+    """
+    In an and, all of some names and all of others is all of both and the
+    same for none.  In an or, any of some names or any of others is any of
+    both.  A single name is all of it in an and and any of it in an or.
+    """
+    mergeable = ('all', 'none') if is_and else ('any',)
+    single = AssocsRequired.all if is_and else AssocsRequired.any
+    merged = {}
+    res = []
+    for component in components:
+        if not isinstance(component, AssociatedComponent):
+            res.append(component)
+            continue
+        if len(component.names) == 1 and component.application != 'none':
+            component = component.copy(update=dict(application=single))
+        if component.application not in mergeable:
+            res.append(component)
+            continue
+        key = (component.kind, component.application,
+               getattr(component, 'include_subgroups', None))
+        known = merged.get(key)
+        if known is None:
+            merged[key] = component.copy(update=dict(names=list(component.names)))
+            res.append(merged[key])
+        else:
+            known.names = sorted(set(known.names) | set(component.names))
+    for component in merged.values():
+        component.names = sorted(set(component.names))
+    return res
+
+
+def _associated_contradiction(components):
+    by_kind = {}
+    for component in components:
+        if isinstance(component, AssociatedComponent):
+            key = (component.kind, getattr(component, 'include_subgroups', None))
+            apps = by_kind.setdefault(key, dict(all=set(), none=set()))
+            if component.application in apps:
+                apps[component.application] |= set(component.names)
+    return any(apps['all'] & apps['none'] for apps in by_kind.values())
+
+
+_lower = {'>': False, '>=': True}
+_upper = {'<': False, '<=': True}
+
+
+def _tighter(bound, other, lower):
+    value, inclusive = bound
+    o_value, o_inclusive = other
+    if o_value == value:
+        return (value, inclusive and o_inclusive)
+    return other if (o_value > value) == lower else bound
+
+
+def _interval(comparisons):
+    """
+    :param comparisons: attribute components comparing one attribute
+    :return: equivalent components, None if they contradict each other
+    """
+    low = high = None
+    equal = []
+    for c in comparisons:
+        bound = (c.value, _lower.get(c.operate, _upper.get(c.operate)))
+        if c.operate in _lower:
+            low = bound if low is None else _tighter(low, bound, True)
+        elif c.operate in _upper:
+            high = bound if high is None else _tighter(high, bound, False)
+        else:
+            equal.append(c.value)
+
+    def within(value):
+        if low is not None and not (value > low[0] or (low[1] and value == low[0])):
+            return False
+        if high is not None and not (value < high[0] or (high[1] and value == high[0])):
+            return False
+        return True
+
+    first = comparisons[0]
+    make = lambda op, value: AttributeComponent(attr_name=first.attr_name,
+                                                operate=op, value=value)
+    if equal:
+        if any(v != equal[0] for v in equal) or not within(equal[0]):
+            return None
+        return [make('==', equal[0])]
+    if low is not None and high is not None:
+        if low[0] > high[0]:
+            return None
+        if low[0] == high[0]:
+            return [make('==', low[0])] if (low[1] and high[1]) else None
+    res = []
+    if low is not None:
+        res.append(make('>=' if low[1] else '>', low[0]))
+    if high is not None:
+        res.append(make('<=' if high[1] else '<', high[0]))
+    return res
+
+
+def _merge_ranges(components):
+    by_attr = {}
+    res = []
+    for component in components:
+        if isinstance(component, AttributeComponent) and \
+                component.operate in ('>', '>=', '<', '<=', '=='):
+            by_attr.setdefault(component.attr_name, []).append(component)
+        else:
+            res.append(component)
+    for comparisons in by_attr.values():
+        try:
+            merged = _interval(comparisons)
+        except TypeError:
+            merged = comparisons
+        if merged is None:
+            return None
+        res.extend(merged)
+    return res
+
+
+def _class_contradiction(components, context):
+    if context is None:
+        return False
+    positive, negative = [], []
+    for component in components:
+        if component.kind == 'class':
+            ids = component.class_ids(context)
+            (positive if component.positive else negative).append(ids)
+    for n, ids in enumerate(positive):
+        if any(not (ids & other) for other in positive[n + 1:]):
+            return True
+        if any(ids <= other for other in negative):
+            return True
+    return False
+
+
+def _simplify(component, context):
+    if not isinstance(component, CompositeQuery) or is_negated_leaf(component):
+        return component
+    kind = component.kind
+    is_and = kind == 'and'
+    children = []
+    for child in component.components:
+        child = _simplify(child, context)
+        if child.kind == kind and not child.negated:
+            children.extend(child.components)
+        else:
+            children.append(child)
+    absorbing, identity = (is_false, is_true) if is_and else (is_true, is_false)
+    if any(absorbing(c) for c in children):
+        return false_query() if is_and else true_query()
+    children = _dedupe([c for c in children if not identity(c)])
+    if _complementary(children):
+        return false_query() if is_and else true_query()
+    children = _merge_associated(children, is_and)
+    if is_and:
+        children = _merge_ranges(children)
+        if children is None or _associated_contradiction(children) or \
+                _class_contradiction(children, context):
+            return false_query()
+    children = _dedupe(children)
+    if len(children) == 1:
+        return children[0]
+    children.sort(key=lambda c: c.canonical_key())
+    return AndQuery(components=children) if is_and else OrQuery(components=children)
+
+
+def normalize(component, context=None):
+    """
+    :param context: MetaContext used to find contradictory classes, optional
+    :return: equivalent component in normal form
+    """
+    return _simplify(push_negation(component), context)
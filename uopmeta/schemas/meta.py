@@ -1,17 +1,28 @@
+from copy import deepcopy
 from pydantic import BaseModel
 from typing import List, Optional, Any, Dict, ClassVar
-from pydantic import Field, root_validator
+from pydantic import Field, PrivateAttr, root_validator, validator
 from uopmeta.oid import oid_sep, make_oid, oid_class
-from uopmeta.attr_info import attribute_types, meta_kinds
+from uopmeta.attr_info import attribute_types, meta_kinds, json_path_sep, json_path_value
 from uopmeta.schemas.enums import AssocsRequired, AttributeOperation
 from sjautils import index
 from sjautils.dicts import first_kv, DictObject
-from sjautils.string import after
-import random
-from functools import partial
+from uopmeta.matching import compile_like
+from uopmeta.graph import RelationIndex, resolve_role, traverse
+from uopmeta.lru import LRUCache
+from uopmeta.bloom import bloom_hashes
+import random, json, hashlib, operator, sys
+from functools import partial, reduce
 from collections import defaultdict
 make_app_id = lambda: index.make_id(48)
 
+def interned(value):
+    """
+    Validator interning ids and names, which recur across metas, indexes
+    and associations.
+    """
+    return sys.intern(value) if type(value) is str else value
+
 def legal_chars(s):
     return all([(x in index.radix.alphabet) for x in s])
 
@@ -170,6 +181,8 @@ class NameWithId(BaseModel):
     name: str = Field(...)
     permissions: MetaPermissions = Field(default_factory=MetaPermissions)
 
+    _intern_id_name = validator('id', 'name', allow_reuse=True, always=True)(interned)
+
     def without_kind(self):
         data = self.dict()
         data.pop('kind', None)
@@ -385,12 +398,101 @@ class MetaGroup(NameWithId):
         return cls(name=f'group_{random.randint(1000, 9999)}')
 
 
+class FrozenList(list):
+    """
+    List field of a frozen query component.  Copies are plain lists.
+    """
+    def refuse(self, *args, **kwargs):
+        raise Exception('query component is frozen, edit a copy')
+
+    append = extend = insert = pop = remove = clear = sort = reverse = refuse
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = refuse
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [deepcopy(item, memo) for item in self]
+
+    def __reduce_ex__(self, protocol):
+        return list, (list(self),)
+
+
 class QueryComponent(BaseModel):
     kind = ''
+    _frozen: bool = PrivateAttr(default=False)
 
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise Exception(f'{self.__class__.__name__} is frozen, edit a copy')
+        super().__setattr__(name, value)
+
+    def freeze(self):
+        """
+        Make this component and its parts refuse edits so it can be shared,
+        as the ones kept in query_parse_cache are.  Copies are not frozen.
+        :return: self
+        """
+        for name, value in list(self.__dict__.items()):
+            if isinstance(value, list):
+                value = self.__dict__[name] = FrozenList(value)
+            for item in (value if isinstance(value, list) else [value]):
+                if isinstance(item, QueryComponent):
+                    item.freeze()
+        object.__setattr__(self, '_frozen', True)
+        return self
+
+    def copy(self, **kwargs):
+        res = super().copy(**kwargs)
+        object.__setattr__(res, '_frozen', False)
+        return res
+
+    def __deepcopy__(self, memo):
+        return self.copy(deep=True)
 
     def safisfies(self, dbi, obj_ids=None):
-        pass
+        return self.satisfies(dbi, obj_ids)
+
+    def satisfies(self, dbi, obj_ids=None):
+        """
+        Ids of objects satisfying this component.
+        :param dbi: database interface or MemoryDBI to evaluate against
+        :param obj_ids: candidate ids to filter or None for all objects
+        :return: set of object ids
+        """
+        raise Exception(f'{self.__class__.__name__} cannot be evaluated')
+
+    async def async_satisfies(self, dbi, obj_ids=None, concurrency=None):
+        """
+        Like satisfies but issues independent dbi calls concurrently, at
+        most concurrency at a time if given.  Dbi methods may be coroutines.
+        """
+        from uopmeta.async_eval import async_satisfies
+        return await async_satisfies(self, dbi, obj_ids, concurrency)
+
+    def rewritten(self, context=None):
+        """
+        :return: equivalent component in normal form, see uopmeta.rewrite
+        """
+        from uopmeta.rewrite import normalize
+        return normalize(self, context)
+
+    def parallel_satisfies(self, dbi, obj_ids=None, evaluator=None, **kwargs):
+        """
+        Like satisfies but splits large attribute filters of every branch
+        into chunks filtered by worker processes, see uopmeta.parallel.
+        """
+        from uopmeta.parallel import parallel_satisfies
+        return parallel_satisfies(self, dbi, obj_ids, evaluator, **kwargs)
+
+    def affected_ids(self, dbi, change):
+        """
+        Delta rule for incremental maintenance of results.
+        :param change: a write as seen by MemoryDBI listeners
+        :return: ids whose membership in the result may have changed or
+        None if the whole result must be recomputed
+        """
+        return None
 
     def simplify(self):
         pass
@@ -402,6 +504,88 @@ class QueryComponent(BaseModel):
         if self.kind:
             return {self.kind: self.dict_contents()}
 
+    def canonical_key(self):
+        return canonical_json(self.to_dict(), tagged=True)
+
+    def dependencies(self, context):
+        """
+        Tokens, (kind, id) pairs, for what the result of this component
+        depends on.  An id of None stands for any id of the kind.
+        """
+        return {('objects', None)}
+
+all_objects = ('objects', None)
+
+def change_tokens(change):
+    """
+    Dependency tokens invalidated by a write seen by MemoryDBI listeners.
+    """
+    kind, record = change.kind, change.record
+    if kind == 'objects':
+        return {all_objects, ('class_instances', oid_class(record['id']))}
+    if kind == 'related':
+        return {('related', record.assoc_id), ('related', None)}
+    if kind in ('tagged', 'grouped'):
+        return {(kind, record.assoc_id)}
+    return {(kind, None)}
+
+def component_ids(component, dbi, obj_ids=None):
+    """
+    Ids satisfying component, served from the dbi's query_cache when
+    it has one.
+    """
+    cache = getattr(dbi, 'query_cache', None)
+    if cache is None:
+        return component.satisfies(dbi, obj_ids)
+    return cache.satisfies(component, dbi, obj_ids)
+
+def candidate_ids(dbi, obj_ids):
+    return set(obj_ids) if obj_ids is not None else dbi.all_object_ids()
+
+def changed_object_ids(change):
+    return {change.record['id']} if change.kind == 'objects' else set()
+
+
+def _type_tagged(value):
+    return {'$type': f'{type(value).__module__}.{type(value).__qualname__}', 'value': str(value)}
+
+def canonical_json(data, tagged=False):
+    """
+    Canonical serialization of query dicts: equal queries serialize equally
+    however their keys were ordered.
+    :param tagged: serialize values json has no form for, such as
+    datetimes, with their type so they differ from their string forms
+    """
+    return json.dumps(data, sort_keys=True, separators=(',', ':'),
+                      default=_type_tagged if tagged else str)
+
+def query_hash(data):
+    """
+    :param data: query component or its dict form
+    :return: hex digest of the canonical serialization
+    """
+    if isinstance(data, QueryComponent):
+        data = data.to_dict()
+    return hashlib.sha1(canonical_json(data, tagged=True).encode()).hexdigest()
+
+query_parse_cache = LRUCache(maxsize=4096)
+
+def parse_query(data, planned=False):
+    """
+    Query component for its dict form.  Parsed components are frozen and
+    kept in query_parse_cache so an equal dict parsed again gets the kept
+    one, skipping parsing and validation.  Components to edit must be
+    copied first.
+    :param planned: return the normalized form, see uopmeta.rewrite
+    """
+    def parse():
+        component = qc_dict_to_component(data)
+        if planned:
+            from uopmeta.rewrite import normalize
+            component = normalize(component)
+        return component.freeze()
+    key = ('component', planned, canonical_json(data, tagged=True))
+    return query_parse_cache.get_or_compute(key, parse)
 
 class MetaQuery(NameWithId):
     kind = 'query'
@@ -414,25 +598,74 @@ class MetaQuery(NameWithId):
         elif isinstance(data, dict):
             working = dict(data)
             q = working['query']
-            kind, k_data = first_kv(q)
             if isinstance(q, QueryComponent):
                 working['query'] = q.to_dict()
-            elif kind not in ('class', 'attr', 'tags', 'groups', 'related', 'and', 'or'):
+            elif first_kv(q)[0] not in ('class', 'attribute', 'tags', 'groups', 'related', 'and', 'or'):
                 raise Exception(f'{q} is not legal form of QueryComponent')
             return working
 
     @classmethod
-    def from_dict(cls, d):
+    def from_dict(cls, d, planned=False):
+        """
+        MetaQuery for its dict form.  Parsed queries are cached by canonical
+        form so parsing an equal dict again returns a shallow copy of the
+        cached one, skipping parsing and validation.  The query component
+        is shared and frozen, see parse_query.  Without an id in d the copy
+        gets a new id.
+        :param planned: normalize the query component, see uopmeta.rewrite
+        """
         d_s = cls.standard_dict_form(d)
-        qc = qc_dict_to_component(d_s['query'])
-        d['query'] = qc
-        return cls(**d)
+        key = ('query', planned, canonical_json(d_s, tagged=True))
+        parsed = query_parse_cache.get(key)
+        if parsed is None:
+            d_s['query'] = parse_query(d_s['query'], planned)
+            parsed = query_parse_cache.put(key, cls(**d_s))
+        update = None if 'id' in d_s else dict(id=cls.__fields__['id'].get_default())
+        return parsed.copy(update=update)
 
     def to_dict(self):
         d = self.dict()
         d['query'] = self.query.to_dict()
         return d
 
+    def satisfies(self, dbi, obj_ids=None):
+        return component_ids(self.query, dbi, obj_ids)
+
+    async def async_satisfies(self, dbi, obj_ids=None, concurrency=None):
+        return await self.query.async_satisfies(dbi, obj_ids, concurrency)
+
+    def parallel_satisfies(self, dbi, obj_ids=None, evaluator=None, **kwargs):
+        return self.query.parallel_satisfies(dbi, obj_ids, evaluator, **kwargs)
+
+    def stream(self, dbi, limit=None, offset=0):
+        """
+        :return: iterator over the result ids in ascending order from offset,
+        at most limit of them, evaluated lazily
+        """
+        from uopmeta.streaming import stream_page
+        return stream_page(self.query, dbi, limit, offset)
+
+    def page(self, dbi, size=50, cursor=None, sort_attr=None):
+        """
+        :return: (ids, cursor) for one page of the result, see cursors.page
+        """
+        from uopmeta.cursors import page
+        return page(self, dbi, size, cursor, sort_attr)
+
+    def materialize(self, dbi):
+        """
+        :return: MaterializedQuery over dbi kept current as dbi changes
+        """
+        from uopmeta.materialize import MaterializedQuery
+        return MaterializedQuery(self, dbi)
+
+    def explain(self, dbi, analyze=False, **kwargs):
+        """
+        :return: explain plan of the query, see uopmeta.explain
+        """
+        from uopmeta.explain import explain
+        return explain(self, dbi, analyze, **kwargs)
+
 sys_permissioned = partial(MetaClass, permissions=SystemPermissions())
 
 app_permissioned = partial(MetaClass, permissions=AppPermissions())
@@ -546,6 +779,24 @@ class Schema(BaseSchema):
 
         return values
 
+def schema_metas(schema: Schema):
+    """
+    New meta objects of the classes, attributes, groups, tags, roles and
+    queries a schema defines itself, without those of the schemas it uses.
+    """
+    for c in schema.classes:
+        yield MetaClass(**c.dict())
+    for attr in schema.attributes:
+        yield MetaAttribute(**attr.dict())
+    for group in schema.groups:
+        yield MetaGroup(**group.dict())
+    for tag in schema.tags:
+        yield MetaTag(**tag.dict())
+    for role in schema.roles:
+        yield MetaRole(**role.dict())
+    for query in schema.queries:
+        yield MetaQuery(**query.dict())
+
 class MetaContext(BaseModel):
     classes: ByNameId = ByNameId()
     attributes: ByNameId = ByNameId()
@@ -555,6 +806,9 @@ class MetaContext(BaseModel):
     queries: ByNameId = ByNameId()
     group_children: dict = {}
     class_children: dict = {}
+    stats: Any = None
+    # built from the metas, or held only in memory, and never serialized
+    derived_fields: ClassVar[set] = {'group_children', 'class_children', 'stats'}
 
     def get_class_children(self):
         if not self.class_children:
@@ -570,7 +824,7 @@ class MetaContext(BaseModel):
 
     def deep_copy(self):
         instance = self.__class__()
-        for kind in kind_map:
+        for kind in meta_kinds:
             instance.load_objects(self.metas_of_kind(kind))
         instance.complete()
         return instance
@@ -604,15 +858,25 @@ class MetaContext(BaseModel):
 
 
     def dict(self, *args, **kwargs):
-        excluded = kwargs.get('exclude') or set()
-        excluded.update({'group_children', 'class_children'})
-        kwargs['exclude'] = excluded
+        kwargs['exclude'] = set(kwargs.get('exclude') or ()) | self.derived_fields
         return super().dict(*args, **kwargs)
 
+    def json(self, *args, **kwargs):
+        kwargs['exclude'] = set(kwargs.get('exclude') or ()) | self.derived_fields
+        return super().json(*args, **kwargs)
+
     def load_objects(self, objects):
         for obj in objects:
             self.add(obj)
 
+    def memory_report(self, exact=False):
+        """
+        :return: bytes retained by kind, association list and instance class,
+        see uopmeta.memory
+        """
+        from uopmeta.memory import memory_report
+        return memory_report(self, exact)
+
 
     @classmethod
     def from_kind_objects(cls, kind_map):
@@ -635,18 +899,7 @@ class MetaContext(BaseModel):
     def from_schema(cls, schema: Schema):
         instance = cls()
         def add_schema(a_schema:Schema):
-            for c in a_schema.classes:
-                instance.add(MetaClass(**c.dict()))
-            for attr in a_schema.attributes:
-                instance.add(MetaAttribute(**attr.dict()))
-            for group in a_schema.groups:
-                instance.add(MetaGroup(**group.dict()))
-            for tag in a_schema.tags:
-                instance.add(MetaTag(**tag.dict()))
-            for role in a_schema.roles:
-                instance.add(MetaRole(**role.dict()))
-            for query in a_schema.queries:
-                instance.add(MetaQuery(**query.dict()))
+            instance.load_objects(schema_metas(a_schema))
         def add_schemas(schema_list):
             for s in schema_list:
                 add_schema(s)
@@ -696,11 +949,12 @@ class MetaContext(BaseModel):
 
 
 
-    def complete_classes(self):
+    def complete_classes(self, classes=None):
         """
         1) ensures both attr_ids and attributes exist in classes
         2) ensures each class' attributes includs suppeclass attributes
         3) ensures self.attributes is filled in from attributes of classes
+        :param classes: the classes to complete, all by default
         """
         from collections import deque
         processed = set()
@@ -720,7 +974,7 @@ class MetaContext(BaseModel):
             cls.attrs = list(c_attrs)
             cls.attributes = list(c_attributes)
 
-        for cls in self.classes.by_id.values():
+        for cls in (self.classes.by_id.values() if classes is None else classes):
             process_class(cls)
 
 
@@ -864,6 +1118,8 @@ class Associated(BaseModel):
     assoc_id: str = Field(..., description='id of association')
     object_id: str = Field(..., description='id of object associated')
 
+    _intern_ids = validator('assoc_id', 'object_id', allow_reuse=True)(interned)
+
     @classmethod
     def secondary_indices(cls, name):
         return make_secondary_indices(name,['assoc_id'], ['object_id'])
@@ -934,6 +1190,8 @@ class Related(Associated):
     kind='related'
     subject_id: str = Field(..., description='subject of relationship')
 
+    _intern_subject = validator('subject_id', allow_reuse=True)(interned)
+
     @classmethod
     def make(cls, subject_id, role_id, object_id):
         return cls(assoc_id=role_id, object_id=object_id, subject_id=subject_id)
@@ -993,6 +1251,35 @@ class ClassComponent(QueryComponent):
             positive = not self.positive
         )
 
+    def class_ids(self, context):
+        cls = context.get_meta_named('classes', self.cls_name)
+        if cls is None:
+            return set()
+        return context.subclasses(cls.id) if self.include_subclasses else {cls.id}
+
+    def satisfies(self, dbi, obj_ids=None):
+        context = dbi.meta_context
+        cls_ids = self.class_ids(context)
+        if obj_ids is not None:
+            return {i for i in obj_ids if (oid_class(i) in cls_ids) == self.positive}
+        by_id = context.classes.by_id
+        res = set()
+        for cls_id in cls_ids:
+            res |= set(dbi.class_instance_ids(by_id[cls_id].name))
+        return res if self.positive else dbi.all_object_ids() - res
+
+    def affected_ids(self, dbi, change):
+        if change.kind == 'classes':
+            return None
+        return changed_object_ids(change)
+
+    def dependencies(self, context):
+        res = {('classes', None)}
+        if not self.positive:
+            res.add(all_objects)
+        res |= {('class_instances', i) for i in self.class_ids(context)}
+        return res
+
 
 def reverse_application(application):
     reversed = dict(
@@ -1004,38 +1291,168 @@ def reverse_application(application):
 
 class AssociatedComponent(QueryComponent):
     kind = ''
+    option_names: ClassVar[tuple] = ()
     names: List[str] = Field(..., description='name of association meta bojects')
     application: AssocsRequired = AssocsRequired.all
 
     @classmethod
     def from_dict(cls, d):
+        d = dict(d)
+        options = {k: d.pop(k) for k in cls.option_names if k in d}
         app_type, names = first_kv(d)
-        return cls(names=names, application=app_type)
+        return cls(names=names, application=app_type, **options)
 
     def dict_contents(self):
-        return {self.application.value: self.names}
+        return {self.application.value: list(self.names)}
 
     def negated(self):
-        return self.__class__(groups=self.names,
-                   application=reverse_application(self.application))
+        if self.application == 'all' and len(self.names) != 1:
+            # not all of the names means none of at least one of them
+            return OrQuery(components=[
+                self.copy(update=dict(names=[n], application=AssocsRequired.none))
+                for n in self.names])
+        application = AssocsRequired(reverse_application(self.application))
+        return self.copy(update=dict(names=list(self.names), application=application))
+
+    def named_ids(self, context):
+        """
+        One set of meta ids per name.  An object has a name if it is
+        associated with any id in the name's set.
+        """
+        by_name = context.by_name(self.meta_kind)
+        res = []
+        for name in self.names:
+            meta = by_name.get(name)
+            res.append({meta.id} if meta else set())
+        return res
+
+    def assoc_set(self, dbi, assoc_id):
+        return set()
+
+    def probed_sets(self, dbi, named_ids, obj_ids):
+        """
+        One set per name of the ids in obj_ids having the name.  Each
+        candidate is hashed once and probed against the dbi's Bloom filter
+        of each association; only the positives are verified by the dbi.
+        Associations with fewer members than there are candidates are
+        fetched whole instead.
+        """
+        hashes = None
+        bloom_key = getattr(dbi, 'bloom_key', None)
+        res = []
+        for ids in named_ids:
+            found = set()
+            for assoc_id in ids:
+                bloom = dbi.assoc_filter(self.assoc_kind, assoc_id)
+                if bloom is None or len(obj_ids) >= len(bloom):
+                    found |= self.assoc_set(dbi, assoc_id) & obj_ids
+                    continue
+                if hashes is None:
+                    hashes = [(i, bloom_hashes(bloom_key(i) if bloom_key else i))
+                              for i in obj_ids]
+                maybe = [i for i, h in hashes if bloom.contains_hashes(h)]
+                if maybe:
+                    found |= dbi.assoc_members(self.assoc_kind, assoc_id, maybe)
+            res.append(found)
+        return res
+
+    def dependencies(self, context):
+        res = {(self.meta_kind, None)}
+        if self.application == 'none':
+            res.add(all_objects)
+        for ids in self.named_ids(context):
+            res |= {(self.assoc_kind, i) for i in ids}
+        return res
+
+    def affected_ids(self, dbi, change):
+        if change.kind == self.meta_kind:
+            return None
+        if change.kind == self.assoc_kind:
+            assoc_ids = set().union(*self.named_ids(dbi.meta_context))
+            return {change.record.object_id} if change.record.assoc_id in assoc_ids else set()
+        return changed_object_ids(change)
+
+    def satisfies(self, dbi, obj_ids=None):
+        named_ids = self.named_ids(dbi.meta_context)
+        if obj_ids is not None and hasattr(dbi, 'assoc_filter'):
+            obj_ids = obj_ids if isinstance(obj_ids, (set, frozenset)) else set(obj_ids)
+            name_sets = self.probed_sets(dbi, named_ids, obj_ids)
+        else:
+            name_sets = [set().union(*[self.assoc_set(dbi, i) for i in ids])
+                         for ids in named_ids]
+        if self.application == 'all':
+            if not name_sets:
+                return candidate_ids(dbi, obj_ids)
+            res = reduce(lambda a, b: a & b, name_sets)
+        else:
+            res = set().union(*name_sets)
+            if self.application == 'none':
+                return candidate_ids(dbi, obj_ids) - res
+        return res if obj_ids is None else res.intersection(obj_ids)
 
 class TagsComponent(AssociatedComponent):
     kind = 'tags'
+    meta_kind: ClassVar[str] = 'tags'
+    assoc_kind: ClassVar[str] = 'tagged'
+
+    def assoc_set(self, dbi, assoc_id):
+        return dbi.get_tagset(assoc_id)
 
 
 
 class GroupsComponent(AssociatedComponent):
     kind = 'groups'
+    meta_kind: ClassVar[str] = 'groups'
+    assoc_kind: ClassVar[str] = 'grouped'
     include_subgroups: bool = True
+    option_names: ClassVar[tuple] = ('include_subgroups',)
 
-    def negated(self):
-        return self.__class__(names=self.names,
-                              include_subgroups=self.include_subgroups,
-                   application=reverse_application(self.application))
+    def dict_contents(self):
+        d = super().dict_contents()
+        if not self.include_subgroups:
+            d['include_subgroups'] = False
+        return d
+
+    def named_ids(self, context):
+        res = super().named_ids(context)
+        if self.include_subgroups:
+            res = [set().union(*[context.subgroups(i) for i in ids]) for ids in res]
+        return res
+
+    def assoc_set(self, dbi, assoc_id):
+        return dbi.get_groupset(assoc_id)
 
 def assoc_component_from_dict(d):
     pass
 
+json_type = attribute_types['json']
+
+comparisons = {
+    AttributeOperation.gte: operator.ge,
+    AttributeOperation.gt: operator.gt,
+    AttributeOperation.lte: operator.le,
+    AttributeOperation.lt: operator.lt,
+    AttributeOperation.eq: operator.eq,
+    AttributeOperation.neq: operator.ne,
+}
+
+def attribute_value(obj, attr_name):
+    """
+    Value of the named attribute of obj.  Names of the form attr.key.key
+    reach into the parsed content of json attributes.
+    Raises KeyError if there is no such value.
+    """
+    if attr_name in obj:
+        return obj[attr_name]
+    base, _, path = attr_name.partition(json_path_sep)
+    if not path:
+        raise KeyError(attr_name)
+    try:
+        data = json_type.parse(obj[base])
+    except ValueError:
+        raise KeyError(attr_name)
+    return json_path_value(data, path.split(json_path_sep))
+
 class AttributeComponent(QueryComponent):
     kind = 'attribute'
     attr_name: str = 'createdAt'
@@ -1058,7 +1475,9 @@ class AttributeComponent(QueryComponent):
             '<=': '>',
             '<': '>=',
             '==': '!=',
-            '!=': '=='
+            '!=': '==',
+            'like': 'not_like',
+            'not_like': 'like'
         }
         return self.__class__(
             attr_name = self.attr_name,
@@ -1066,38 +1485,63 @@ class AttributeComponent(QueryComponent):
             value = self.value
         )
 
-    def value_like(self, val, criteria):
-        # TODO use regex instead?
-        star_sep = criteria.split('*')
-        for part in star_sep:
-            rest = after(part, val)
-            if rest == val:
-                return False
-            val = rest
-        return True
+    def matcher(self):
+        return compile_like(self.value)
 
-    def eval_like(self, obj, criteria):
-        val = obj[self.attr_name]
-        return self.value_like(val, criteria)
+    def value_of(self, obj):
+        return attribute_value(obj, self.attr_name)
 
     def obj_eval(self):
-        # TODO fix to include string like functions and range and clean up
-        if self.operate == '>=':
-            return lambda obj: obj[self.attr_name] >= self.value
-        if self.operate == '>':
-            return lambda obj: obj[self.attr_name] > self.value
-        if self.operate == '<=':
-            return lambda obj: obj[self.attr_name] <= self.value
-        if self.operate == '<':
-            return lambda obj: obj[self.attr_name] < self.value
-        if self.operate == '==':
-            return lambda obj: obj[self.attr_name] == self.value
-        if self.operate == '!=':
-            return lambda obj: obj[self.attr_name] != self.value
+        value_of = self.value_of
         if self.operate == 'like':
-            return partial(self.eval_like, criteria= self.value)
+            matcher = self.matcher()
+            return lambda obj: matcher(value_of(obj))
         if self.operate == 'not_like':
-            return lambda obj: not self.eval_like(obj, self.value)
+            matcher = self.matcher()
+            return lambda obj: not matcher(value_of(obj))
+        compare, value = comparisons[self.operate], self.value
+        return lambda obj: compare(value_of(obj), value)
+
+    def satisfies(self, dbi, obj_ids=None):
+        """
+        Ids of objects, from obj_ids if given else from all of dbi, whose
+        attribute satisfies this component. Objects without the attribute
+        never satisfy it.  Like and not_like use a trigram index on the
+        attribute and comparisons a value index when the dbi has one.
+        """
+        if self.operate in ('like', 'not_like'):
+            get_index = getattr(dbi, 'trigram_index', None)
+            index = get_index(self.attr_name) if get_index else None
+            if index is not None:
+                found = index.search(self.value, obj_ids)
+                if self.operate == 'like':
+                    return found
+                ids = index.ids() if obj_ids is None else \
+                    [i for i in obj_ids if i in index]
+                return {i for i in ids if i not in found}
+        else:
+            get_index = getattr(dbi, 'value_index', None)
+            index = get_index(self.attr_name) if get_index else None
+            if index is not None:
+                found = index.lookup(self.operate, self.value)
+                return found if obj_ids is None else found.intersection(obj_ids)
+        if obj_ids is None:
+            obj_ids = dbi.all_object_ids()
+        test = self.obj_eval()
+        res = set()
+        for obj_id in obj_ids:
+            obj = dbi.get_object(obj_id)
+            if not obj:
+                continue
+            try:
+                if test(obj):
+                    res.add(obj_id)
+            except KeyError:
+                pass
+        return res
+
+    def affected_ids(self, dbi, change):
+        return changed_object_ids(change)
 
     def propval(self):
         return {self.operate: {self.attr_name: self.value}}
@@ -1108,19 +1552,69 @@ class InComponent(BaseModel):
     negated: bool = False
 
 class RelatedTo(QueryComponent):
+    """
+    Objects reached from obj_id by following role, then each role in path,
+    repeated between 1 and max_depth times.  A role name that is the
+    reverse_name of a role follows that role from objects to subjects.
+    Negated, the objects that are not so reached.
+    """
     kind = 'related'
     obj_id: str = Field(..., description='object objects are related to')
     role: Optional[str] = None
     negated: bool = False
+    path: List[str] = Field(default=[], description='roles of further hops')
+    max_depth: Optional[int] = Field(
+        default=1, description='repetitions of the hops allowed, None for no limit')
+
+    def hops(self, context):
+        return [resolve_role(context, r) for r in [self.role] + self.path]
+
+    def related_ids(self, dbi):
+        return traverse(dbi.relation_index(), {self.obj_id},
+                        self.hops(dbi.meta_context), self.max_depth)
+
+    def satisfies(self, dbi, obj_ids=None):
+        found = self.related_ids(dbi)
+        if self.negated:
+            return candidate_ids(dbi, obj_ids) - found
+        return found if obj_ids is None else found.intersection(obj_ids)
+
+    def dependencies(self, context):
+        res = {('roles', None)}
+        if self.negated:
+            res.add(all_objects)
+        res |= {('related', r) for r, _ in self.hops(context)}
+        return res
+
+    def affected_ids(self, dbi, change):
+        if change.kind == 'roles':
+            return None
+        if change.kind != 'related':
+            return changed_object_ids(change)
+        hops = self.hops(dbi.meta_context)
+        role_ids = {r for r, _ in hops}
+        record = change.record
+        if (None not in role_ids) and (record.role_id not in role_ids):
+            return set()
+        if len(hops) > 1 or self.max_depth != 1:
+            return None
+        role_id, reverse = hops[0]
+        start, end = (record.object_id, record.subject_id) if reverse else \
+            (record.subject_id, record.object_id)
+        return {end} if start == self.obj_id else set()
 
     def dict_contents(self):
         d = self.dict()
+        d['path'] = list(self.path)
         role = d.pop('role')
         return {role: d}
 
     @classmethod
     def from_dict(cls, d):
         role, rest = first_kv(d)
+        if role == 'null':
+            # the None key of any role as written by json
+            role = None
         return cls(role=role, **rest)
 
 class CompositeQuery(QueryComponent):
@@ -1141,13 +1635,36 @@ class CompositeQuery(QueryComponent):
         for component in self.components:
             component.simplify()
 
+    def combine(self, dbi, obj_ids):
+        return set()
+
+    def dependencies(self, context):
+        res = {all_objects} if self.negated or not self.components else set()
+        for component in self.components:
+            res |= component.dependencies(context)
+        return res
+
+    def affected_ids(self, dbi, change):
+        res = set()
+        for component in self.components:
+            affected = component.affected_ids(dbi, change)
+            if affected is None:
+                return None
+            res |= affected
+        return res
+
+    def satisfies(self, dbi, obj_ids=None):
+        res = self.combine(dbi, obj_ids)
+        return candidate_ids(dbi, obj_ids) - res if self.negated else res
+
 def qc_dict_to_component(d):
     kind, data = first_kv(d)
     if kind in ('and', 'or'):
         cls = AndQuery if (kind == 'and') else OrQuery
+        data = dict(data)
         d_comps = data.pop('components')
         components = [qc_dict_to_component(c) for c in d_comps]
-        return cls(components=components, **d)
+        return cls(components=components, **data)
     elif kind == 'class':
         return ClassComponent.from_dict(data)
     elif kind == 'attribute':
@@ -1162,6 +1679,15 @@ def qc_dict_to_component(d):
         raise Exception(f'no handler for {kind} query component')
 class AndQuery(CompositeQuery):
     kind = 'and'
+
+    def combine(self, dbi, obj_ids):
+        res = obj_ids
+        for component in self.components:
+            res = component_ids(component, dbi, res)
+            if not res:
+                return set()
+        return candidate_ids(dbi, res)
+
     def simplify(self):
         super().simplify()
         new_components = []
@@ -1175,6 +1701,13 @@ class AndQuery(CompositeQuery):
 
 class OrQuery(CompositeQuery):
     kind = 'or'
+
+    def combine(self, dbi, obj_ids):
+        res = set()
+        for component in self.components:
+            res |= component_ids(component, dbi, obj_ids)
+        return res
+
     def simplify(self):
         super().simplify()
         new_components = []
@@ -1204,6 +1737,131 @@ class WorkingContext(MetaContext):
         return  (objects(self.tagged, 'object_id')  |
                  objects(self.grouped, 'object_id') |
                  objects(self.related, 'object_id', 'subject_id'))
+    _relations: Any = PrivateAttr(default=None)  # (related, its length, index)
+
+    def relation_index(self):
+        """
+        RelationIndex of related, kept and updated by relate and unrelate.
+        It is rebuilt if related is replaced or changes length otherwise.
+        """
+        known = self._relations
+        related = self.related
+        if known is None or known[0] is not related or known[1] != len(related):
+            known = self._relations = (related, len(related), RelationIndex.from_related(related))
+        return known[2]
+
+    _assocs: Any = PrivateAttr(default=None)  # (lists, their lengths, index)
+
+    def _kept_assocs(self):
+        known = self._assocs
+        lists = (self.tagged, self.grouped, self.related)
+        if known is None or any(a is not b for a, b in zip(known[0], lists)) or \
+                known[1] != [len(a) for a in lists]:
+            return None
+        return known[2]
+
+    def _keep_assocs(self, index):
+        lists = (self.tagged, self.grouped, self.related)
+        self._assocs = (lists, [len(a) for a in lists], index)
+
+    def association_index(self):
+        """
+        AssociationIndex of tagged, grouped and related, built on first use
+        and kept by relate, unrelate and remove_associations.  It is rebuilt
+        if a list is replaced or changes length otherwise.
+        """
+        index = self._kept_assocs()
+        if index is None:
+            from uopmeta.cascade import AssociationIndex
+            index = AssociationIndex.from_context(self)
+            self._keep_assocs(index)
+        return index
+
+    def remove_associations(self, keys):
+        """
+        Removes the associations with the given keys, see
+        uopmeta.cascade.assoc_key, in one pass over the lists.
+        :return: dict of counts removed by kind
+        """
+        from uopmeta.cascade import assoc_key
+        index = self._kept_assocs()
+        stats = self.collected_stats()
+        counts = {}
+        for kind in ('tagged', 'grouped', 'related'):
+            kept, removed = [], []
+            for assoc in getattr(self, kind):
+                (removed if assoc_key(assoc) in keys else kept).append(assoc)
+            counts[kind] = len(removed)
+            if removed:
+                setattr(self, kind, kept)
+                if stats:
+                    for assoc in removed:
+                        stats.remove_association(assoc)
+        if index is not None:
+            for key in keys:
+                index.remove_key(key)
+            self._keep_assocs(index)
+        return counts
+
+    def relate(self, assoc: Related):
+        index = self.relation_index()
+        assocs = self._kept_assocs()
+        self.related.append(assoc)
+        index.add(assoc)
+        self._relations = (self.related, len(self.related), index)
+        if assocs is not None:
+            assocs.add(assoc)
+            self._keep_assocs(assocs)
+        stats = self.collected_stats()
+        if stats:
+            stats.add_association(assoc)
+        assoc.persist(self.persist_to)
+
+    def unrelate(self, assoc: Related):
+        """
+        Removes one occurrence of assoc from related.
+        :return: True if it was there
+        """
+        index = self.relation_index()
+        if assoc not in self.related:
+            return False
+        assocs = self._kept_assocs()
+        self.related.remove(assoc)
+        if assoc not in self.related:
+            index.remove(assoc)
+            if assocs is not None:
+                assocs.remove(assoc)
+        self._relations = (self.related, len(self.related), index)
+        if assocs is not None:
+            self._keep_assocs(assocs)
+        stats = self.collected_stats()
+        if stats:
+            stats.remove_association(assoc)
+        if self.persist_to:
+            self.persist_to.remove_association(assoc)
+        return True
+
+    _collected: Any = PrivateAttr(default=None)
+
+    def collect_stats(self, **kwargs):
+        """
+        StatsCatalog of the instances and associations, kept as stats and
+        kept current by configure, relate and unrelate.  Edits made directly
+        to instances or the association lists are not counted; collect
+        again after them.
+        :return: the catalog
+        """
+        from uopmeta.stats import StatsCatalog
+        self.stats = self._collected = StatsCatalog.from_context(self, **kwargs)
+        return self.stats
+
+    def collected_stats(self):
+        """
+        :return: catalog of collect_stats while it is stats, else None
+        """
+        stats = self._collected
+        return stats if stats is not None and stats is self.stats else None
+
     @classmethod
     def from_metadata(cls, metadata: MetaContext):
         data = {k: getattr(metadata, k) for k in metadata.dict()}
@@ -1226,7 +1884,12 @@ class WorkingContext(MetaContext):
 
     def ensure_assocs(self, num, assoc_fn, lst):
         needed = num - len(lst)
-        lst += [assoc_fn() for _ in range(needed)]
+        added = [assoc_fn() for _ in range(needed)]
+        lst += added
+        stats = self.collected_stats()
+        if stats:
+            for assoc in added:
+                stats.add_association(assoc)
 
     def configure(self, num_assocs=4, num_instances=10, persist_to=None):
         """
@@ -1246,6 +1909,9 @@ class WorkingContext(MetaContext):
             if persist_to:
                 persist_to.add_object(instance)
             self.instances.append(instance)
+            stats = self.collected_stats()
+            if stats:
+                stats.add_object(instance)
 
         self.ensure_metas(num_instances, MetaTag)
         self.ensure_metas(num_instances, MetaGroup)
@@ -0,0 +1,324 @@
+"""
+Sharded in memory data.  A ShardedContext partitions instances across
+shards, each a MemoryDBI in its own worker process, by a stable hash of
+the object id or of its class id.  Tagged and grouped associations live
+on the shard of their object and related ones on the shards of both
+their subject and object, so every edge of an object is on its shard.
+
+Queries are scattered to the shards and the results gathered.  Class,
+attribute, tag and group components, and and/or queries of them, depend
+only on each object's own data and associations, so each shard
+evaluates them over its own objects and the results are unioned.
+RelatedTo components are evaluated at the coordinator by traversal
+whose every hop asks the shards owning the frontier for their
+neighbors, which follows edges across shards.  Composites containing
+them are combined at the coordinator.
+
+With processes=False the shards are MemoryDBIs in this process, useful
+for testing.
+"""
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from uopmeta.oid import oid_class
+from uopmeta.graph import traverse
+from uopmeta.memory_dbi import MemoryDBI
+from uopmeta.schemas.meta import MetaQuery, Associated, as_meta
+
+_shard_dbi = None
+
+
+def _init_shard(meta_context, intern_ids):
+    global _shard_dbi
+    _shard_dbi = MemoryDBI(meta_context, intern_ids=intern_ids)
+
+
+def _in_process(fn, *args):
+    return fn(_shard_dbi, *args)
+
+
+def _add_objects(dbi, objects):
+    for obj in objects:
+        dbi.add_object(obj)
+    return len(objects)
+
+
+def _delete_objects(dbi, obj_ids):
+    return sum(dbi.delete_object(i) is not None for i in obj_ids)
+
+
+def _add_associations(dbi, records):
+    return sum(bool(dbi.meta_insert(r)) for r in records)
+
+
+def _remove_associations(dbi, records):
+    return sum(bool(dbi.remove_association(r)) for r in records)
+
+
+def _update_meta(dbi, op, meta):
+    if op == 'insert':
+        dbi.add_meta(meta)
+    else:
+        dbi.remove_meta(meta)
+
+
+def _call(dbi, method, *args):
+    return getattr(dbi, method)(*args)
+
+
+def _satisfies(dbi, obj_ids, component):
+    return set(component.satisfies(dbi, set(obj_ids) if obj_ids is not None else None))
+
+
+def _neighbors(dbi, node_ids, role_id, reverse):
+    return dbi.relations.neighbors(node_ids, role_id, reverse)
+
+
+def _counts(dbi):
+    return dict(objects=len(dbi.objects),
+                tagged=sum(map(len, dbi.tagsets.values())),
+                grouped=sum(map(len, dbi.groupsets.values())),
+                related=len(dbi.relations))
+
+
+class _LocalShard:
+    def __init__(self, meta_context, intern_ids):
+        self.dbi = MemoryDBI(meta_context, intern_ids=intern_ids)
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(self.dbi, *args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self):
+        self.dbi = None
+
+
+class _ProcessShard:
+    def __init__(self, meta_context, intern_ids):
+        self.executor = ProcessPoolExecutor(
+            max_workers=1, initializer=_init_shard, initargs=(meta_context, intern_ids))
+
+    def submit(self, fn, *args):
+        return self.executor.submit(_in_process, fn, *args)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def _has_related(component):
+    if component.kind == 'related':
+        return True
+    return any(_has_related(c) for c in getattr(component, 'components', ()))
+
+
+class _ShardedRelations:
+    """
+    Relation index over the shards, enough for graph.traverse.
+    """
+
+    def __init__(self, sharded):
+        self.sharded = sharded
+
+    def neighbors(self, node_ids, role_id=None, reverse=False):
+        return self.sharded.scatter(_neighbors, self.sharded.partition(node_ids),
+                                    role_id, reverse)
+
+
+class ShardedContext:
+    def __init__(self, meta_context, shards=4, by='oid', processes=True,
+                 intern_ids=False, batch_size=10000):
+        """
+        :param meta_context: context every shard holds a copy of
+        :param shards: number of shards
+        :param by: 'oid' to place objects by a hash of their id or 'class'
+        to place all instances of a class together
+        :param processes: run each shard in a worker process
+        :param intern_ids: shards intern ids, see MemoryDBI
+        :param batch_size: records sent to a shard at a time when loading
+        """
+        if by not in ('oid', 'class'):
+            raise Exception(f'cannot shard by {by}')
+        self.meta_context = meta_context
+        self.num_shards = shards
+        self.by = by
+        self.batch_size = batch_size
+        shard_class = _ProcessShard if processes else _LocalShard
+        self.shards = [shard_class(meta_context if processes else meta_context.deep_copy(),
+                                   intern_ids)
+                       for _ in range(shards)]
+        self.relations = _ShardedRelations(self)
+
+    @classmethod
+    def from_context(cls, context, **kwargs):
+        """
+        :param context: WorkingContext whose instances and associations are loaded
+        """
+        sharded = cls(context.deep_copy(), **kwargs)
+        sharded.load(context.instances, context.tagged, context.grouped, context.related)
+        return sharded
+
+    def close(self):
+        for shard in self.shards:
+            shard.shutdown()
+        self.shards = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def shard_of(self, obj_id):
+        key = obj_id if self.by == 'oid' else oid_class(obj_id)
+        return zlib.crc32(key.encode()) % self.num_shards
+
+    def partition(self, obj_ids):
+        """
+        :return: list of the ids of obj_ids on each shard
+        """
+        parts = [[] for _ in self.shards]
+        shard_of = self.shard_of
+        for obj_id in obj_ids:
+            parts[shard_of(obj_id)].append(obj_id)
+        return parts
+
+    def scatter(self, fn, parts, *args):
+        """
+        Calls fn(dbi, part, *args) on each shard with a non empty part.
+        :return: union of the results
+        """
+        futures = [shard.submit(fn, part, *args)
+                   for shard, part in zip(self.shards, parts) if part]
+        res = set()
+        for future in futures:
+            res |= future.result()
+        return res
+
+    def broadcast(self, fn, *args):
+        """
+        :return: list of the results of fn(dbi, *args) on each shard
+        """
+        futures = [shard.submit(fn, *args) for shard in self.shards]
+        return [f.result() for f in futures]
+
+    def _assoc_shards(self, record):
+        get = record.get if isinstance(record, dict) else lambda k: getattr(record, k, None)
+        res = {self.shard_of(get('object_id'))}
+        subject_id = get('subject_id')
+        if subject_id is not None:
+            res.add(self.shard_of(subject_id))
+        return res
+
+    def _load(self, fn, records, route):
+        batches = [[] for _ in self.shards]
+        futures = []
+        added = 0
+        for record in records:
+            for n in route(record):
+                batches[n].append(record)
+                if len(batches[n]) >= self.batch_size:
+                    futures.append(self.shards[n].submit(fn, batches[n]))
+                    batches[n] = []
+                    # bounds the batches waiting in worker queues
+                    if len(futures) > 2 * self.num_shards:
+                        added += futures.pop(0).result()
+        futures.extend(self.shards[n].submit(fn, batch)
+                       for n, batch in enumerate(batches) if batch)
+        return added + sum(f.result() for f in futures)
+
+    def load(self, objects=(), *association_lists):
+        """
+        Adds objects, then the associations in each list, batch_size at a
+        time per shard.
+        :return: number of objects and associations added, related ones
+        once for each shard holding them
+        """
+        added = self._load(_add_objects, objects, lambda obj: (self.shard_of(obj['id']),))
+        for records in association_lists:
+            added += self._load(_add_associations, records, self._assoc_shards)
+        return added
+
+    def add_object(self, obj):
+        return self.load([obj])
+
+    def delete_object(self, obj_id):
+        return self.shards[self.shard_of(obj_id)].submit(_delete_objects, [obj_id]).result()
+
+    def add_association(self, assoc: Associated):
+        return self.load((), [assoc]) > 0
+
+    def remove_association(self, assoc: Associated):
+        futures = [self.shards[n].submit(_remove_associations, [assoc])
+                   for n in self._assoc_shards(assoc)]
+        return any([f.result() for f in futures])
+
+    def meta_insert(self, data):
+        """
+        Inserts an association on its shards or a meta everywhere.
+        """
+        if isinstance(data, dict):
+            data = dict(data)
+            data = as_meta(data.pop('kind'), data)
+        if isinstance(data, Associated):
+            return self.add_association(data)
+        if self.meta_context.get_meta(data.kind, data.id) is not data:
+            self.meta_context.add(data)
+        self.broadcast(_update_meta, 'insert', data)
+
+    def remove_meta(self, meta):
+        self.meta_context.remove(meta)
+        self.broadcast(_update_meta, 'delete', meta)
+
+    def all_object_ids(self):
+        return set().union(*self.broadcast(_call, 'all_object_ids'))
+
+    def get_object(self, obj_id):
+        return self.shards[self.shard_of(obj_id)].submit(_call, 'get_object', obj_id).result()
+
+    def class_instance_ids(self, cls_name):
+        return set().union(*self.broadcast(_call, 'class_instance_ids', cls_name))
+
+    def relation_index(self):
+        return self.relations
+
+    def counts(self):
+        """
+        :return: number of objects and associations on each shard
+        """
+        return self.broadcast(_counts)
+
+    def _candidates(self, obj_ids):
+        return set(obj_ids) if obj_ids is not None else self.all_object_ids()
+
+    def satisfies(self, component, obj_ids=None):
+        """
+        Ids of the objects satisfying a query component or MetaQuery.
+        """
+        if isinstance(component, MetaQuery):
+            component = component.query
+        if not _has_related(component):
+            if obj_ids is None:
+                return set().union(*self.broadcast(_satisfies, None, component))
+            return self.scatter(_satisfies, self.partition(obj_ids), component)
+        if component.kind == 'related':
+            found = traverse(self.relations, {component.obj_id},
+                             component.hops(self.meta_context), component.max_depth)
+            if component.negated:
+                return self._candidates(obj_ids) - found
+            return found if obj_ids is None else found.intersection(obj_ids)
+        if component.kind == 'and':
+            res = obj_ids
+            for child in component.components:
+                res = self.satisfies(child, res)
+                if not res:
+                    res = set()
+                    break
+            res = self._candidates(res)
+        else:
+            res = set()
+            for child in component.components:
+                res |= self.satisfies(child, obj_ids)
+        return self._candidates(obj_ids) - res if component.negated else res
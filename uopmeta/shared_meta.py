@@ -0,0 +1,412 @@
+"""
+MetaContexts shared between processes.  A SharedMetaPublisher encodes a
+completed MetaContext once into a multiprocessing.shared_memory segment:
+tables of json encoded metas sorted by id and by name, and of the child
+ids of classes and groups.  Every worker opens it as a SharedMetaContext
+which reads the tables in place by binary search and decodes a meta only
+when it is asked for, caching a bounded number of them.  Workers hold no
+copy of the metadata, and nothing writes to the shared pages after
+publishing, so they stay shared however many workers read them.
+
+Publishing a changed context writes a new segment and then swaps the
+version and segment name in a small control block under a sequence
+lock.  Readers see the swap on their next read and move to the new
+segment.  The previous segment is unlinked; readers still mapping it
+keep reading it until they move, and an iteration over a table keeps
+reading the version it started on until it ends.
+
+A SharedMetaContext is read only.  It offers the read side of
+MetaContext, enough to serve as the meta_context of a dbi evaluating
+queries, and to_context() decodes it whole.
+"""
+import json
+import struct
+import time
+from collections.abc import Mapping
+from multiprocessing import shared_memory, resource_tracker
+from uopmeta.lru import LRUCache
+from uopmeta.attr_info import meta_kinds
+from uopmeta.schemas.meta import MetaContext, as_meta, canonical_json
+
+_magic = b'UOPMETA1'
+_control = struct.Struct('<8sQQ64s')  # magic, sequence, version, segment name
+_entry = struct.Struct('<IIII')  # key offset, key length, value offset, value length
+_header_size = struct.Struct('<I')
+
+
+def _attach(name):
+    """
+    Opens a segment without the resource tracker unlinking it at exit.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # before python 3.13 opening always registers the segment
+    segment = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+def _unlink(segment):
+    """
+    Unlinks a segment this process published.  A reader sharing the
+    resource tracker, as after fork, may have unregistered it, so it is
+    registered again first for unlink to unregister.
+    """
+    resource_tracker.register(segment._name, 'shared_memory')
+    segment.unlink()
+
+
+def encode_context(context, version=0):
+    """
+    :return: bytes of the shared form of context
+    """
+    tables = {}
+    for kind in meta_kinds:
+        metas = context.metas_of_kind(kind)
+        tables[f'{kind}.id'] = [(m.id, canonical_json(m.dict())) for m in metas]
+        tables[f'{kind}.name'] = [(m.name, m.id) for m in metas]
+    tables['roles.reverse_name'] = [(m.reverse_name, m.id) for m in context.metas_of_kind('roles')
+                                    if getattr(m, 'reverse_name', None)]
+    context.get_class_children()
+    for kind, children in (('classes', context.class_children),
+                           ('groups', context.group_children)):
+        tables[f'{kind}.children'] = [(k, json.dumps(sorted(v))) for k, v in children.items() if v]
+    # offsets are relative to the end of the header
+    blob = bytearray()
+    layout = {}
+    for name, items in tables.items():
+        items = sorted((k.encode(), v.encode()) for k, v in items)
+        start = len(blob)
+        blob += bytes(_entry.size * len(items))
+        for n, (key, value) in enumerate(items):
+            _entry.pack_into(blob, start + n * _entry.size,
+                             len(blob), len(key), len(blob) + len(key), len(value))
+            blob += key + value
+        layout[name] = [start, len(items)]
+    header = json.dumps(dict(version=version, tables=layout)).encode()
+    return _header_size.pack(len(header)) + header + bytes(blob)
+
+
+class SharedMetaPublisher:
+    def __init__(self, name):
+        """
+        :param name: name of the control block readers open
+        """
+        self.name = name
+        try:
+            self.control = shared_memory.SharedMemory(name=name, create=True, size=_control.size)
+            _control.pack_into(self.control.buf, 0, _magic, 0, 0, b'')
+        except FileExistsError:
+            self.control = shared_memory.SharedMemory(name=name)
+        self.segment = None
+
+    def current(self):
+        magic, sequence, version, segment = _control.unpack_from(self.control.buf, 0)
+        return version, segment.rstrip(b'\0').decode()
+
+    def publish(self, context):
+        """
+        Publishes context as the next version, replacing the previous one.
+        :return: the new version
+        """
+        previous_version, previous_name = self.current()
+        version = previous_version + 1
+        data = encode_context(context, version)
+        segment_name = f'{self.name}_{version}'
+        if len(segment_name.encode()) > 64:
+            raise Exception(f'shared context name {self.name} is too long')
+        segment = shared_memory.SharedMemory(name=segment_name, create=True, size=len(data))
+        segment.buf[:len(data)] = data
+        buf = self.control.buf
+        sequence = _control.unpack_from(buf, 0)[1]
+        # readers retry while the sequence is odd or changes under them
+        _control.pack_into(buf, 0, _magic, sequence + 1, previous_version, previous_name.encode())
+        _control.pack_into(buf, 0, _magic, sequence + 1, version, segment_name.encode())
+        _control.pack_into(buf, 0, _magic, sequence + 2, version, segment_name.encode())
+        previous, self.segment = self.segment, segment
+        if previous_name:
+            try:
+                if previous is None:
+                    previous = shared_memory.SharedMemory(name=previous_name)
+                previous.close()
+                _unlink(previous)
+            except FileNotFoundError:
+                pass
+        return version
+
+    def close(self, unlink=True):
+        """
+        :param unlink: remove the control block and published segment too
+        """
+        if self.segment is not None:
+            self.segment.close()
+            if unlink:
+                _unlink(self.segment)
+            self.segment = None
+        self.control.close()
+        if unlink:
+            _unlink(self.control)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _Snapshot:
+    """
+    One attached version, its segment and header.  Once replaced it is
+    closed as soon as no iteration still reads it.
+    """
+
+    def __init__(self, segment, header):
+        self.segment = segment
+        self.header = header
+        self.version = header['version']
+        self.pins = 0
+        self.retired = False
+
+    def pin(self):
+        self.pins += 1
+        return self
+
+    def unpin(self):
+        self.pins -= 1
+        if self.retired and not self.pins:
+            self.close()
+
+    def retire(self):
+        self.retired = True
+        if not self.pins:
+            self.close()
+
+    def close(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+
+
+class _Table(Mapping):
+    """
+    Sorted table of a segment read in place, mapping keys to decoded values.
+    """
+
+    def __init__(self, reader, name, decode):
+        self.reader = reader
+        self.name = name
+        self.decode = decode
+
+    def _layout(self, refresh=True):
+        snapshot = self.reader._snapshot(refresh)
+        header = snapshot.header
+        start, count = header['tables'].get(self.name, (0, 0))
+        return snapshot, header['base'], header['base'] + start, count
+
+    def _find(self, key):
+        snapshot, base, start, count = self._layout(refresh=False)
+        buf = snapshot.segment.buf
+        key = key.encode()
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_off, key_len, value_off, value_len = _entry.unpack_from(
+                buf, start + mid * _entry.size)
+            key_off += base
+            value_off += base
+            found = bytes(buf[key_off:key_off + key_len])
+            if found == key:
+                return bytes(buf[value_off:value_off + value_len])
+            if found < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def __getitem__(self, key):
+        if not isinstance(key, str):
+            raise KeyError(key)
+        value = self.reader._cached((self.name, key), lambda: self._find(key), self.decode)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        # the version iterated is kept open until the iteration ends
+        snapshot, base, start, count = self._layout()
+        snapshot.pin()
+        try:
+            buf = snapshot.segment.buf
+            for n in range(count):
+                key_off, key_len, _, _ = _entry.unpack_from(buf, start + n * _entry.size)
+                yield bytes(buf[base + key_off:base + key_off + key_len]).decode()
+        finally:
+            buf = None
+            snapshot.unpin()
+
+    def __len__(self):
+        return self._layout()[3]
+
+
+class _ByNameView(Mapping):
+    def __init__(self, reader, kind):
+        self.reader = reader
+        self.kind = kind
+        self.ids = _Table(reader, f'{kind}.name', bytes.decode)
+
+    def __getitem__(self, name):
+        return self.reader.get_meta(self.kind, self.ids[name])
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class _KindView:
+    """
+    Stands in for a ByNameId of the shared context.
+    """
+
+    def __init__(self, reader, kind):
+        self.by_id = reader.by_id(kind)
+        self.by_name = reader.by_name(kind)
+
+
+class SharedMetaContext:
+    def __init__(self, name, cache_size=1024, retries=100):
+        """
+        :param name: name of the control block a SharedMetaPublisher made
+        :param cache_size: most decoded metas kept
+        """
+        self.name = name
+        self.retries = retries
+        self.control = _attach(name)
+        self.cache = LRUCache(maxsize=cache_size)
+        self.version = None
+        self.snapshot = None
+        self.refresh()
+        for kind in meta_kinds:
+            setattr(self, kind, _KindView(self, kind))
+
+    def _read_control(self):
+        buf = self.control.buf
+        for _ in range(self.retries):
+            magic, before, version, segment = _control.unpack_from(buf, 0)
+            if magic != _magic:
+                raise Exception(f'{self.name} is not a shared meta context')
+            if before % 2 == 0:
+                after = _control.unpack_from(buf, 0)[1]
+                if after == before:
+                    return version, segment.rstrip(b'\0').decode()
+            time.sleep(0)
+        raise Exception(f'could not read control block of {self.name}')
+
+    def refresh(self):
+        """
+        Moves to the current version if another was published.
+        :return: True if the version changed
+        """
+        for _ in range(self.retries):
+            version, segment_name = self._read_control()
+            if version == self.version:
+                return False
+            if not segment_name:
+                raise Exception(f'nothing published as {self.name}')
+            try:
+                segment = _attach(segment_name)
+            except FileNotFoundError:
+                # replaced while attaching, read the control block again
+                continue
+            buf = segment.buf
+            size = _header_size.unpack_from(buf, 0)[0]
+            header = json.loads(bytes(buf[_header_size.size:_header_size.size + size]))
+            header['base'] = _header_size.size + size
+            del buf
+            old, self.snapshot = self.snapshot, _Snapshot(segment, header)
+            self.version = header['version']
+            self.cache.clear()
+            if old is not None:
+                old.retire()
+            return True
+        raise Exception(f'could not attach the current version of {self.name}')
+
+    def _snapshot(self, refresh=True):
+        if refresh:
+            self.refresh()
+        return self.snapshot
+
+    def _cached(self, key, read, decode):
+        self.refresh()
+
+        def compute():
+            data = read()
+            return None if data is None else decode(data)
+        return self.cache.get_or_compute((self.version,) + key, compute)
+
+    def close(self):
+        self.cache.clear()
+        if self.snapshot is not None:
+            self.snapshot.retire()
+            self.snapshot = None
+        self.control.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def by_id(self, kind):
+        return _Table(self, f'{kind}.id', lambda data: as_meta(kind, json.loads(data)))
+
+    def by_name(self, kind):
+        return _ByNameView(self, kind)
+
+    def get_meta(self, kind, an_id):
+        return self.by_id(kind).get(an_id)
+
+    def get_meta_named(self, kind, name):
+        res = self.by_name(kind).get(name)
+        if kind == 'roles' and not res:
+            if name.endswith('*'):
+                return self.by_name('roles').get(name[:-1])
+            role_id = _Table(self, 'roles.reverse_name', bytes.decode).get(name)
+            if role_id is not None:
+                return self.get_meta('roles', role_id)
+        return res
+
+    def metas_of_kind(self, kind):
+        return list(self.by_id(kind).values())
+
+    def _children(self, kind, an_id):
+        return _Table(self, f'{kind}.children', json.loads).get(an_id, ())
+
+    def _descendants(self, kind, an_id):
+        res = set()
+        pending = [an_id]
+        while pending:
+            current = pending.pop()
+            if current not in res:
+                res.add(current)
+                pending.extend(self._children(kind, current))
+        return res
+
+    def subclasses(self, clsid):
+        return self._descendants('classes', clsid)
+
+    def subgroups(self, gid):
+        return self._descendants('groups', gid)
+
+    def to_context(self):
+        """
+        :return: MetaContext of every meta of the current version
+        """
+        context = MetaContext()
+        for kind in meta_kinds:
+            context.load_objects(self.metas_of_kind(kind))
+        context.complete()
+        return context
@@ -0,0 +1,372 @@
+"""
+Statistics about the data of a MetaContext for dashboards and query
+planning: instance counts per class, association counts per tag, group
+and role, HyperLogLog sketches of the distinct object and subject ids in
+associations and approximate histograms of numeric attribute values,
+epochs included.  A StatsCatalog attached to a MemoryDBI is updated
+incrementally from its writes and serializes with to_dict.
+
+Sketches only grow, so after deletes their distinct counts are upper
+bounds.
+"""
+import base64
+import hashlib
+import math
+from collections import Counter
+from numbers import Number
+from uopmeta.oid import oid_class
+from uopmeta.explain import Estimator
+
+
+def _hash64(item):
+    digest = hashlib.blake2b(str(item).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class HyperLogLog:
+    """
+    Distinct count sketch with 2**precision registers, a standard error of
+    about 1.04 / sqrt(2**precision).
+    """
+
+    def __init__(self, precision=10, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+
+    def add(self, item):
+        x = _hash64(item)
+        bits = 64 - self.precision
+        index = x >> bits
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if zeros and estimate <= 2.5 * m:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise Exception('cannot merge sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def to_dict(self):
+        return dict(precision=self.precision,
+                    registers=base64.b64encode(bytes(self.registers)).decode())
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['precision'], base64.b64decode(d['registers']))
+
+
+class Histogram:
+    """
+    Equi-width histogram of numeric values kept in at most max_buckets
+    buckets.  When there would be more the bucket width doubles and
+    neighboring buckets merge, so any range of values is covered.
+    """
+
+    def __init__(self, width=1.0, max_buckets=64, precision=10):
+        self.width = width
+        self.max_buckets = max_buckets
+        self.buckets = Counter()
+        self.count = 0
+        self.distinct = HyperLogLog(precision)
+
+    def _bucket(self, value):
+        return math.floor(value / self.width)
+
+    def add(self, value):
+        self.buckets[self._bucket(value)] += 1
+        self.count += 1
+        self.distinct.add(value)
+        while len(self.buckets) > self.max_buckets:
+            self.width *= 2
+            merged = Counter()
+            for bucket, n in self.buckets.items():
+                merged[bucket // 2] += n
+            self.buckets = merged
+
+    def remove(self, value):
+        bucket = self._bucket(value)
+        n = self.buckets.get(bucket, 0)
+        if not n:
+            return
+        if n == 1:
+            del self.buckets[bucket]
+        else:
+            self.buckets[bucket] = n - 1
+        self.count -= 1
+
+    def count_below(self, value):
+        """
+        :return: estimated number of values less than value
+        """
+        position = value / self.width
+        bucket = math.floor(position)
+        res = sum(n for b, n in self.buckets.items() if b < bucket)
+        return res + self.buckets.get(bucket, 0) * (position - bucket)
+
+    def fraction(self, operate, value):
+        """
+        :return: estimated fraction of values satisfying the comparison
+        """
+        if not self.count:
+            return 0.0
+        if operate in ('==', '!='):
+            equal = 1 / max(self.distinct.count(), 1) \
+                if self.buckets.get(self._bucket(value)) else 0.0
+            return equal if operate == '==' else 1 - equal
+        below = min(self.count_below(value) / self.count, 1.0)
+        return below if operate in ('<', '<=') else 1 - below
+
+    def to_dict(self):
+        return dict(width=self.width, max_buckets=self.max_buckets,
+                    buckets=list(self.buckets.items()), count=self.count,
+                    distinct=self.distinct.to_dict())
+
+    @classmethod
+    def from_dict(cls, d):
+        res = cls(d['width'], d['max_buckets'])
+        res.buckets = Counter(dict((b, n) for b, n in d['buckets']))
+        res.count = d['count']
+        res.distinct = HyperLogLog.from_dict(d['distinct'])
+        return res
+
+
+assoc_kinds = ('tagged', 'grouped', 'related')
+
+
+class StatsCatalog:
+    """
+    Statistics of the objects and associations of a MetaContext.  Serves
+    approximate counts and, as an explain Estimator, result size estimates
+    of query components.
+    """
+
+    def __init__(self, meta_context=None, precision=10, max_buckets=64):
+        self.meta_context = meta_context
+        self.precision = precision
+        self.max_buckets = max_buckets
+        self.object_count = 0
+        self.class_counts = Counter()
+        self.assoc_counts = {kind: Counter() for kind in assoc_kinds}
+        self.distinct_objects = {kind: HyperLogLog(precision) for kind in assoc_kinds}
+        self.distinct_subjects = HyperLogLog(precision)
+        self.role_ends = {}  # role id -> (subjects sketch, objects sketch)
+        self.histograms = {}
+
+    @classmethod
+    def from_context(cls, context, **kwargs):
+        """
+        :param context: WorkingContext whose instances and associations are counted
+        """
+        res = cls(context, **kwargs)
+        for obj in context.instances:
+            res.add_object(obj)
+        for assocs in (context.tagged, context.grouped, context.related):
+            for assoc in assocs:
+                res.add_association(assoc)
+        return res
+
+    def attach(self, dbi):
+        """
+        Counts what dbi holds and keeps counting its writes.  The catalog
+        becomes the stats of dbi and of its meta context.
+        """
+        self.meta_context = dbi.meta_context
+        for obj in dbi.objects.values():
+            self.add_object(obj)
+        for kind, assoc_sets in (('tagged', dbi.tagsets), ('grouped', dbi.groupsets)):
+            for assoc_id, obj_ids in assoc_sets.items():
+                for obj_id in obj_ids:
+                    self._count(kind, assoc_id, obj_id, 1)
+        for subject_id, role_id, object_id in dbi.relations.edges():
+            self._count_related(role_id, subject_id, object_id, 1)
+        dbi.add_listener(self.on_change)
+        dbi.stats = self
+        self.meta_context.stats = self
+        return self
+
+    def detach(self, dbi):
+        dbi.remove_listener(self.on_change)
+        if getattr(dbi, 'stats', None) is self:
+            dbi.stats = None
+
+    def on_change(self, change):
+        delta = 1 if change.op == 'insert' else -1
+        if change.kind == 'objects':
+            (self.add_object if delta > 0 else self.remove_object)(change.record)
+        elif change.kind in assoc_kinds:
+            (self.add_association if delta > 0 else self.remove_association)(change.record)
+
+    def _histogram(self, attr_name):
+        res = self.histograms.get(attr_name)
+        if res is None:
+            res = self.histograms[attr_name] = Histogram(
+                max_buckets=self.max_buckets, precision=self.precision)
+        return res
+
+    def _values(self, obj):
+        for attr_name, value in obj.items():
+            if isinstance(value, Number) and not isinstance(value, bool):
+                yield attr_name, value
+
+    def add_object(self, obj):
+        self.object_count += 1
+        self.class_counts[oid_class(obj['id'])] += 1
+        for attr_name, value in self._values(obj):
+            self._histogram(attr_name).add(value)
+
+    def remove_object(self, obj):
+        self.object_count -= 1
+        self.class_counts[oid_class(obj['id'])] -= 1
+        for attr_name, value in self._values(obj):
+            histogram = self.histograms.get(attr_name)
+            if histogram:
+                histogram.remove(value)
+
+    def _count(self, kind, assoc_id, object_id, delta):
+        self.assoc_counts[kind][assoc_id] += delta
+        if delta > 0:
+            self.distinct_objects[kind].add(object_id)
+
+    def _count_related(self, role_id, subject_id, object_id, delta):
+        self._count('related', role_id, object_id, delta)
+        if delta > 0:
+            self.distinct_subjects.add(subject_id)
+            ends = self.role_ends.get(role_id)
+            if ends is None:
+                ends = self.role_ends[role_id] = (
+                    HyperLogLog(self.precision), HyperLogLog(self.precision))
+            ends[0].add(subject_id)
+            ends[1].add(object_id)
+
+    def _change_association(self, assoc, delta):
+        if assoc.kind == 'related':
+            self._count_related(assoc.assoc_id, assoc.subject_id, assoc.object_id, delta)
+        else:
+            self._count(assoc.kind, assoc.assoc_id, assoc.object_id, delta)
+
+    def add_association(self, assoc):
+        self._change_association(assoc, 1)
+
+    def remove_association(self, assoc):
+        self._change_association(assoc, -1)
+
+    def total(self):
+        return self.object_count
+
+    def class_count(self, cls_id, include_subclasses=True):
+        ids = {cls_id}
+        if include_subclasses and self.meta_context is not None:
+            ids = self.meta_context.subclasses(cls_id)
+        return sum(self.class_counts.get(i, 0) for i in ids)
+
+    def count(self, kind='objects', name=None, include_subclasses=True):
+        """
+        Approximate counts for dashboards.
+        :param kind: 'objects', 'classes' or 'tags', 'groups' or 'roles'
+        :param name: name of the class, tag, group or role, for tags,
+        groups and roles None for the number of distinct objects having any
+        :return: count
+        """
+        if kind == 'objects':
+            return self.object_count
+        assoc_kind = dict(tags='tagged', groups='grouped', roles='related').get(kind)
+        if name is None:
+            if assoc_kind is None:
+                raise Exception(f'count of {kind} needs a name')
+            return self.distinct_objects[assoc_kind].count()
+        meta = self.meta_context.get_meta_named(kind, name)
+        if meta is None:
+            return 0
+        if kind == 'classes':
+            return self.class_count(meta.id, include_subclasses)
+        return self.assoc_counts[assoc_kind].get(meta.id, 0)
+
+    def _fraction(self, count):
+        return min(count / self.object_count, 1.0) if self.object_count else 0.0
+
+    def _associated_size(self, component):
+        counts = self.assoc_counts[component.assoc_kind]
+        fractions = [self._fraction(sum(counts.get(i, 0) for i in ids))
+                     for ids in component.named_ids(self.meta_context)]
+        if component.application == 'all':
+            res = math.prod(fractions)
+        else:
+            res = 1 - math.prod(1 - f for f in fractions)
+            if component.application == 'none':
+                res = 1 - res
+        return res * self.object_count
+
+    def _fan_out(self, role_id, reverse):
+        if role_id is None:
+            starts = self.distinct_objects['related'] if reverse else self.distinct_subjects
+            edges = sum(self.assoc_counts['related'].values())
+        else:
+            ends = self.role_ends.get(role_id)
+            if ends is None:
+                return 0.0
+            starts = ends[1] if reverse else ends[0]
+            edges = self.assoc_counts['related'].get(role_id, 0)
+        return edges / max(starts.count(), 1)
+
+    def _related_size(self, component):
+        hops = component.hops(self.meta_context)
+        fan_out = math.prod(self._fan_out(r, reverse) for r, reverse in hops)
+        depth = component.max_depth or 3
+        res = min(sum(fan_out ** d for d in range(1, depth + 1)), self.object_count)
+        return self.object_count - res if component.negated else res
+
+    def result_size(self, component):
+        """
+        :return: estimated size of the unfiltered result of a leaf component
+        """
+        kind = component.kind
+        if kind == 'class':
+            res = sum(self.class_counts.get(i, 0)
+                      for i in component.class_ids(self.meta_context))
+            return res if component.positive else self.object_count - res
+        if kind in ('tags', 'groups'):
+            return self._associated_size(component)
+        if kind == 'related':
+            return self._related_size(component)
+        if kind == 'attribute':
+            histogram = self.histograms.get(component.attr_name)
+            if histogram is not None and isinstance(component.value, Number):
+                return histogram.count * histogram.fraction(component.operate, component.value)
+        return self.object_count * Estimator.selectivity.get(kind, 1.0)
+
+    def to_dict(self):
+        return dict(
+            precision=self.precision,
+            max_buckets=self.max_buckets,
+            object_count=self.object_count,
+            class_counts=dict(self.class_counts),
+            assoc_counts={k: dict(v) for k, v in self.assoc_counts.items()},
+            distinct_objects={k: v.to_dict() for k, v in self.distinct_objects.items()},
+            distinct_subjects=self.distinct_subjects.to_dict(),
+            role_ends={k: [s.to_dict() for s in v] for k, v in self.role_ends.items()},
+            histograms={k: v.to_dict() for k, v in self.histograms.items()})
+
+    @classmethod
+    def from_dict(cls, d, meta_context=None):
+        res = cls(meta_context, d['precision'], d['max_buckets'])
+        res.object_count = d['object_count']
+        res.class_counts = Counter(d['class_counts'])
+        res.assoc_counts = {k: Counter(v) for k, v in d['assoc_counts'].items()}
+        res.distinct_objects = {k: HyperLogLog.from_dict(v)
+                                for k, v in d['distinct_objects'].items()}
+        res.distinct_subjects = HyperLogLog.from_dict(d['distinct_subjects'])
+        res.role_ends = {k: tuple(HyperLogLog.from_dict(s) for s in v)
+                         for k, v in d['role_ends'].items()}
+        res.histograms = {k: Histogram.from_dict(v) for k, v in d['histograms'].items()}
+        return res
@@ -0,0 +1,252 @@
+"""
+Streaming query evaluation.  Components yield object ids in ascending id
+order so And is a merge intersection of sorted streams, Or a merge union
+and class and attribute components filter the stream they are given.
+Beyond the sorted id lists the dbi already keeps, only the matches of
+indexed attribute filters and of related components are sorted into
+lists, once per evaluation, so taking the first page of a large result
+stops as soon as it is full.  Branches of an or, and a negated
+composite, each need their own pass over the candidates they are given,
+so those candidates are read chunk_size at a time and every branch runs
+over each chunk, which bounds what is held to one chunk.
+Given an after id, sorted sources start just past it so evaluation can
+resume where a previous page left off.
+"""
+from bisect import bisect_right
+from heapq import merge
+from itertools import islice
+from uopmeta.oid import oid_class
+
+_end = object()
+chunk_size = 1024
+
+
+def union_sorted(*streams):
+    last = _end
+    for obj_id in merge(*streams):
+        if obj_id != last:
+            yield obj_id
+            last = obj_id
+
+
+def intersect_sorted(*streams):
+    if not streams:
+        return
+    iterators = [iter(s) for s in streams]
+    try:
+        current = [next(it) for it in iterators]
+        while True:
+            high = max(current)
+            for n, it in enumerate(iterators):
+                while current[n] < high:
+                    current[n] = next(it)
+            if all(c == high for c in current):
+                yield high
+                current = [next(it) for it in iterators]
+    except StopIteration:
+        return
+
+
+def difference_sorted(stream, removed):
+    removed = iter(removed)
+    current = next(removed, _end)
+    for obj_id in stream:
+        while current is not _end and current < obj_id:
+            current = next(removed, _end)
+        if current is _end or current != obj_id:
+            yield obj_id
+
+
+def ids_after(ids, after=None):
+    """
+    :param ids: ascending list of ids
+    :return: iterator over the ids greater than after
+    """
+    if after is None:
+        return iter(ids)
+    return islice(ids, bisect_right(ids, after), None)
+
+
+def sorted_object_ids(dbi, after=None):
+    get = getattr(dbi, 'sorted_object_ids', None)
+    return ids_after(get() if get else sorted(dbi.all_object_ids()), after)
+
+
+def sorted_class_ids(dbi, cls_name, after=None):
+    get = getattr(dbi, 'sorted_class_instance_ids', None)
+    return ids_after(get(cls_name) if get else sorted(dbi.class_instance_ids(cls_name)),
+                     after)
+
+
+def sorted_assoc_ids(dbi, assoc_kind, assoc_id, after=None):
+    get = getattr(dbi, 'sorted_assoc_ids', None)
+    if get:
+        return ids_after(get(assoc_kind, assoc_id), after)
+    get_set = dbi.get_tagset if assoc_kind == 'tagged' else dbi.get_groupset
+    return ids_after(sorted(get_set(assoc_id)), after)
+
+
+def _or_universe(dbi, source, after=None):
+    return sorted_object_ids(dbi, after) if source is None else source
+
+
+def _within(source, found):
+    return found if source is None else intersect_sorted(source, found)
+
+
+def _by_chunks(source, after, evaluate):
+    """
+    Ids of evaluate(chunk, after) for each chunk of chunk_size ids of
+    source in turn, where after is the last id before the chunk.
+    """
+    source = iter(source)
+    while True:
+        chunk = list(islice(source, chunk_size))
+        if not chunk:
+            return
+        yield from evaluate(chunk, after)
+        after = chunk[-1]
+
+
+def _class_stream(component, dbi, source, after, known):
+    context = dbi.meta_context
+    cls_ids = component.class_ids(context)
+    if source is None and component.positive:
+        by_id = context.classes.by_id
+        return union_sorted(*[sorted_class_ids(dbi, by_id[i].name, after)
+                              for i in cls_ids])
+    positive = component.positive
+    return (i for i in _or_universe(dbi, source, after)
+            if (oid_class(i) in cls_ids) == positive)
+
+
+def _assoc_stream(component, dbi, source, after, known):
+    name_streams = [
+        union_sorted(*[sorted_assoc_ids(dbi, component.assoc_kind, i, after)
+                       for i in ids])
+        for ids in component.named_ids(dbi.meta_context)]
+    if component.application == 'all':
+        if not name_streams:
+            return _or_universe(dbi, source, after)
+        return _within(source, intersect_sorted(*name_streams))
+    found = union_sorted(*name_streams)
+    if component.application == 'none':
+        return difference_sorted(_or_universe(dbi, source, after), found)
+    return _within(source, found)
+
+
+def _sorted_matches(component, known, find):
+    """
+    Sorted ids found by find, found once per evaluation of component.
+    """
+    key = id(component)
+    found = known.get(key)
+    if found is None:
+        found = known[key] = sorted(find())
+    return found
+
+
+def _attribute_stream(component, dbi, source, after, known):
+    if component.operate not in ('!=', 'not_like'):
+        get_index = getattr(dbi, 'value_index', None)
+        index = get_index(component.attr_name) if get_index else None
+        if index is not None:
+            found = _sorted_matches(component, known, lambda: component.satisfies(dbi))
+            return _within(source, ids_after(found, after))
+    test = component.obj_eval()
+    get_object = dbi.get_object
+
+    def passes(obj_id):
+        obj = get_object(obj_id)
+        if not obj:
+            return False
+        try:
+            return test(obj)
+        except KeyError:
+            return False
+
+    return (i for i in _or_universe(dbi, source, after) if passes(i))
+
+
+def _related_stream(component, dbi, source, after, known):
+    found = _sorted_matches(component, known, lambda: component.related_ids(dbi))
+    if component.negated:
+        return difference_sorted(_or_universe(dbi, source, after), found)
+    return _within(source, ids_after(found, after))
+
+
+def is_filter(component):
+    kind = component.kind
+    if kind == 'attribute':
+        return True
+    if kind == 'class':
+        return not component.positive
+    if kind in ('tags', 'groups'):
+        return component.application == 'none'
+    return getattr(component, 'negated', False) is True
+
+
+def _and_stream(component, dbi, source, after, known):
+    components = sorted(component.components, key=is_filter)
+    stream = source
+    for child in components:
+        stream = stream_ids(child, dbi, stream, after, known)
+    return _or_universe(dbi, stream, after)
+
+
+def _or_stream(component, dbi, source, after, known):
+    if not component.components:
+        return iter(())
+
+    def union(chunk, after):
+        return union_sorted(*[stream_ids(child, dbi, None if chunk is None else iter(chunk),
+                                         after, known)
+                              for child in component.components])
+    if source is None:
+        return union(None, after)
+    return _by_chunks(source, after, union)
+
+
+def _composite_stream(handler):
+    def composite(component, dbi, source, after, known):
+        if not component.negated:
+            return handler(component, dbi, source, after, known)
+        if source is None:
+            return difference_sorted(sorted_object_ids(dbi, after),
+                                     handler(component, dbi, None, after, known))
+        return _by_chunks(source, after, lambda chunk, after: difference_sorted(
+            chunk, handler(component, dbi, iter(chunk), after, known)))
+    return composite
+
+
+stream_handlers = {
+    'class': _class_stream,
+    'tags': _assoc_stream,
+    'groups': _assoc_stream,
+    'attribute': _attribute_stream,
+    'related': _related_stream,
+    'and': _composite_stream(_and_stream),
+    'or': _composite_stream(_or_stream),
+}
+
+
+def stream_ids(component, dbi, source=None, after=None, known=None):
+    """
+    Ids satisfying component in ascending order.
+    :param source: ascending iterator of candidate ids or None for all
+    :param after: only ids greater than this one when there is no source
+    :param known: sorted matches already found during this evaluation
+    """
+    handler = stream_handlers.get(component.kind)
+    if handler is None:
+        raise Exception(f'no streaming handler for {component.kind} query component')
+    return handler(component, dbi, source, after, {} if known is None else known)
+
+
+def stream_page(component, dbi, limit=None, offset=0, after=None):
+    """
+    :return: iterator over the ids greater than after from offset up to
+    limit of them, evaluating no further than needed
+    """
+    stop = None if limit is None else offset + limit
+    return islice(stream_ids(component, dbi, after=after), offset, stop)
@@ -0,0 +1,255 @@
+"""
+Per tenant MetaContexts.  A TenantContextCache builds or loads a
+tenant's context when it is first asked for and keeps the recently used
+ones within a memory budget, evicting the least recently used tenants
+beyond it.
+
+Tenants' schemas commonly use or require the same schemas, uop_core
+above all.  The metas of such a schema are built once and shared by the
+contexts of every tenant whose schema uses the same versions of the same
+schemas, so each tenant's context costs little more than its own
+classes, attributes, tags, groups, roles and queries.  Shared metas are
+completed once when they are built and only the tenant's own classes
+are completed after, so tenants never modify them.  Sizes are estimated
+with uopmeta.memory; a tenant is charged for what only it holds and
+shared metas are counted once.
+
+Loading runs outside the cache's lock.  Lookups of other tenants go on
+while a tenant loads and concurrent lookups of a loading tenant wait
+for that one load.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from uopmeta.attr_info import meta_kinds
+from uopmeta.memory import deep_sizeof
+from uopmeta.schemas.meta import MetaContext, MetaClass, canonical_json, schema_metas
+
+
+def schema_hash(schema):
+    return hashlib.sha1(canonical_json(schema.dict()).encode()).hexdigest()
+
+
+class TenantContextCache:
+    def __init__(self, loader, max_bytes=512 * 2 ** 20, max_tenants=None, share_schemas=True):
+        """
+        :param loader: function of a tenant, as passed to get, returning its
+        Schema, MetaContext or MetaContext data
+        :param max_bytes: memory budget of the cached contexts
+        :param max_tenants: most tenants cached, None for no limit
+        :param share_schemas: share the metas of the schemas tenant schemas use
+        """
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.max_tenants = max_tenants
+        self.share_schemas = share_schemas
+        self.entries = OrderedDict()  # tenant id -> (context, bytes, shared keys)
+        self.shared = {}  # key -> [metas, bytes, number of tenants holding or loading them]
+        self.loading = {}  # tenant id -> Future of its context
+        self.building = {}  # shared key -> Future of (metas, bytes)
+        self.tenant_bytes = 0
+        self.shared_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, tenant):
+        return getattr(tenant, 'id', tenant) in self.entries
+
+    @property
+    def total_bytes(self):
+        return self.tenant_bytes + self.shared_bytes
+
+    def _load_once(self, pending, key, known, load, publish, discard):
+        """
+        Result for key from known, called with the lock held, or else from
+        load, run without the lock once however many threads ask at the
+        same time.  The loading thread passes the result to publish, with
+        the lock held, unless invalidated while loading, when it passes it
+        to discard.
+        """
+        with self._lock:
+            res = known()
+            if res is not None:
+                return res
+            future = pending.get(key)
+            loading = future is None
+            if loading:
+                future = pending[key] = Future()
+        if not loading:
+            return future.result()
+        try:
+            res = load()
+        except BaseException as e:
+            with self._lock:
+                if pending.get(key) is future:
+                    del pending[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            if pending.get(key) is future:
+                del pending[key]
+                publish(res)
+            else:
+                discard(res)
+        future.set_result(res)
+        return res
+
+    def get(self, tenant):
+        """
+        :param tenant: Tenant or tenant id
+        :return: the tenant's MetaContext
+        """
+        key = getattr(tenant, 'id', tenant)
+        loaded = {}
+
+        def known():
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+        def load():
+            started = time.perf_counter()
+            context, shared_keys = self._build(self.loader(tenant))
+            loaded.update(shared_keys=shared_keys, size=deep_sizeof(
+                context, exclude=[self.shared[k][0] for k in shared_keys]))
+            loaded['seconds'] = time.perf_counter() - started
+            return context
+
+        def publish(context):
+            self.entries[key] = (context, loaded['size'], loaded['shared_keys'])
+            self.tenant_bytes += loaded['size']
+            self.load_seconds += loaded['seconds']
+            self._shrink()
+
+        def discard(context):
+            self._release(loaded['shared_keys'])
+
+        return self._load_once(self.loading, key, known, load, publish, discard)
+
+    def _shared_metas(self, key, subs):
+        """
+        Acquires the shared metas of the schemas subs, building and
+        completing them if no tenant holds them.  Release them with _release.
+        :return: list of the metas
+        """
+        def known():
+            shared = self.shared.get(key)
+            return None if shared is None else (shared[0], shared[1])
+
+        def load():
+            context = MetaContext()
+            for sub in subs:
+                context.load_objects(schema_metas(sub))
+            context.complete()
+            metas = [m for kind in meta_kinds for m in context.metas_of_kind(kind)]
+            return metas, deep_sizeof(metas)
+
+        def publish(built):
+            self._add_shared(key, *built)
+
+        metas, size = self._load_once(self.building, key, known, load, publish, publish)
+        with self._lock:
+            shared = self.shared.get(key)
+            if shared is None:
+                # released by every other tenant since it was built
+                shared = self._add_shared(key, metas, size)
+            shared[2] += 1
+            return shared[0]
+
+    def _add_shared(self, key, metas, size):
+        shared = self.shared.get(key)
+        if shared is None:
+            shared = self.shared[key] = [metas, size, 0]
+            self.shared_bytes += size
+        return shared
+
+    def _release(self, shared_keys):
+        for shared_key in shared_keys:
+            shared = self.shared[shared_key]
+            shared[2] -= 1
+            if not shared[2]:
+                del self.shared[shared_key]
+                self.shared_bytes -= shared[1]
+
+    def _build(self, source):
+        if isinstance(source, MetaContext):
+            return source, ()
+        if isinstance(source, dict):
+            return MetaContext.from_data(source), ()
+        subs = {}
+        for sub in list(source.uses_schemas) + list(source.requires_schemas):
+            subs.setdefault(schema_hash(sub), sub)
+        if not (self.share_schemas and subs):
+            return MetaContext.from_schema(source), ()
+        # completing a context sets the attributes of its classes from
+        # their superclasses, so metas are only shared between tenants
+        # using the same set of schemas
+        key = tuple(sorted(subs))
+        shared = self._shared_metas(key, [subs[h] for h in key])
+        try:
+            context = MetaContext()
+            context.load_objects(shared)
+            own = list(schema_metas(source))
+            context.load_objects(own)
+            context.complete_classes([m for m in own if isinstance(m, MetaClass)])
+            context.complete_groups()
+        except BaseException:
+            with self._lock:
+                self._release([key])
+            raise
+        return context, [key]
+
+    def _evict(self, key):
+        context, size, shared_keys = self.entries.pop(key)
+        self.tenant_bytes -= size
+        self._release(shared_keys)
+
+    def _over_budget(self):
+        if self.max_tenants is not None and len(self.entries) > self.max_tenants:
+            return True
+        return self.total_bytes > self.max_bytes
+
+    def _shrink(self):
+        # the tenant just added stays even when it alone is over budget
+        while len(self.entries) > 1 and self._over_budget():
+            self._evict(next(iter(self.entries)))
+            self.evictions += 1
+
+    def invalidate(self, tenant):
+        """
+        Drops a tenant's context, as after its schema changed.  A load of
+        it under way is not cached.
+        """
+        key = getattr(tenant, 'id', tenant)
+        with self._lock:
+            self.loading.pop(key, None)
+            if key in self.entries:
+                self._evict(key)
+
+    def clear(self):
+        with self._lock:
+            self.loading.clear()
+            for key in list(self.entries):
+                self._evict(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(tenants=len(self.entries), tenant_bytes=self.tenant_bytes,
+                        shared_schemas=len(self.shared), shared_bytes=self.shared_bytes,
+                        loading=len(self.loading),
+                        hits=self.hits, misses=self.misses,
+                        hit_rate=self.hits / lookups if lookups else None,
+                        evictions=self.evictions, load_seconds=self.load_seconds)
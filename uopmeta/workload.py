@@ -0,0 +1,249 @@
+"""
+Recording and replaying workloads.  A WorkloadRecorder attached to a
+MemoryDBI writes every change the dbi reports, meta and object inserts
+and deletes and association inserts and deletes, to a json lines trace
+together with the MetaQuery executions run through it.  replay applies a
+trace to a dbi, in trace order or at a fixed or the recorded rate, running
+queries on a pool of worker threads, and reports latency percentiles and
+throughput.
+"""
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uopmeta.schemas.meta import MetaQuery, as_meta
+
+
+def _as_data(record):
+    return dict(record) if isinstance(record, dict) else record.dict()
+
+
+class WorkloadRecorder:
+    def __init__(self, path):
+        """
+        :param path: trace file written, replaced if it exists
+        """
+        self.path = path
+        self.file = open(path, 'w')
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.count = 0
+        self.dbi = None
+
+    def _write(self, entry):
+        entry['t'] = time.monotonic() - self.started
+        line = json.dumps(entry, default=str) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.count += 1
+
+    def attach(self, dbi):
+        self.dbi = dbi
+        dbi.add_listener(self.on_change)
+        return self
+
+    def on_change(self, change):
+        self._write(dict(type='change', kind=change.kind, op=change.op,
+                         record=_as_data(change.record)))
+
+    def record_query(self, query, obj_ids=None):
+        self._write(dict(type='query', query=query.to_dict(),
+                         obj_ids=sorted(obj_ids) if obj_ids is not None else None))
+
+    def satisfies(self, query, dbi=None, obj_ids=None):
+        """
+        Runs and records a MetaQuery against dbi, by default the attached one.
+        """
+        self.record_query(query, obj_ids)
+        return query.satisfies(dbi or self.dbi, obj_ids)
+
+    def close(self):
+        if self.dbi is not None:
+            self.dbi.remove_listener(self.on_change)
+            self.dbi = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_trace(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def apply_change(dbi, kind, op, record):
+    """
+    Applies a recorded change to dbi.
+    """
+    if kind == 'objects':
+        if op == 'insert':
+            dbi.add_object(record)
+        else:
+            dbi.delete_object(record['id'])
+        return
+    record = dict(record)
+    record.pop('kind', None)
+    model = as_meta(kind, record)
+    if op == 'insert':
+        dbi.meta_insert(model)
+    elif kind in ('tagged', 'grouped', 'related'):
+        dbi.remove_association(model)
+    else:
+        dbi.remove_meta(model)
+
+
+class LatencyHistogram:
+    """
+    Latencies in logarithmic buckets, each about 2% wide, so percentiles
+    are kept to that precision in bounded memory.
+    """
+    base = 1.02
+    unit = 1e-7  # seconds at the lowest bucket
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = max(0, int(math.log(max(seconds, self.unit) / self.unit, self.base)))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.unit * self.base ** (bucket + 1), self.max)
+        return self.max
+
+    def summary(self, seconds):
+        return dict(
+            count=self.count,
+            throughput=self.count / seconds if seconds else None,
+            mean=self.total / self.count if self.count else None,
+            p50=self.percentile(0.5),
+            p99=self.percentile(0.99),
+            p999=self.percentile(0.999),
+            max=self.max)
+
+
+class _ReadWriteLock:
+    """
+    Queries read the dbi concurrently; changes wait for them and run alone.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+
+    def acquire_read(self):
+        with self.condition:
+            self.readers += 1
+
+    def release_read(self):
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        self.condition.acquire()
+        self.condition.wait_for(lambda: not self.readers)
+
+    def release_write(self):
+        self.condition.release()
+
+
+def replay(trace, dbi, rate=None, concurrency=1, speed=1.0, include_changes=True):
+    """
+    Replays a trace against dbi.
+    :param trace: path of a trace file or iterable of trace entries
+    :param rate: None to issue operations as fast as they are taken up,
+    operations per second to issue them at that rate or 'recorded' to
+    issue them at their recorded times divided by speed
+    :param concurrency: worker threads running queries
+    :param include_changes: apply recorded changes, else only run queries
+    :return: report of latencies, in seconds, and throughput for queries,
+    changes and all operations.  With a rate latencies are counted from
+    when an operation was due so they include time spent waiting.
+    """
+    entries = read_trace(trace) if isinstance(trace, str) else trace
+    histograms = dict(query=LatencyHistogram(), change=LatencyHistogram(),
+                      all=LatencyHistogram())
+    lock = _ReadWriteLock()
+    record_lock = threading.Lock()
+    errors = []
+
+    def done(kind, due):
+        latency = time.monotonic() - due
+        with record_lock:
+            histograms[kind].add(latency)
+            histograms['all'].add(latency)
+
+    def run_query(query, obj_ids, due):
+        lock.acquire_read()
+        try:
+            query.satisfies(dbi, set(obj_ids) if obj_ids is not None else None)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            lock.release_read()
+        done('query', due)
+
+    started = time.monotonic()
+    issued = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = threading.BoundedSemaphore(concurrency * 2)
+        for entry in entries:
+            if entry['type'] == 'change' and not include_changes:
+                continue
+            if rate == 'recorded':
+                due = started + entry['t'] / speed
+            elif rate:
+                due = started + issued / rate
+            else:
+                due = None
+            if due is not None:
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            issued += 1
+            if entry['type'] == 'query':
+                query = MetaQuery.from_dict(entry['query'])
+                if due is None:
+                    # closed loop: at most twice concurrency queries queued
+                    pending.acquire()
+                    pool.submit(run_query, query, entry['obj_ids'], time.monotonic()) \
+                        .add_done_callback(lambda _: pending.release())
+                else:
+                    pool.submit(run_query, query, entry['obj_ids'], due)
+            else:
+                start = due if due is not None else time.monotonic()
+                lock.acquire_write()
+                try:
+                    apply_change(dbi, entry['kind'], entry['op'], entry['record'])
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    lock.release_write()
+                done('change', start)
+    seconds = time.monotonic() - started
+    report = {k: h.summary(seconds) for k, h in histograms.items()}
+    report['seconds'] = seconds
+    report['errors'] = len(errors)
+    return report